@@ -0,0 +1,116 @@
+"""
+Compares frame-time jitter with and without a `CpuPlan` on a synthetic capture, inference and encode load.
+
+A live videotestsrc feeds an `InferencePipeline` whose inference sorts strips of the frame on a pool of
+threads, like a multi-threaded model, and whose output encodes with x264. Without a plan every thread
+floats over all cores; with one, capture, inference and encode get their own CPUs and thread counts.
+Every configuration runs in a fresh process.
+
+    python3 benchmarks/cpu_affinity.py --plans none auto "capture=0;inference=1-2;encode=3" --duration 20
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+
+class SyntheticModel:
+    """Sorts horizontal strips of the frame on a thread pool created by the first call, like ncnn's."""
+
+    def __init__(self, threads: int, repeats: int):
+        self.threads = threads
+        self.repeats = repeats
+        self.pool = None
+
+    def __call__(self, frame: np.ndarray):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.threads)
+        strips = np.array_split(frame.reshape(frame.shape[0], -1), self.threads)
+        # numpy releases the GIL while sorting
+        list(self.pool.map(lambda strip: [np.sort(strip, axis=1) for _ in range(self.repeats)], strips))
+        return None
+
+
+def run(plan: Optional[str], width: int, height: int, framerate: int, repeats: int, duration: float) -> dict:
+    from pi_inference import InferencePipeline, VideoOutput, VideoSource
+    from pi_inference.affinity import INFERENCE, CpuPlan
+    from pi_inference.metrics import metrics
+
+    cpu_plan = CpuPlan.parse(plan) if plan else None
+    options = {"width": width, "height": height, "framerate": framerate, "encoder-profile": "low-latency"}
+    if cpu_plan is not None:
+        options["cpu-plan"] = cpu_plan
+    threads = cpu_plan.threads(INFERENCE) if cpu_plan is not None else multiprocessing.cpu_count()
+
+    rendered = []
+    infer_times = []
+
+    def on_stage(stage: str, seconds: float, labels: dict):
+        if stage == "infer":
+            infer_times.append(seconds)
+        elif stage == "render":
+            rendered.append(time.perf_counter())
+
+    metrics.enable()
+    metrics.add_hook(on_stage)
+    video_source = VideoSource("test://smpte", options)
+    video_output = VideoOutput("file:///tmp/cpu_affinity.mkv", options)
+    pipeline = InferencePipeline(
+        video_source, infer=SyntheticModel(threads, repeats), video_output=video_output, cpu_plan=cpu_plan
+    )
+    pipeline.prepare(timeout=10)
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    pipeline.start()
+    time.sleep(duration)
+    pipeline.stop()
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    video_source.on_terminate()
+    video_output.on_terminate()
+
+    # Skip the first second, while the encoder and the pools settle
+    intervals = np.diff([t for t in rendered if t - rendered[0] > 1]) * 1000 if rendered else np.array([])
+    infer_times = np.array(infer_times[framerate:]) * 1000
+    return {
+        "plan": plan or "none",
+        "fps": len(rendered) / duration,
+        "interval_p50": np.percentile(intervals, 50) if len(intervals) else float("nan"),
+        "interval_p99": np.percentile(intervals, 99) if len(intervals) else float("nan"),
+        "interval_std": intervals.std() if len(intervals) else float("nan"),
+        "infer_p50": np.percentile(infer_times, 50) if len(infer_times) else float("nan"),
+        "infer_std": infer_times.std() if len(infer_times) else float("nan"),
+        "involuntary_switches": (after.ru_nivcsw - before.ru_nivcsw) / duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU affinity jitter benchmark")
+    parser.add_argument("--plans", nargs="+", default=["none", "auto"], help="CPU plans, none for no pinning")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--framerate", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=2, help="Sorts per strip, scales the inference cost")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{'plan':<36} {'fps':>6} {'p50 ms':>7} {'p99 ms':>7} {'std ms':>7} "
+        f"{'infer ms':>8} {'inf std':>7} {'csw/s':>7}"
+    )
+    for plan in args.plans:
+        case = (None if plan == "none" else plan, args.width, args.height, args.framerate, args.repeats, args.duration)
+        with context.Pool(1) as pool:
+            r = pool.apply(run, case)
+        print(
+            f"{r['plan']:<36} {r['fps']:>6.1f} {r['interval_p50']:>7.1f} {r['interval_p99']:>7.1f} "
+            f"{r['interval_std']:>7.1f} {r['infer_p50']:>8.1f} {r['infer_std']:>7.1f} {r['involuntary_switches']:>7.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Reports encode fps and source-to-sink latency of every encoder profile on a videotestsrc.
+
+Throughput is measured by encoding as fast as possible. Latency is measured on a live source as the time
+between a buffer leaving videotestsrc and its encoded frame reaching the sink, which includes the
+encoder lookahead and B-frame delay.
+
+    python3 benchmarks/encoder_profiles.py --width 1280 --height 720 --frames 300
+"""
+
+import argparse
+import time
+
+import gi
+import numpy as np
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from pi_inference import functions as f
+from pi_inference.sink.encoder import ENCODER_PROFILES, make_encoder
+
+
+def build(options: dict, width: int, height: int, framerate: int, frames: int, live: bool):
+    pipeline = Gst.Pipeline.new("encoder-benchmark")
+    source = f.make_element("videotestsrc")
+    source.set_property("num-buffers", frames)
+    source.set_property("is-live", live)
+    Gst.util_set_object_arg(source, "pattern", "smpte")
+    capsfilter = f.make_element("capsfilter")
+    capsfilter.set_property(
+        "caps",
+        Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1"),
+    )
+    videoconvert = f.make_element("videoconvert")
+    encoders, codec = make_encoder(options, framerate, codecs=("H264", "JPEG"))
+    sink = f.make_element("fakesink")
+    sink.set_property("sync", False)
+    elements = [source, capsfilter, videoconvert, *encoders, sink]
+    f.add_elements(pipeline, elements)
+    f.link_elements(elements)
+    return pipeline, source, sink, encoders[0].get_factory().get_name()
+
+
+def run(pipeline) -> float:
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    elapsed = time.perf_counter() - start
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        raise RuntimeError(message.parse_error())
+    return elapsed
+
+
+def measure_latency(options: dict, width: int, height: int, framerate: int, frames: int) -> np.ndarray:
+    pipeline, source, sink, _ = build(options, width, height, framerate, frames, live=True)
+    sent = {}
+    latencies = []
+
+    def on_source(pad, info):
+        sent[info.get_buffer().pts] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def on_sink(pad, info):
+        sent_at = sent.pop(info.get_buffer().pts, None)
+        if sent_at is not None:
+            latencies.append(time.perf_counter() - sent_at)
+        return Gst.PadProbeReturn.OK
+
+    source.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, on_source)
+    sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, on_sink)
+    run(pipeline)
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoder profile benchmark")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--framerate", type=int, default=30)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--encoder", type=str, default=None, help="Preferred encoder, e.g. openh264enc")
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'encoder':<12} {'fps':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    profiles = [None, *ENCODER_PROFILES]
+    for profile in profiles:
+        options = {"encoder-profile": profile, "encoder": args.encoder}
+        pipeline, _, _, encoder = build(options, args.width, args.height, args.framerate, args.frames, live=False)
+        fps = args.frames / run(pipeline)
+        latencies = measure_latency(options, args.width, args.height, args.framerate, args.frames)
+        p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (float("nan"), float("nan"))
+        print(f"{profile or 'default':<12} {encoder:<12} {fps:>7.1f} {p50:>8.1f} {p95:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares `functions.from_ncnn` against the previous list-based conversion for a range of object counts.
+
+The net is simulated by returning prebuilt ncnn-like objects, so only the conversion is measured.
+
+    python3 benchmarks/from_ncnn.py --counts 0 10 100 500 1000
+"""
+
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import supervision as sv
+
+from pi_inference import functions as f
+
+CLASS_NAMES = [f"class_{i}" for i in range(80)]
+
+
+class FakeNet:
+    class_names = CLASS_NAMES
+
+    def __init__(self, count: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.objects = [
+            SimpleNamespace(
+                rect=SimpleNamespace(x=float(x), y=float(y), w=float(w), h=float(h)),
+                prob=float(prob),
+                label=int(label),
+            )
+            for x, y, w, h, prob, label in zip(
+                rng.uniform(0, 1200, count),
+                rng.uniform(0, 640, count),
+                rng.uniform(4, 80, count),
+                rng.uniform(4, 80, count),
+                rng.uniform(0.25, 1, count),
+                rng.integers(0, len(CLASS_NAMES), count),
+            )
+        ]
+
+    def __call__(self, frame):
+        return self.objects
+
+
+def from_ncnn_lists(frame: np.ndarray, net) -> sv.Detections:
+    objects = net(frame)
+    xyxy = []
+    confidence = []
+    class_id = []
+    for obj in objects:
+        x, y, w, h = obj.rect.x, obj.rect.y, obj.rect.w, obj.rect.h
+        xyxy.append([x, y, x + w, y + h])
+        confidence.append(obj.prob)
+        class_id.append(int(obj.label))
+    detections = (
+        sv.Detections(xyxy=np.array(xyxy), confidence=np.array(confidence), class_id=np.array(class_id))
+        if len(objects) > 0
+        else sv.Detections.empty()
+    )
+    detections.data["class_name"] = [net.class_names[_id] for _id in class_id]
+    return detections
+
+
+def measure(convert, frame, net, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        convert(frame, net)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="from_ncnn conversion benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[0, 10, 50, 100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    thresholds = {0: 0.5, 2: 0.4}
+    print(f"{'objects':>8} {'lists (us)':>12} {'vectorized (us)':>16} {'speedup':>8} {'+filters (us)':>14}")
+    for count in args.counts:
+        net = FakeNet(count)
+        lists = measure(from_ncnn_lists, frame, net, args.repeat)
+        vectorized = measure(f.from_ncnn, frame, net, args.repeat)
+        filtered = measure(
+            lambda frame, net: f.from_ncnn(frame, net, class_confidence=thresholds, classes=range(10)),
+            frame,
+            net,
+            args.repeat,
+        )
+        print(f"{count:>8} {lists:>12.1f} {vectorized:>16.1f} {lists / vectorized:>7.2f}x {filtered:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
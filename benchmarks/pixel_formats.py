@@ -0,0 +1,78 @@
+"""
+Reports the appsink throughput of every `format` option, with and without multi-threaded videoconvert.
+
+Frames come from a videotestsrc in the format decoders and cameras usually produce, are converted to the
+target format and wrapped as numpy frames like `AppSinkPipeline.on_sample` does. A target format equal to
+the source format shows the pass-through cost.
+
+    python3 benchmarks/pixel_formats.py --width 1920 --height 1080 --frames 300 --source-format I420
+"""
+
+import argparse
+import time
+
+import gi
+import numpy as np
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from pi_inference import functions as f
+
+
+def run(source_format: str, format: str, threads: int, width: int, height: int, frames: int) -> float:
+    pipeline = Gst.Pipeline.new("format-benchmark")
+    source = f.make_element("videotestsrc")
+    source.set_property("num-buffers", frames)
+    Gst.util_set_object_arg(source, "pattern", "smpte")
+    source_caps = f.make_element("capsfilter", name="source_caps")
+    source_caps.set_property(
+        "caps", Gst.Caps.from_string(f"video/x-raw,format={source_format},width={width},height={height}")
+    )
+    converter = f.make_converter({"convert-threads": threads})
+    capsfilter = f.make_element("capsfilter")
+    capsfilter.set_property("caps", Gst.Caps.from_string(f"video/x-raw,format={format}"))
+    appsink = f.make_element("appsink")
+    appsink.set_property("sync", False)
+    elements = [source, source_caps, converter, capsfilter, appsink]
+    f.add_elements(pipeline, elements)
+    f.link_elements(elements)
+    shape, strides, _ = f.frame_layout(format, width, height)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    start = time.perf_counter()
+    count = 0
+    while True:
+        sample = appsink.emit("pull-sample")
+        if sample is None:
+            break
+        buffer = sample.get_buffer()
+        success, map_info = buffer.map(Gst.MapFlags.READ)
+        if success:
+            np.ndarray(shape, dtype=np.uint8, buffer=map_info.data, strides=strides).copy()
+            buffer.unmap(map_info)
+        count += 1
+    elapsed = time.perf_counter() - start
+    pipeline.set_state(Gst.State.NULL)
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pixel format benchmark")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--source-format", type=str, default="I420", help="e.g. I420 for decoders, NV12 for libcamera")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 0], help="videoconvert n-threads, 0 for auto")
+    args = parser.parse_args()
+
+    print(f"{'format':<8} {'threads':>7} {'fps':>8} {'MB/s':>8}")
+    for format in f.PIXEL_FORMATS:
+        _, _, size = f.frame_layout(format, args.width, args.height)
+        for threads in args.threads:
+            fps = run(args.source_format, format, threads, args.width, args.height, args.frames)
+            print(f"{format:<8} {threads or 'auto':>7} {fps:>8.1f} {fps * size / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures cold-start cost in fresh interpreters: the time to import the package, to create a source and
+to receive its first frame, and which heavy modules were loaded on the way.
+
+    python3 benchmarks/startup.py --input test://smpte --runs 5 --max-import-ms 300
+
+Exits with 1 when a median exceeds its limit, so CI can catch startup regressions.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+HEAVY_MODULES = ("gi", "cv2", "supervision", "picamera2", "libcamera", "gi.repository.GstRtspServer")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import pi_inference
+imported = time.perf_counter()
+from pi_inference import VideoSource
+loaded = time.perf_counter()
+result = {{"import_ms": (imported - start) * 1000, "load_ms": (loaded - start) * 1000}}
+if {input!r}:
+    video_source = VideoSource({input!r}, {options!r})
+    created = time.perf_counter()
+    lease = video_source.capture_ex(timeout=10000)
+    first_frame = time.perf_counter()
+    result["create_ms"] = (created - start) * 1000
+    result["first_frame_ms"] = (first_frame - start) * 1000 if lease is not None else None
+    video_source.on_terminate()
+result["modules"] = [name for name in {modules!r} if name in sys.modules]
+print(json.dumps(result))
+"""
+
+
+def run(input: str, options: dict) -> dict:
+    script = SCRIPT.format(input=input, options=options, modules=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--input", type=str, default="test://smpte", help="Source URI, empty to only import")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Fail if importing takes longer")
+    parser.add_argument("--max-first-frame-ms", type=float, default=None, help="Fail if the first frame is later")
+    args = parser.parse_args()
+
+    options = {"width": args.width, "height": args.height}
+    results = [run(args.input, options) for _ in range(args.runs)]
+    print(f"{'stage':<16} {'median ms':>10} {'max ms':>10}")
+    medians = {}
+    for stage in ("import_ms", "load_ms", "create_ms", "first_frame_ms"):
+        values = [result[stage] for result in results if result.get(stage) is not None]
+        if values:
+            medians[stage] = float(np.median(values))
+            print(f"{stage[:-3]:<16} {medians[stage]:>10.1f} {max(values):>10.1f}")
+    print("Loaded by importing VideoSource:", ", ".join(run("", options)["modules"]) or "no heavy modules")
+    print("Loaded by the first frame:", ", ".join(results[-1]["modules"]) or "no heavy modules")
+
+    failed = False
+    for stage, limit in (("import_ms", args.max_import_ms), ("first_frame_ms", args.max_first_frame_ms)):
+        if limit is not None and medians.get(stage, float("inf")) > limit:
+            print(f"{stage} median {medians.get(stage, float('nan')):.1f} exceeds {limit}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Compares tiled inference against single-pass inference on still images: the throughput of each, and the
+recall of each against ground-truth labels, or of the single pass against the tiled result without labels.
+
+Labels are YOLO text files next to the images, one `class cx cy w h` line per object in relative coordinates.
+
+    python3 benchmarks/tiling.py images/*.jpg --grids 1x1 2x2 3x2 --overlap 0.2 --nets 4 --threads 1
+"""
+
+import argparse
+import functools
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from ncnn.model_zoo import get_model
+
+from pi_inference import functions as f
+from pi_inference.tiling import TiledDetector, box_overlap
+
+
+def load_labels(image_path: str, width: int, height: int) -> Optional[np.ndarray]:
+    path = Path(image_path).with_suffix(".txt")
+    if not path.exists():
+        return None
+    rows = np.loadtxt(path, ndmin=2).reshape(-1, 5)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+def recall(found: np.ndarray, expected: np.ndarray, threshold: float = 0.5) -> float:
+    if len(expected) == 0:
+        return float("nan")
+    if len(found) == 0:
+        return 0.0
+    return float((box_overlap(expected, found).max(axis=1) >= threshold).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled inference benchmark")
+    parser.add_argument("images", nargs="+", help="Images, with optional YOLO label files next to them")
+    parser.add_argument("--model", type=str, default="yolov8s")
+    parser.add_argument("--target-size", type=int, default=640)
+    parser.add_argument("--grids", nargs="+", default=["1x1", "2x2", "3x2"], help="COLSxROWS, 1x1 is single-pass")
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--nets", type=int, default=4, help="Nets loaded and run concurrently")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per net")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per image")
+    args = parser.parse_args()
+
+    def load_net():
+        return get_model(args.model, target_size=args.target_size, num_threads=args.threads, use_gpu=False)
+
+    frames = [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path in args.images]
+    labels = [load_labels(path, frame.shape[1], frame.shape[0]) for path, frame in zip(args.images, frames)]
+    single_net = load_net()
+    single: List[np.ndarray] = [f.from_ncnn(frame, single_net).xyxy for frame in frames]
+
+    print(f"{'grid':<6} {'fps':>7} {'objects':>8} {'recall':>7} {'single recall':>14}")
+    for grid in args.grids:
+        cols, rows = (int(value) for value in grid.lower().split("x"))
+        detector = None
+        if (cols, rows) == (1, 1):
+            detect = functools.partial(f.from_ncnn, net=single_net)
+        else:
+            detector = detect = TiledDetector(load_net, rows, cols, args.overlap, num_nets=args.nets)
+        results = [detect(frame) for frame in frames]
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            for frame in frames:
+                detect(frame)
+        fps = args.runs * len(frames) / (time.perf_counter() - start)
+        if detector is not None:
+            detector.close()
+
+        if all(label is not None for label in labels):
+            # Recall of this grid and of the single pass against the labels
+            grid_recall = np.nanmean([recall(r.xyxy, label) for r, label in zip(results, labels)])
+            single_recall = np.nanmean([recall(s, label) for s, label in zip(single, labels)])
+        else:
+            # Without labels, how much of this grid's result the single pass finds
+            grid_recall = float("nan")
+            single_recall = np.nanmean([recall(s, r.xyxy) for s, r in zip(single, results)])
+        objects = sum(len(r) for r in results) / len(results)
+        print(f"{grid:<6} {fps:>7.2f} {objects:>8.1f} {grid_recall:>7.2f} {single_recall:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,14 @@
 import argparse
 import logging
 import sys
-import time
 
 import supervision as sv
 from ncnn.model_zoo import get_model
 
-from pi_inference import VideoOutput, VideoSource
+from pi_inference import InferencePipeline, MetadataOutput, VideoOutput, VideoSource
 from pi_inference import functions as f
+from pi_inference.affinity import INFERENCE, CpuPlan
+from pi_inference.metrics import metrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -18,52 +19,63 @@ def extract_optional_args(args: list):
 
 
 def main(args, options):
-    last_update = time.time()
-    fps_monitor = sv.FPSMonitor()
-
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    # e.g. --cpu-plan auto or --cpu-plan "capture=0;inference=1-2;encode=3"
+    cpu_plan = CpuPlan.from_options(options)
     video_source = VideoSource(args.input, options=options)
-    video_output = VideoOutput(args.output, options=options)
+    # Without an output, only the detections are streamed with --metadata and no frame is encoded
+    video_output = VideoOutput(args.output, options=options) if args.output else None
+    metadata_output = MetadataOutput(args.metadata, options=options) if args.metadata else None
 
     net = get_model(
         "yolov8s",
         target_size=640,
         prob_threshold=0.25,
         nms_threshold=0.45,
-        num_threads=4,
+        num_threads=cpu_plan.threads(INFERENCE) if cpu_plan is not None else 4,
         use_gpu=False,
     )
     box_annotator = sv.BoxAnnotator()
     labels_annotator = sv.LabelAnnotator()
 
-    while True:
-        try:
-            frame = video_source.capture(timeout=300)
-            now = time.time()
-            if frame is not None:
-                fps_monitor.tick()
-                detections = f.from_ncnn(frame, net)
-                labels = [
-                    f"{class_name} {confidence:.2f}"
-                    for class_name, confidence in zip(detections["class_name"], detections.confidence)
-                ]
+    def annotate(frame, detections):
+        labels = [
+            f"{class_name} {confidence:.2f}"
+            for class_name, confidence in zip(detections["class_name"], detections.confidence)
+        ]
+        frame = box_annotator.annotate(scene=frame, detections=detections)
+        frame = labels_annotator.annotate(scene=frame, detections=detections, labels=labels)
+        return f.draw_clock(frame)
 
-                frame = box_annotator.annotate(scene=frame, detections=detections)
-                frame = labels_annotator.annotate(scene=frame, detections=detections, labels=labels)
-                frame = f.draw_clock(frame)
-                video_output.render(frame)
-                if now - last_update > 1:
-                    last_update = now
-                    logger.info("FPS: %.1f, frame shape: %s", fps_monitor.fps, frame.shape)
-        except KeyboardInterrupt:
-            break
+    # Capture, inference, annotation and encoding run in their own threads. With --overlay true the sink
+    # draws the detections with cairooverlay instead, and --overlay-clock true draws the clock
+    pipeline = InferencePipeline(
+        video_source,
+        infer=lambda frame: f.from_ncnn(frame, net),
+        annotate=None if video_output is None or video_output.overlays else annotate,
+        video_output=video_output,
+        metadata_output=metadata_output,
+        cpu_plan=cpu_plan,
+    )
+    # Start the pipelines and run the model once before taking frames, so the first detection isn't slow
+    pipeline.prepare(timeout=10)
+    pipeline.run(log_interval=1)
 
     video_source.on_terminate()
-    video_output.on_terminate()
+    if video_output is not None:
+        video_output.on_terminate()
+    if metadata_output is not None:
+        metadata_output.on_terminate()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Video Streaming Application")
     parser.add_argument("input", type=str, help="Input URI for the video source")
-    parser.add_argument("output", type=str, help="Output URI for the video stream")
+    parser.add_argument("output", type=str, nargs="?", default=None, help="Output URI for the video stream")
+    parser.add_argument(
+        "--metadata", type=str, default=None, help="Output URI for the detections, e.g. unix:///tmp/detections.sock"
+    )
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
     opts, extra_opts = parser.parse_known_args()
     sys.exit(main(opts, extract_optional_args(extra_opts)))
@@ -1,6 +1,43 @@
 __version__ = "0.1.0"
 
-from .sink import VideoOutput
-from .source import VideoSource
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = ["VideoOutput", "VideoSource"]
+if TYPE_CHECKING:
+    from .runner import InferencePipeline
+    from .scheduler import MultiStreamScheduler
+    from .sink import MetadataOutput, VideoOutput
+    from .source import SharedVideoSource, VideoSource
+
+# The public classes are imported on first access, so `import pi_inference` doesn't load GStreamer,
+# OpenCV or supervision until they are needed
+_LAZY = {
+    "InferencePipeline": ".runner",
+    "MetadataOutput": ".sink",
+    "MultiStreamScheduler": ".scheduler",
+    "SharedVideoSource": ".source",
+    "VideoOutput": ".sink",
+    "VideoSource": ".source",
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
+
+
+__all__ = [
+    "InferencePipeline",
+    "MetadataOutput",
+    "MultiStreamScheduler",
+    "SharedVideoSource",
+    "VideoOutput",
+    "VideoSource",
+]
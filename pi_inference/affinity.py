@@ -0,0 +1,158 @@
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+CAPTURE = "capture"
+INFERENCE = "inference"
+ENCODE = "encode"
+ROLES = (CAPTURE, INFERENCE, ENCODE)
+
+
+def parse_cpus(cpus: str) -> List[int]:
+    """
+    Parses a CPU list in the taskset format, e.g. "0", "1-2" or "0,2-3".
+
+    Args:
+        cpus (str): The CPU list.
+
+    Returns:
+        List[int]: The sorted CPU numbers.
+    """
+    result = set()
+    for part in cpus.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        result.update(range(int(first), int(last or first) + 1))
+    return sorted(result)
+
+
+def available_cpus() -> List[int]:
+    """Returns the CPUs the process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CpuPlan:
+    """
+    Assigns CPU sets to the capture, inference and encode roles, so GStreamer streaming threads, encoder
+    worker threads and the model's threads don't preempt each other.
+
+    Threads are pinned with `sched_setaffinity`, which on Linux applies to the calling thread only. Threads
+    started by a pinned thread, such as x264 or OpenMP workers, inherit its CPU set. The thread counts of
+    videoconvert, the decoder, the encoder and the model are derived from the size of each set. Pinning is
+    a no-op on platforms without `sched_setaffinity`.
+
+    Args:
+        roles (Dict[str, Iterable[int]]): The CPUs of every role. Roles left out aren't pinned.
+    """
+
+    def __init__(self, roles: Dict[str, Iterable[int]]):
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise ValueError(f"CPU roles {sorted(unknown)} not supported, expected {list(ROLES)}")
+        self.roles = {role: sorted(set(cpus)) for role, cpus in roles.items() if cpus}
+
+    @staticmethod
+    def auto(cpus: Optional[List[int]] = None) -> "CpuPlan":
+        """
+        Splits the CPUs into one for capture, one for encode and the rest for inference, e.g. 0 / 1-2 / 3
+        on a 4-core Pi. With two CPUs capture and encode share the first one.
+
+        Args:
+            cpus (List[int], optional): The CPUs to split, the process's CPUs by default.
+        """
+        cpus = sorted(cpus or available_cpus())
+        if len(cpus) >= 3:
+            return CpuPlan({CAPTURE: cpus[:1], INFERENCE: cpus[1:-1], ENCODE: cpus[-1:]})
+        if len(cpus) == 2:
+            return CpuPlan({CAPTURE: cpus[:1], INFERENCE: cpus[1:], ENCODE: cpus[:1]})
+        return CpuPlan({role: cpus for role in ROLES})
+
+    @staticmethod
+    def parse(plan: str) -> "CpuPlan":
+        """
+        Parses a plan such as "capture=0;inference=1-2;encode=3", or "auto" for `CpuPlan.auto`.
+        """
+        if plan.strip() == "auto":
+            return CpuPlan.auto()
+        roles = {}
+        for part in plan.split(";"):
+            if part.strip():
+                role, _, cpus = part.partition("=")
+                roles[role.strip()] = parse_cpus(cpus)
+        return CpuPlan(roles)
+
+    @staticmethod
+    def from_options(options: dict) -> Optional["CpuPlan"]:
+        """
+        Returns the plan of the `cpu-plan` option, a `CpuPlan`, a dict of roles or a string for `parse`.
+        """
+        plan: Union[CpuPlan, dict, str, None] = options.get("cpu-plan")
+        if plan is None or isinstance(plan, CpuPlan):
+            return plan
+        if isinstance(plan, dict):
+            return CpuPlan({role: parse_cpus(cpus) if isinstance(cpus, str) else cpus for role, cpus in plan.items()})
+        return CpuPlan.parse(plan)
+
+    def cpus(self, role: str) -> Optional[List[int]]:
+        return self.roles.get(role)
+
+    def threads(self, role: str) -> int:
+        """
+        The number of threads that fit the role's CPUs, e.g. for `get_model(..., num_threads=...)`. 0, i.e.
+        automatic, if the role isn't pinned.
+        """
+        return len(self.roles.get(role, ()))
+
+    def thread_options(self, options: dict, role: str) -> dict:
+        """
+        Returns the options with the thread counts of videoconvert, the decoder and the encoder set to the
+        role's CPU count, unless they are set already.
+        """
+        threads = self.threads(role)
+        if not threads:
+            return options
+        keys = ("convert-threads", "decoder-threads") if role == CAPTURE else ("convert-threads", "encoder-threads")
+        return {**{key: threads for key in keys}, **options}
+
+    def pin(self, role: str) -> bool:
+        """
+        Pins the calling thread to the role's CPUs.
+
+        Returns:
+            bool: False if the role isn't in the plan or the platform doesn't support affinity.
+        """
+        cpus = self.roles.get(role)
+        if cpus is None or not hasattr(os, "sched_setaffinity"):
+            return False
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning("Failed to pin %s thread to CPUs %s: %s", role, cpus, e)
+            return False
+        logger.debug("Pinned %s thread to CPUs %s", role, cpus)
+        return True
+
+    @contextmanager
+    def pinned(self, role: str) -> Iterator[None]:
+        """
+        Pins the calling thread to the role's CPUs for the body of a with-statement, e.g. to create the
+        model's thread pool on the inference CPUs.
+        """
+        previous = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+        self.pin(role)
+        try:
+            yield
+        finally:
+            if previous is not None:
+                os.sched_setaffinity(0, previous)
+
+    def __repr__(self):
+        return "CpuPlan(" + ", ".join(f"{role}={cpus}" for role, cpus in self.roles.items()) + ")"
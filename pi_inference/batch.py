@@ -0,0 +1,130 @@
+"""
+Processes a directory of video files across a process pool, with every file decoded in the `offline` mode
+so each frame is delivered exactly once as fast as the decoder and the processing allow.
+
+    def count_people(video_source: VideoSource) -> int:
+        return sum(len(detect(frame)) for frame in video_source)
+
+    results = process_directory("/footage/2024-06-01", count_people, {"format": "BGR"})
+"""
+
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".webm", ".ts")
+
+
+def find_videos(directory: str, extensions: Sequence[str] = VIDEO_EXTENSIONS, recursive: bool = False) -> List[str]:
+    """
+    Lists the video files in a directory, sorted by path.
+
+    Args:
+        directory (str): The directory to search.
+        extensions (Sequence[str]): The file extensions to include, case-insensitive.
+        recursive (bool): Also search the subdirectories.
+
+    Returns:
+        List[str]: The paths of the video files.
+    """
+    extensions = tuple(extension.lower() for extension in extensions)
+    paths = Path(directory).rglob("*") if recursive else Path(directory).iterdir()
+    return sorted(str(path) for path in paths if path.is_file() and path.suffix.lower() in extensions)
+
+
+def process_file(path: str, process: Callable[[Any], Any], options: Optional[dict] = None) -> Any:
+    """
+    Opens a video file in the offline mode and passes the `VideoSource` to `process`.
+
+    Args:
+        path (str): The path of the video file.
+        process (Callable[[VideoSource], Any]): Captures and processes the frames, e.g. by iterating over
+            the source until the end of the file.
+        options (dict, optional): Extra source options.
+
+    Returns:
+        Any: The return value of `process`.
+    """
+    from pi_inference import VideoSource
+
+    video_source = VideoSource(Path(path).resolve().as_uri(), {**(options or {}), "offline": True})
+    try:
+        return process(video_source)
+    finally:
+        video_source.on_terminate()
+
+
+def _process_isolated(args: tuple) -> dict:
+    path, process, options = args
+    try:
+        return {"path": path, "result": process_file(path, process, options)}
+    except Exception as e:
+        logger.exception("Failed to process %s", path)
+        return {"path": path, "error": repr(e)}
+
+
+def process_files(
+    paths: Iterable[str],
+    process: Callable[[Any], Any],
+    options: Optional[dict] = None,
+    processes: Optional[int] = None,
+) -> List[dict]:
+    """
+    Processes video files in parallel, one file at a time per worker process.
+
+    Every worker decodes on several threads, so with one process per core set `convert-threads` to 1
+    in `options` to avoid oversubscribing the CPU.
+
+    Args:
+        paths (Iterable[str]): The video files.
+        process (Callable[[VideoSource], Any]): Called with the source of every file in a worker process, so
+            it must be picklable, i.e. defined at the top level of a module. Its return value is sent back.
+        options (dict, optional): Extra source options.
+        processes (int, optional): The number of worker processes, defaults to the number of cores.
+
+    Returns:
+        List[dict]: The `path` and `result` of every file in completion order, with an `error` instead of
+            the result if it failed.
+    """
+    paths = list(paths)
+    processes = min(processes or os.cpu_count() or 1, max(1, len(paths)))
+    # GStreamer isn't fork-safe, the workers start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with context.Pool(processes) as pool:
+        for result in pool.imap_unordered(_process_isolated, ((path, process, options) for path in paths)):
+            logger.info("Processed %s (%s/%s)", result["path"], len(results) + 1, len(paths))
+            results.append(result)
+    return results
+
+
+def process_directory(
+    directory: str,
+    process: Callable[[Any], Any],
+    options: Optional[dict] = None,
+    processes: Optional[int] = None,
+    extensions: Sequence[str] = VIDEO_EXTENSIONS,
+    recursive: bool = False,
+) -> List[dict]:
+    """
+    Processes every video file in a directory in parallel, see `process_files`.
+
+    Args:
+        directory (str): The directory of the video files.
+        process (Callable[[VideoSource], Any]): Called with the source of every file in a worker process.
+        options (dict, optional): Extra source options.
+        processes (int, optional): The number of worker processes, defaults to the number of cores.
+        extensions (Sequence[str]): The file extensions to include.
+        recursive (bool): Also process the subdirectories.
+
+    Returns:
+        List[dict]: The `path` and `result` or `error` of every file.
+    """
+    paths = find_videos(directory, extensions, recursive)
+    logger.info("Processing %s files from %s with %s", len(paths), directory, getattr(process, "__name__", process))
+    return process_files(paths, process, options, processes)
@@ -0,0 +1,220 @@
+"""
+Runs a source x sink x resolution x format benchmark matrix and saves the results as JSON.
+
+Every combination runs in a fresh process so CPU time and peak RSS are its own. The defaults only use
+videotestsrc and fakesink, so the benchmark runs on any Linux machine without a camera, GPU or network.
+
+    python3 -m pi_inference.bench --resolutions 640x480 1280x720 --formats RGB BGR --output bench.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def run_case(
+    source: str,
+    sink: Optional[str],
+    width: int,
+    height: int,
+    format: str,
+    options: dict,
+    duration: float,
+    warmup: float,
+) -> dict:
+    """
+    Captures frames from a source and renders them to a sink for `duration` seconds.
+
+    Args:
+        source (str): The source URI, e.g. test://smpte.
+        sink (str, optional): The output URI, e.g. null://, None to only capture.
+        width (int): The frame width.
+        height (int): The frame height.
+        format (str): The pixel format.
+        options (dict): Extra source and output options.
+        duration (float): Seconds to measure for.
+        warmup (float): Seconds to run before measuring.
+
+    Returns:
+        dict: The sustained fps, the capture-to-render latency percentiles in milliseconds, the CPU time
+            and the peak RSS of the process.
+    """
+    from pi_inference import VideoOutput, VideoSource
+
+    options = {**options, "width": width, "height": height, "format": format}
+    video_source = VideoSource(source, options)
+    video_output = VideoOutput(sink, options) if sink else None
+    latencies = []
+    frames = 0
+    lease = None
+    try:
+        start = time.perf_counter()
+        measure_from = start + warmup
+        cpu_start = None
+        while True:
+            now = time.perf_counter()
+            if now >= measure_from and cpu_start is None:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                cpu_start = usage.ru_utime + usage.ru_stime
+                measure_from = now
+            if now - measure_from >= duration and cpu_start is not None:
+                break
+            lease = video_source.capture_ex(timeout=1000)
+            if lease is None:
+                continue
+            if video_output is not None:
+                video_output.render(lease.array)
+            if cpu_start is not None:
+                latencies.append(lease.age)
+                frames += 1
+            lease.release()
+        elapsed = time.perf_counter() - measure_from
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = usage.ru_utime + usage.ru_stime - cpu_start
+    finally:
+        video_source.on_terminate()
+        if video_output is not None:
+            video_output.on_terminate()
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (float("nan"),) * 3
+    return {
+        "frames": frames,
+        "fps": frames / elapsed,
+        "latency_ms": {"p50": p50, "p95": p95, "p99": p99, "max": float(latencies.max(initial=0))},
+        "cpu_seconds": cpu,
+        "cpu_percent": 100 * cpu / elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "dropped": lease.dropped if lease is not None else 0,
+    }
+
+
+def _run_isolated(case: dict) -> dict:
+    try:
+        return run_case(**case)
+    except Exception as e:
+        return {"error": repr(e)}
+
+
+def run_matrix(
+    sources: List[str],
+    sinks: List[Optional[str]],
+    resolutions: List[str],
+    formats: List[str],
+    options: Optional[dict] = None,
+    duration: float = 5,
+    warmup: float = 1,
+) -> List[dict]:
+    """
+    Runs every combination of the matrix in its own process.
+
+    Args:
+        sources (List[str]): The source URIs.
+        sinks (List[Optional[str]]): The output URIs, None to only capture.
+        resolutions (List[str]): The resolutions as WIDTHxHEIGHT.
+        formats (List[str]): The pixel formats.
+        options (dict, optional): Extra source and output options.
+        duration (float): Seconds to measure each combination for.
+        warmup (float): Seconds to run each combination before measuring.
+
+    Returns:
+        List[dict]: One result per combination, with an `error` instead of the measurements if it failed.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for source, sink, resolution, format in itertools.product(sources, sinks, resolutions, formats):
+        width, height = (int(value) for value in resolution.lower().split("x"))
+        case = {
+            "source": source,
+            "sink": sink,
+            "width": width,
+            "height": height,
+            "format": format,
+            "options": options or {},
+            "duration": duration,
+            "warmup": warmup,
+        }
+        logger.info("Running %s -> %s %s %s", source, sink, resolution, format)
+        with context.Pool(1) as pool:
+            result = pool.apply(_run_isolated, (case,))
+        results.append({"source": source, "sink": sink, "resolution": resolution, "format": format, **result})
+    return results
+
+
+def environment() -> dict:
+    from pi_inference import __version__
+
+    from .gst import Gst
+
+    return {
+        "pi_inference": __version__,
+        "gstreamer": Gst.version_string(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+    }
+
+
+def format_table(results: List[dict]) -> str:
+    lines = [
+        f"{'source':<16} {'sink':<16} {'resolution':<10} {'format':<6} {'fps':>7} "
+        f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'cpu %':>6} {'rss MB':>7}"
+    ]
+    for result in results:
+        prefix = f"{result['source']:<16} {str(result['sink']):<16} {result['resolution']:<10} {result['format']:<6}"
+        if "error" in result:
+            lines.append(f"{prefix} {result['error']}")
+            continue
+        latency = result["latency_ms"]
+        lines.append(
+            f"{prefix} {result['fps']:>7.1f} {latency['p50']:>7.1f} {latency['p95']:>7.1f} {latency['p99']:>7.1f} "
+            f"{result['cpu_percent']:>6.1f} {result['peak_rss_mb']:>7.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="pi-inference benchmark matrix")
+    parser.add_argument("--sources", nargs="+", default=["test://smpte"], help="Source URIs")
+    parser.add_argument("--sinks", nargs="+", default=["null://"], help="Output URIs, none to only capture")
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720", "1920x1080"])
+    parser.add_argument("--formats", nargs="+", default=["RGB", "BGR"])
+    parser.add_argument("--framerate", type=int, default=30)
+    parser.add_argument("--live", action="store_true", help="Pace test sources at the framerate")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds to measure each combination")
+    parser.add_argument("--warmup", type=float, default=1, help="Seconds to run before measuring")
+    parser.add_argument("--output", type=str, default=None, help="Save the results to this JSON file")
+    args, extra = parser.parse_known_args(argv)
+
+    options = {arg.lstrip("-"): value for arg, value in zip(extra[::2], extra[1::2])}
+    options.setdefault("framerate", args.framerate)
+    options.setdefault("live", args.live)
+    sinks = [None if sink == "none" else sink for sink in args.sinks]
+    results = run_matrix(args.sources, sinks, args.resolutions, args.formats, options, args.duration, args.warmup)
+    print(format_table(results))
+
+    report = {"environment": environment(), "options": options, "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        logger.info("Saved results to %s", args.output)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    sys.exit(main())
@@ -1,15 +1,17 @@
 import logging
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
 
-import gi
 from typing_extensions import override
 
-gi.require_version("Gst", "1.0")
-from gi.repository import Gst
+from .affinity import CpuPlan
+from .gst import Gst
+from .metrics import Metrics, metrics
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
-Gst.init(None)
 
 
 class Pipeline(ABC):
@@ -25,12 +27,41 @@ class Pipeline(ABC):
     def terminate(self):
         pass
 
+    def prepare(self, timeout: float = 5) -> bool:
+        """
+        Initializes the pipeline ahead of `start`, so the first frame doesn't pay for it.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: False if the pipeline failed or timed out.
+        """
+        return True
+
+    def set_cpu_plan(self, plan: CpuPlan, role: str):
+        """
+        Pins the threads of the pipeline to the CPUs of a role.
+
+        Args:
+            plan (CpuPlan): The CPU sets of the roles.
+            role (str): The role of the pipeline's threads, e.g. capture or encode.
+        """
+        logger.warning("%s doesn't support CPU affinity", type(self).__name__)
+
 
 class GstPipeline(Pipeline):
+    # Poll the bus on a BusMonitor thread even with metrics disabled, for pipelines that handle errors
+    WATCH_BUS = False
 
     def __init__(self, pipeline_name: str):
         logger.info("Creating Gst Pipeline %s", pipeline_name)
         self.pipeline = Gst.Pipeline.new(pipeline_name)
+        # The pipeline label of the metrics, set to the URI by VideoSource and VideoOutput
+        self.label = pipeline_name
+        self.bus_monitor = None
+        self.cpu_plan = None
+        self.cpu_role = None
         self.bus = self.pipeline.get_bus()
         self.bus.add_signal_watch()
         self.bus.connect("message::eos", self.on_eos)
@@ -39,12 +70,198 @@ class GstPipeline(Pipeline):
         logger.warning("End-Of-Stream reached")
         self.terminate()
 
+    def on_error(self, bus, msg):
+        """Called by the `BusMonitor` for error messages, after logging them."""
+
+    @override
+    def set_cpu_plan(self, plan: CpuPlan, role: str):
+        """
+        Pins every streaming thread of the pipeline, and the encoder and decoder threads they start, to the
+        CPUs of a role when the thread starts.
+        """
+        self.cpu_plan = plan
+        self.cpu_role = role
+        self.bus.set_sync_handler(self.on_sync_message)
+        logger.info("Pinning %s threads to CPUs %s", self.label, plan.cpus(role))
+
+    def on_sync_message(self, bus, msg):
+        # Stream status ENTER is posted synchronously from the new streaming thread itself
+        if msg.type == Gst.MessageType.STREAM_STATUS:
+            status, _ = msg.parse_stream_status()
+            if status == Gst.StreamStatusType.ENTER:
+                self.cpu_plan.pin(self.cpu_role)
+        return Gst.BusSyncReply.PASS
+
     @override
     def terminate(self):
         logger.warning("Set pipeline NULL")
         self.pipeline.set_state(Gst.State.NULL)
+        if self.bus_monitor is not None:
+            self.bus_monitor.stop()
+            self.bus_monitor = None
+
+    @override
+    def prepare(self, timeout: float = 5) -> bool:
+        """
+        Takes the pipeline to PAUSED and waits for preroll, so caps negotiation and element start-up, such
+        as opening the device or decoder, happen before `start`. Live sources don't preroll and return
+        immediately.
+        """
+        logger.info("Setting pipeline to PAUSED")
+        if self.pipeline.set_state(Gst.State.PAUSED) == Gst.StateChangeReturn.FAILURE:
+            logger.error("Failed to pause %s", self.label)
+            return False
+        result, _, _ = self.pipeline.get_state(int(timeout * Gst.SECOND))
+        if result == Gst.StateChangeReturn.FAILURE:
+            logger.error("Failed to preroll %s", self.label)
+            return False
+        if result == Gst.StateChangeReturn.ASYNC:
+            logger.warning("%s did not preroll within %s s", self.label, timeout)
+            return False
+        return True
 
     @override
     def start(self):
         logger.info("Setting pipeline to PLAYING")
+        if (metrics.enabled or self.WATCH_BUS) and self.bus_monitor is None:
+            self.bus_monitor = BusMonitor(self, self.label)
+            self.bus_monitor.start()
         self.pipeline.set_state(Gst.State.PLAYING)
+
+
+class BusMonitor:
+    """
+    Polls the bus of a `GstPipeline` on a dedicated thread, since no GLib main loop dispatches the bus
+    signal watch unless the RTSP server runs.
+
+    Errors, warnings and QoS messages are counted, and the levels of queue elements and of the frame
+    queue are sampled every `level_interval`. End-of-stream and errors are forwarded to the pipeline's
+    `on_eos` and `on_error`.
+
+    Args:
+        pipeline (GstPipeline): The pipeline to monitor.
+        label (str): The value of the `pipeline` label, e.g. the source or output URI.
+        metrics (Metrics): The metrics to record into.
+        level_interval (float): Seconds between queue level samples.
+    """
+
+    MESSAGES = Gst.MessageType.EOS | Gst.MessageType.ERROR | Gst.MessageType.WARNING | Gst.MessageType.QOS
+
+    def __init__(self, pipeline, label: str, metrics: Metrics = metrics, level_interval: float = 1):
+        self.pipeline = pipeline
+        self.label = label
+        self.metrics = metrics
+        self.level_interval = level_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        # Messages are popped here, a signal watch dispatched by the RTSP main loop would race for them
+        self.pipeline.bus.remove_signal_watch()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"bus-{self.label}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1):
+        """Stops polling. The signal watch `start` removed is restored when the thread exits."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        bus = self.pipeline.bus
+        sampled = 0.0
+        try:
+            while not self._stop.is_set():
+                message = bus.timed_pop_filtered(100 * Gst.MSECOND, BusMonitor.MESSAGES)
+                if message is not None:
+                    self.handle(message)
+                now = time.monotonic()
+                if self.metrics.enabled and now - sampled >= self.level_interval:
+                    sampled = now
+                    self.sample_levels()
+        finally:
+            # Hand the bus back to the signal watch once nothing pops its messages here
+            bus.add_signal_watch()
+
+    def handle(self, message: Gst.Message):
+        element = message.src.get_name() if message.src is not None else ""
+        if message.type == Gst.MessageType.EOS:
+            self.pipeline.on_eos(self.pipeline.bus, message)
+            return
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            logger.error("%s: %s (%s)", element, error.message, debug)
+            kind = "error"
+        elif message.type == Gst.MessageType.WARNING:
+            warning, debug = message.parse_warning()
+            logger.warning("%s: %s (%s)", element, warning.message, debug)
+            kind = "warning"
+        else:
+            _, _, dropped = message.parse_qos_stats()
+            self.metrics.set("gst_qos_dropped_buffers", dropped, pipeline=self.label, element=element)
+            kind = "qos"
+        self.metrics.inc("gst_messages_total", pipeline=self.label, type=kind, element=element)
+        if message.type == Gst.MessageType.ERROR:
+            self.pipeline.on_error(self.pipeline.bus, message)
+
+    def sample_levels(self):
+        for element in self.pipeline.pipeline.iterate_recurse():
+            factory = element.get_factory()
+            if factory is not None and factory.get_name() == "queue":
+                level = element.get_property("current-level-buffers")
+                self.metrics.set("queue_level_buffers", level, pipeline=self.label, queue=element.get_name())
+        frames = getattr(self.pipeline, "frames", None)
+        if frames is not None:
+            self.metrics.set("frame_queue_level", len(frames), pipeline=self.label)
+            self.metrics.set("frame_queue_dropped", frames.dropped, pipeline=self.label)
+
+
+class LatencyTracer:
+    """
+    Records GStreamer latency tracer output as histograms. The tracer is read from the environment when
+    GStreamer initializes, so it has to be enabled before the process starts:
+
+        GST_TRACERS="latency(flags=pipeline+element)" GST_DEBUG="GST_TRACER:7" python3 app.py
+
+    Installing the tracer replaces the default GStreamer log handler, so the records aren't printed.
+
+    Args:
+        metrics (Metrics): The metrics to record into.
+    """
+
+    def __init__(self, metrics: Metrics = metrics):
+        self.metrics = metrics
+        self.installed = False
+
+    def install(self) -> bool:
+        """
+        Starts collecting tracer records.
+
+        Returns:
+            bool: False if the latency tracer isn't enabled in the environment.
+        """
+        if "latency" not in os.environ.get("GST_TRACERS", ""):
+            logger.warning('Latency tracer not enabled, set GST_TRACERS="latency(flags=pipeline+element)"')
+            return False
+        Gst.debug_remove_log_function(None)
+        Gst.debug_add_log_function(self.on_log, None)
+        self.installed = True
+        return True
+
+    def on_log(self, category, level, file, function, line, obj, message, *user_data):
+        if category.get_name() != "GST_TRACER":
+            return
+        parsed = Gst.Structure.from_string(message.get())
+        structure = parsed[0] if isinstance(parsed, tuple) else parsed
+        if structure is None:
+            return
+        name = structure.get_name()
+        if name == "latency":
+            src = structure.get_value("src-element") or structure.get_value("src")
+            sink = structure.get_value("sink-element") or structure.get_value("sink")
+            seconds = structure.get_value("time") / Gst.SECOND
+            self.metrics.observe("gst_latency_seconds", seconds, src=src, sink=sink)
+        elif name == "element-latency":
+            seconds = structure.get_value("time") / Gst.SECOND
+            self.metrics.observe("gst_element_latency_seconds", seconds, element=structure.get_value("element"))
@@ -1,20 +1,23 @@
+from __future__ import annotations
+
 import logging
+import operator
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
 
-import cv2
-import gi
 import numpy as np
-import supervision as sv
 
-gi.require_version("Gst", "1.0")
-gi.require_version("GstRtspServer", "1.0")
-from gi.repository import GLib, Gst, GstRtspServer
+from .gst import Gst
+
+if TYPE_CHECKING:
+    import supervision as sv
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
-Gst.init(None)
 
 
 def is_v4l2(input: str):
@@ -31,6 +34,21 @@ def is_v4l2(input: str):
     return re.match(v4l2_pattern, input) is not None
 
 
+def to_bool(value) -> bool:
+    """
+    Interprets an option value as a boolean. Options from the command line arrive as strings.
+
+    Args:
+        value: The option value, e.g. True, 1, "true", "0", "no".
+
+    Returns:
+        bool: The boolean value of the option.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
 def extract_rtsp(input: str) -> Tuple[str, str, str]:
     """
     Extracts the IP address, port, and base from an RTSP URL.
@@ -126,6 +144,54 @@ def make_element(element_name: str, name=None):
     return element
 
 
+# Bytes per pixel of the packed formats, NV12 is a full-resolution Y plane followed by a half-height UV plane
+PIXEL_FORMATS = {"RGB": 3, "BGR": 3, "BGRx": 4, "GRAY8": 1, "NV12": 1}
+
+
+def frame_layout(format: str, width: int, height: int) -> Tuple[Tuple[int, ...], Tuple[int, ...], int]:
+    """
+    Computes the numpy shape and strides of a raw video frame with the default GStreamer row alignment.
+
+    Args:
+        format (str): One of `PIXEL_FORMATS`.
+        width (int): The frame width.
+        height (int): The frame height.
+
+    Returns:
+        Tuple[Tuple[int, ...], Tuple[int, ...], int]: The shape, the strides and the size in bytes of the frame.
+            NV12 frames are single-channel, (height * 3 / 2, width), with the UV plane below the Y plane.
+    """
+    if format not in PIXEL_FORMATS:
+        raise ValueError(f"Format {format} not supported, expected one of {list(PIXEL_FORMATS)}")
+    channels = PIXEL_FORMATS[format]
+    # GStreamer aligns the rows of every plane to 4 bytes
+    stride = (width * channels + 3) // 4 * 4
+    if format == "NV12":
+        rows = height + (height + 1) // 2
+        return (rows, width), (stride, 1), stride * rows
+    if channels == 1:
+        return (height, width), (stride, 1), stride * height
+    return (height, width, channels), (stride, channels, 1), stride * height
+
+
+def make_converter(options: dict, name=None) -> Gst.Element:
+    """
+    Creates a videoconvert element, multi-threaded with the `convert-threads` option.
+
+    Args:
+        options (dict): The source or output options.
+        name (str, optional): The name of the element.
+
+    Returns:
+        Gst.Element: The videoconvert element. It passes buffers through untouched when the formats match.
+    """
+    converter = make_element("videoconvert", name)
+    threads = options.get("convert-threads")
+    if threads is not None:
+        converter.set_property("n-threads", int(threads))
+    return converter
+
+
 def launch_rtsp_server(
     rtsp_port=8554,
     udp_port=5000,
@@ -144,6 +210,12 @@ def launch_rtsp_server(
         payload (int): Payload type for the stream.
         endpoint (str): Endpoint for the stream. e.g., rtsp://@:8554/base
     """
+    # Imported here so the package works without the RTSP server typelib unless rtsp:// outputs are used
+    import gi
+
+    gi.require_version("GstRtspServer", "1.0")
+    from gi.repository import GLib, GstRtspServer
+
     server = GstRtspServer.RTSPServer()
     server.set_property("service", str(rtsp_port))
 
@@ -166,49 +238,191 @@ def launch_rtsp_server(
     logger.warning("Exit RTSP Server MainLoop ...")
 
 
+class OverlayCache:
+    """
+    An LRU cache of pre-rendered text patches, so drawing text costs one in-place blend per frame.
+
+    A patch holds the background box and the white glyphs of the text, rendered once per text, font,
+    scale and channel count.
+
+    Args:
+        maxsize (int): The maximum number of cached patches.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._patches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, text: str, font: int, font_scale: float, thickness: int, padding: int, channels: Optional[int] = 3
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Returns the pre-rendered patch of the text, rendering it on a miss.
+
+        Args:
+            text (str): The text to render.
+            font (int): The OpenCV font face.
+            font_scale (float): The font scale.
+            thickness (int): The glyph thickness.
+            padding (int): The background padding around the text.
+            channels (int, optional): The channel count of the frame, None for single-plane frames.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, int]: The glyphs and the background of the padded box, and the
+                text height above the baseline.
+        """
+        key = (text, font, font_scale, thickness, padding, channels)
+        with self._lock:
+            patch = self._patches.get(key)
+            if patch is not None:
+                self._patches.move_to_end(key)
+                self.hits += 1
+                return patch
+            self.misses += 1
+
+        import cv2
+
+        (text_width, text_height), _ = cv2.getTextSize(text, font, font_scale, thickness)
+        shape = (text_height + 2 * padding, text_width + 2 * padding) + (() if channels is None else (channels,))
+        glyphs = np.zeros(shape, dtype=np.uint8)
+        cv2.putText(glyphs, text, (padding, text_height + padding), font, font_scale, (255,) * 4, thickness)
+        patch = (glyphs, np.full(shape, 10, dtype=np.uint8), text_height)
+
+        with self._lock:
+            self._patches[key] = patch
+            if len(self._patches) > self.maxsize:
+                self._patches.popitem(last=False)
+        return patch
+
+
+overlay_cache = OverlayCache()
+
+
 def draw_text(frame: np.ndarray, text: str, anchor_x: Optional[int] = None, anchor_y: Optional[int] = None):
+    """
+    Draws white text on a darkened box, in place.
+
+    Args:
+        frame (np.ndarray): The frame to draw on.
+        text (str): The text to draw.
+        anchor_x (int, optional): The x coordinate of the text origin.
+        anchor_y (int, optional): The y coordinate of the text baseline.
+
+    Returns:
+        np.ndarray: The frame.
+    """
+    import cv2
+
     width, height = frame.shape[1], frame.shape[0]
-    font_scale = 0.5
-    font_thickness = 1
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
     padding = 5
+    channels = frame.shape[2] if frame.ndim == 3 else None
+    glyphs, background, text_height = overlay_cache.get(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1, padding, channels)
 
     anchor_x = anchor_x or 50 + padding
     anchor_y = anchor_y or 50 + padding
 
-    top = max(0, anchor_y - text_size[1] - padding)
-    bottom = min(height, anchor_y + padding)
-    left = max(0, anchor_x - padding)
-    right = min(width, anchor_x + text_size[0] + padding)
+    box_top = anchor_y - text_height - padding
+    box_left = anchor_x - padding
+    top = max(0, box_top)
+    bottom = min(height, box_top + glyphs.shape[0])
+    left = max(0, box_left)
+    right = min(width, box_left + glyphs.shape[1])
+    if top >= bottom or left >= right:
+        return frame
+
+    crop = (slice(top - box_top, bottom - box_top), slice(left - box_left, right - box_left))
+    region = frame[top:bottom, left:right]
+    cv2.addWeighted(region, 0.5, background[crop], 0.5, 1.0, dst=region)
+    cv2.max(region, glyphs[crop], dst=region)
+    return frame
 
-    sub_frame = frame[top:bottom, left:right]
-    black_rect = np.ones(sub_frame.shape, dtype=np.uint8) * 10
 
-    res = cv2.addWeighted(sub_frame, 0.5, black_rect, 0.5, 1.0)
-    frame[top:bottom, left:right] = res
-    cv2.putText(frame, text, (anchor_x, anchor_y), font, font_scale, (255, 255, 255), font_thickness)
-    return frame
+_clock = {"second": None, "text": ""}
 
 
 def draw_clock(frame: np.ndarray, anchor_x: Optional[int] = None, anchor_y: Optional[int] = None):
-    return draw_text(frame, datetime.now().strftime("%d/%m/%Y %H:%M:%S"), anchor_x, anchor_y)
+    second = int(time.time())
+    if second != _clock["second"]:
+        _clock["second"] = second
+        _clock["text"] = datetime.fromtimestamp(second).strftime("%d/%m/%Y %H:%M:%S")
+    return draw_text(frame, _clock["text"], anchor_x, anchor_y)
 
 
-def from_ncnn(frame: np.ndarray, net) -> sv.Detections:
+_CLASS_NAMES = {}
+_NCNN_OBJECT_FIELDS = operator.attrgetter("rect.x", "rect.y", "rect.w", "rect.h", "prob", "label")
+
+
+def class_name_table(class_names: Sequence[str]) -> np.ndarray:
+    """
+    Returns the class names as a numpy array indexed by class id, cached per class name list.
+
+    Args:
+        class_names (Sequence[str]): The class names of a model, e.g. `net.class_names`.
+
+    Returns:
+        np.ndarray: The class names.
+    """
+    entry = _CLASS_NAMES.get(id(class_names))
+    if entry is None or entry[0] is not class_names:
+        entry = (class_names, np.array(class_names))
+        _CLASS_NAMES[id(class_names)] = entry
+    return entry[1]
+
+
+def from_ncnn(
+    frame: np.ndarray,
+    net,
+    class_confidence: Optional[Dict[int, float]] = None,
+    classes: Optional[Iterable[int]] = None,
+    letterbox=None,
+) -> sv.Detections:
+    """
+    Runs an ncnn model zoo net on a frame and converts the objects to detections.
+
+    Args:
+        frame (np.ndarray): The frame to run the net on.
+        net: The ncnn model zoo net, returning objects with `rect`, `prob` and `label`.
+        class_confidence (Dict[int, float], optional): Minimum confidence per class id. Classes not listed
+            keep the net's own threshold.
+        classes (Iterable[int], optional): The class ids to keep, all classes if not provided.
+        letterbox (Letterbox, optional): The letterbox of `frame`, e.g. `lease.letterbox`, to map the boxes
+            back to the full-resolution frame.
+
+    Returns:
+        sv.Detections: The detections, with class names in `data["class_name"]`.
+    """
+    import supervision as sv
+
     objects = net(frame)
-    xyxy = []
-    confidence = []
-    class_id = []
-    for obj in objects:
-        x, y, w, h = obj.rect.x, obj.rect.y, obj.rect.w, obj.rect.h
-        xyxy.append([x, y, x + w, y + h])
-        confidence.append(obj.prob)
-        class_id.append(int(obj.label))
-    detections = (
-        sv.Detections(xyxy=np.array(xyxy), confidence=np.array(confidence), class_id=np.array(class_id))
-        if len(objects) > 0
-        else sv.Detections.empty()
+    values = np.array(list(map(_NCNN_OBJECT_FIELDS, objects)), dtype=np.float32).reshape(-1, 6)
+    xyxy = values[:, :4]
+    xyxy[:, 2:] += xyxy[:, :2]
+    if letterbox is not None:
+        xyxy = letterbox.to_source(xyxy)
+    confidence = values[:, 4]
+    class_id = values[:, 5].astype(int)
+
+    keep = None
+    if class_confidence:
+        thresholds = np.zeros(max(max(class_confidence) + 1, int(class_id.max(initial=0)) + 1), dtype=np.float32)
+        thresholds[list(class_confidence.keys())] = list(class_confidence.values())
+        keep = confidence >= thresholds[class_id]
+    if classes is not None:
+        allowed = np.isin(class_id, np.fromiter(classes, dtype=int))
+        keep = allowed if keep is None else keep & allowed
+    if keep is not None:
+        xyxy, confidence, class_id = xyxy[keep], confidence[keep], class_id[keep]
+
+    if len(class_id) == 0:
+        detections = sv.Detections.empty()
+        detections.data["class_name"] = np.array([], dtype=str)
+        return detections
+    return sv.Detections(
+        xyxy=xyxy,
+        confidence=confidence,
+        class_id=class_id,
+        data={"class_name": class_name_table(net.class_names)[class_id]},
     )
-    detections.data["class_name"] = [net.class_names[_id] for _id in class_id]
-    return detections
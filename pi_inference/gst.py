@@ -0,0 +1,12 @@
+"""
+Imports GStreamer for the whole package, so `Gst.init` runs once and only when a pipeline is first needed.
+"""
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+Gst.init(None)
+
+__all__ = ["Gst"]
@@ -0,0 +1,242 @@
+import bisect
+import http.server
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Upper bounds in seconds, from a fast conversion to a slow inference on a Pi
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+HELP = {
+    "stage_seconds": "Time spent in a pipeline stage per frame.",
+    "capture_to_render_seconds": "Time from capturing a frame to rendering it.",
+    "capture_to_result_seconds": "Time from capturing a frame to its inference result.",
+    "scheduler_dropped_total": "Frames dropped by the scheduler for missing their deadline or being replaced.",
+    "time_to_first_frame_seconds": "Time from preparing a source to its first frame.",
+    "gst_messages_total": "GStreamer bus messages by type.",
+    "reconnects_total": "Times a network source reconnected.",
+    "motion_gate_frames_total": "Frames passed through a motion gate, by whether the detector was skipped.",
+    "metadata_dropped_total": "Metadata records dropped because the writer fell behind.",
+    "gst_qos_dropped_buffers": "Buffers dropped by an element, from its latest QoS message.",
+    "queue_level_buffers": "Buffers held by a queue element.",
+    "frame_queue_level": "Frames waiting to be captured.",
+    "frame_queue_dropped": "Frames dropped before they were captured.",
+    "gst_latency_seconds": "Source-to-sink latency reported by the GStreamer latency tracer.",
+    "gst_element_latency_seconds": "Per-element latency reported by the GStreamer latency tracer.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _key(name: str, labels: dict) -> Tuple[str, Labels]:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """
+    A cumulative histogram in the Prometheus layout.
+
+    Args:
+        buckets (Sequence[float]): The bucket upper bounds, the +Inf bucket is implicit.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Returns the `le` label and cumulative count of every bucket, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return result
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = labels + ((extra,) if extra else ())
+    if not items:
+        return ""
+    escaped = ((key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of the pipelines, rendered in the Prometheus text format.
+
+    Recording is a no-op until `enable` or `serve` is called, so the hooks in the pipelines cost one
+    attribute check per frame when metrics are off.
+
+    Args:
+        enabled (bool): Record from the start.
+        prefix (str): The prefix of every metric name.
+        buckets (Sequence[float]): The histogram bucket upper bounds in seconds.
+    """
+
+    def __init__(self, enabled: bool = False, prefix: str = "pi_inference", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._hooks: List[Callable[[str, float, dict], None]] = []
+        self._server = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def add_hook(self, hook: Callable[[str, float, dict], None]):
+        """
+        Registers a callback called with the stage name, its duration in seconds and the labels of every
+        recorded stage timing, e.g. to forward timings to another monitoring system.
+        """
+        self._hooks.append(hook)
+
+    def record_stage(self, stage: str, seconds: float, **labels):
+        """
+        Records the time one frame spent in a stage such as capture, infer, annotate or render.
+        """
+        if not self.enabled:
+            return
+        self.observe("stage_seconds", seconds, stage=stage, **labels)
+        for hook in self._hooks:
+            hook(stage, seconds, labels)
+
+    @contextmanager
+    def timer(self, stage: str, **labels) -> Iterator[None]:
+        """
+        Times the body of a with-statement as a stage.
+
+            with metrics.timer("annotate"):
+                frame = annotate(frame, detections)
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(
+                (key, histogram.cumulative(), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {self.prefix}_{name} {HELP[name]}")
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            describe(name, "gauge")
+            lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+        for (name, labels), buckets, total, count in histograms:
+            describe(name, "histogram")
+            for bound, cumulative in buckets:
+                lines.append(f"{self.prefix}_{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.prefix}_{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9100, host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+        """
+        Enables recording and serves the metrics at http://host:port/metrics from a daemon thread.
+
+        Args:
+            port (int): The port to listen on.
+            host (str): The address to bind, localhost by default.
+
+        Returns:
+            http.server.ThreadingHTTPServer: The server, stopped by `shutdown`.
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self.enable()
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving metrics @ http://%s:%s/metrics", host, port)
+        return self._server
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+metrics = Metrics()
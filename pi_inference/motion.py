@@ -0,0 +1,122 @@
+import logging
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+import supervision as sv
+
+from . import functions as f
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def thumbnail(frame: np.ndarray, width: int = 64, format: str = "RGB") -> np.ndarray:
+    """
+    Makes a small grayscale frame by subsampling, cheap enough to run on every frame.
+
+    Args:
+        frame (np.ndarray): An (H, W, C) or (H, W) frame.
+        width (int): The approximate width of the thumbnail.
+        format (str): The pixel format of the frame. For NV12 only the luma plane is used.
+
+    Returns:
+        np.ndarray: The (h, w) float32 thumbnail.
+    """
+    if format == "NV12":
+        # The (H * 3 / 2, W) frame holds the luma rows, then the interleaved UV rows at half height
+        frame = frame[: frame.shape[0] * 2 // 3]
+    step = max(1, frame.shape[1] // width)
+    small = frame[::step, ::step]
+    if small.ndim == 3:
+        # Channel order doesn't matter for change detection, the alpha channel of BGRx is skipped
+        return small[..., :3].mean(axis=2, dtype=np.float32)
+    return small.astype(np.float32)
+
+
+class MotionGate:
+    """
+    Skips the detector while the scene doesn't change, reusing the previous detections.
+
+    Every frame is reduced to a grayscale thumbnail and compared against a running average background.
+    When the fraction of changed pixels is below `threshold`, the previous `sv.Detections` are returned
+    without running the detector, except every `refresh_interval` seconds.
+
+    Args:
+        net: The ncnn model zoo net.
+        threshold (float): The fraction of changed thumbnail pixels below which the detector is skipped.
+        pixel_threshold (float): The gray level difference from the background of a changed pixel.
+        refresh_interval (float): The maximum time in seconds between detector runs.
+        alpha (float): The weight of the newest thumbnail in the running background, between 0 and 1.
+        width (int): The width of the thumbnails.
+        format (str): The pixel format of the frames, as the source's `format` option.
+        infer (Callable[[np.ndarray, Any], sv.Detections]): Runs the detector on a frame.
+    """
+
+    def __init__(
+        self,
+        net,
+        threshold: float = 0.005,
+        pixel_threshold: float = 25,
+        refresh_interval: float = 5,
+        alpha: float = 0.05,
+        width: int = 64,
+        format: str = "RGB",
+        infer: Callable[[np.ndarray, Any], sv.Detections] = f.from_ncnn,
+    ):
+        self.net = net
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = refresh_interval
+        self.alpha = alpha
+        self.width = width
+        self.format = format
+        self.infer = infer
+        self.frames = 0
+        self.skipped = 0
+        self.change = 0.0
+        self.background: Optional[np.ndarray] = None
+        self._detections: Optional[sv.Detections] = None
+        self._detected_at = 0.0
+
+    def update(self, frame: np.ndarray) -> float:
+        """
+        Updates the background with a frame.
+
+        Args:
+            frame (np.ndarray): The frame.
+
+        Returns:
+            float: The fraction of thumbnail pixels that differ from the background.
+        """
+        small = thumbnail(frame, self.width, self.format)
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            return 1.0
+        change = float(np.count_nonzero(np.abs(small - self.background) > self.pixel_threshold)) / small.size
+        self.background += self.alpha * (small - self.background)
+        return change
+
+    def __call__(self, frame: np.ndarray) -> sv.Detections:
+        self.frames += 1
+        self.change = self.update(frame)
+        now = time.monotonic()
+        if (
+            self._detections is not None
+            and self.change < self.threshold
+            and now - self._detected_at < self.refresh_interval
+        ):
+            self.skipped += 1
+            metrics.inc("motion_gate_frames_total", result="skipped")
+            return self._detections
+
+        self._detections = self.infer(frame, self.net)
+        self._detected_at = now
+        metrics.inc("motion_gate_frames_total", result="inferred")
+        return self._detections
+
+    @property
+    def skip_ratio(self) -> float:
+        """The fraction of frames that reused the previous detections."""
+        return self.skipped / self.frames if self.frames else 0.0
@@ -0,0 +1,319 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .affinity import CAPTURE, ENCODE, INFERENCE, CpuPlan
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class StageStats:
+    """
+    Throughput and timing of one pipeline stage over a sliding window.
+
+    Args:
+        name (str): The name of the stage.
+        window (int): The number of recent items to average over.
+    """
+
+    def __init__(self, name: str, window: int = 60):
+        self.name = name
+        self.count = 0
+        self._lock = threading.Lock()
+        self._done = deque(maxlen=window)
+        self._busy = deque(maxlen=window)
+
+    def record(self, busy: float):
+        with self._lock:
+            self.count += 1
+            self._done.append(time.perf_counter())
+            self._busy.append(busy)
+
+    @property
+    def fps(self) -> float:
+        """Items completed per second over the window."""
+        with self._lock:
+            if len(self._done) < 2:
+                return 0.0
+            return (len(self._done) - 1) / (self._done[-1] - self._done[0])
+
+    @property
+    def latency(self) -> float:
+        """Mean time spent processing one item, in seconds."""
+        with self._lock:
+            return sum(self._busy) / len(self._busy) if self._busy else 0.0
+
+    def __repr__(self):
+        return f"{self.name}: {self.fps:.1f} fps, {self.latency * 1000:.1f} ms"
+
+
+def warmup(infer: Callable[[np.ndarray], Any], shape: Tuple[int, ...], runs: int = 2) -> List[float]:
+    """
+    Runs inferences on a blank frame, so the model's first-run allocations happen before the first real frame.
+
+    Args:
+        infer (Callable[[np.ndarray], Any]): Runs the model on a frame.
+        shape (Tuple[int, ...]): The frame shape.
+        runs (int): The number of inferences.
+
+    Returns:
+        List[float]: The duration of every run in seconds.
+    """
+    frame = np.zeros(shape, dtype=np.uint8)
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        infer(frame)
+        durations.append(time.perf_counter() - start)
+    if durations:
+        logger.info("Warm-up inferences took %s ms", ", ".join(f"{duration * 1000:.0f}" for duration in durations))
+    return durations
+
+
+class _Item:
+    __slots__ = ("sequence", "frame", "lease", "result", "timestamp", "pts")
+
+    def __init__(self, sequence: int, frame: np.ndarray, lease=None):
+        self.sequence = sequence
+        self.frame = frame
+        self.lease = lease
+        self.result = None
+        self.timestamp = lease.timestamp if lease is not None else time.time()
+        self.pts = lease.pts if lease is not None else None
+
+
+class InferencePipeline:
+    """
+    Runs capture, inference, annotation and rendering in separate worker threads connected by bounded queues.
+
+    Each stage handles frames in capture order, so a slow encode in `VideoOutput.render` overlaps with the
+    next inference and the throughput is bounded by the slowest stage instead of the sum of all stages.
+
+    Args:
+        video_source (VideoSource): The source to capture frames from.
+        infer (Callable[[np.ndarray], Any]): Runs the model on a frame, e.g. `lambda frame: f.from_ncnn(frame, net)`.
+        annotate (Callable[[np.ndarray, Any], np.ndarray], optional): Draws the inference result on the frame.
+        video_output (VideoOutput, optional): The output to render annotated frames to. With the `overlay`
+            output option, the inference result is passed to `VideoOutput.render` and drawn by the sink.
+        metadata_output (MetadataOutput, optional): Streams the inference result of every frame with its PTS,
+            alongside or instead of `video_output`. The result must be `sv.Detections`.
+        on_result (Callable[[np.ndarray, Any], None], optional): Called with each rendered frame and its result.
+        queue_size (int): The capacity of the queue in front of every stage after capture.
+        capture_timeout (float): The capture timeout in milliseconds.
+        cpu_plan (CpuPlan, optional): Pins the capture thread to the capture CPUs, the inference thread and
+            the warm-up to the inference CPUs, and the annotation and render threads to the encode CPUs.
+    """
+
+    STAGES = ("capture", "infer", "annotate", "render")
+    STAGE_ROLES = {"capture": CAPTURE, "infer": INFERENCE, "annotate": ENCODE, "render": ENCODE}
+
+    def __init__(
+        self,
+        video_source,
+        infer: Callable[[np.ndarray], Any],
+        annotate: Optional[Callable[[np.ndarray, Any], np.ndarray]] = None,
+        video_output=None,
+        metadata_output=None,
+        on_result: Optional[Callable[[np.ndarray, Any], None]] = None,
+        queue_size: int = 2,
+        capture_timeout: float = 300,
+        cpu_plan: Optional[CpuPlan] = None,
+    ):
+        self.video_source = video_source
+        self.video_output = video_output
+        self.metadata_output = metadata_output
+        self.infer = infer
+        self.annotate = annotate
+        self.on_result = on_result
+        self.capture_timeout = capture_timeout
+        self.cpu_plan = cpu_plan
+        self.stats: Dict[str, StageStats] = {name: StageStats(name) for name in InferencePipeline.STAGES}
+        self._queues = {name: queue.Queue(maxsize=queue_size) for name in InferencePipeline.STAGES[1:]}
+        self._stop = threading.Event()
+        self._ended = threading.Event()
+        self._threads = []
+
+    def _put(self, stage: str, item: Optional[_Item]) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queues[stage].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage: str) -> Optional[_Item]:
+        while not self._stop.is_set():
+            try:
+                return self._queues[stage].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _capture(self):
+        sequence = 0
+        # capture_ex keeps the PTS of copied frames for the metadata output
+        capture = getattr(self.video_source, "capture_ex", self.video_source.capture)
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            captured = capture(timeout=self.capture_timeout)
+            if captured is None:
+                if getattr(self.video_source, "eos", False):
+                    # Lets the other stages finish the frames in flight, then stop
+                    self._ended.set()
+                    self._put("infer", None)
+                    break
+                continue
+            frame = captured if isinstance(captured, np.ndarray) else captured.array
+            lease = None if isinstance(captured, np.ndarray) else captured
+            elapsed = time.perf_counter() - start
+            self.stats["capture"].record(elapsed)
+            metrics.record_stage("capture", elapsed)
+            if not self._put("infer", _Item(sequence, frame, lease)):
+                if lease is not None:
+                    lease.release()
+                break
+            sequence += 1
+
+    def _infer(self, item: _Item):
+        item.result = self.infer(item.frame)
+
+    def _annotate(self, item: _Item):
+        if self.annotate is not None:
+            item.frame = self.annotate(item.frame, item.result)
+
+    def _render(self, item: _Item):
+        try:
+            if self.video_output is not None:
+                if getattr(self.video_output, "overlays", False):
+                    self.video_output.render(item.frame, item.result)
+                else:
+                    self.video_output.render(item.frame)
+            if self.metadata_output is not None:
+                self.metadata_output.write(item.result, item.pts, item.timestamp)
+            if self.on_result is not None:
+                self.on_result(item.frame, item.result)
+            if metrics.enabled:
+                metrics.observe("capture_to_render_seconds", time.time() - item.timestamp)
+        finally:
+            if item.lease is not None:
+                item.lease.release()
+
+    def _worker(self, stage: str, work: Callable[[_Item], None], next_stage: Optional[str]):
+        while not self._stop.is_set():
+            item = self._get(stage)
+            if item is None:
+                if next_stage is not None:
+                    self._put(next_stage, None)
+                break
+            start = time.perf_counter()
+            try:
+                work(item)
+            except Exception:
+                logger.exception("Stage %s failed on frame %s", stage, item.sequence)
+                if item.lease is not None:
+                    item.lease.release()
+                continue
+            elapsed = time.perf_counter() - start
+            self.stats[stage].record(elapsed)
+            metrics.record_stage(stage, elapsed)
+            if next_stage is not None and not self._put(next_stage, item):
+                # Stopped while the next stage was full, the item is in no queue for stop to release
+                if item.lease is not None:
+                    item.lease.release()
+                break
+
+    def prepare(self, timeout: float = 5, warmup_runs: int = 2) -> Dict[str, Optional[float]]:
+        """
+        Starts the source and output and warms up the model, so the first frame isn't slowed down by
+        start-up. Call it before `start` or `run`, e.g. before a service reports ready.
+
+        Args:
+            timeout (float): The maximum time to wait for the pipelines in seconds.
+            warmup_runs (int): The number of inferences on a blank frame of the source's shape.
+
+        Returns:
+            Dict[str, Optional[float]]: The time to the first frame, and the first and last warm-up
+                inference durations, in seconds. None if unavailable.
+        """
+        report = {"time_to_first_frame": None, "first_inference": None, "warm_inference": None}
+        if hasattr(self.video_source, "prepare"):
+            report["time_to_first_frame"] = self.video_source.prepare(timeout)
+        if self.video_output is not None and hasattr(self.video_output, "prepare"):
+            self.video_output.prepare(timeout)
+        shape = getattr(self.video_source, "frame_shape", None)
+        if warmup_runs and shape is not None:
+            if self.cpu_plan is not None:
+                # The model's thread pool is created by the first inference and inherits the CPUs
+                with self.cpu_plan.pinned(INFERENCE):
+                    durations = warmup(self.infer, shape, warmup_runs)
+            else:
+                durations = warmup(self.infer, shape, warmup_runs)
+            report["first_inference"], report["warm_inference"] = durations[0], durations[-1]
+        return report
+
+    def _pinned(self, stage: str, target: Callable, args: tuple):
+        if self.cpu_plan is not None:
+            self.cpu_plan.pin(InferencePipeline.STAGE_ROLES[stage])
+        target(*args)
+
+    def start(self):
+        """Starts the worker threads."""
+        self._stop.clear()
+        self._ended.clear()
+        workers = [
+            (self._capture, ()),
+            (self._worker, ("infer", self._infer, "annotate")),
+            (self._worker, ("annotate", self._annotate, "render")),
+            (self._worker, ("render", self._render, None)),
+        ]
+        self._threads = [
+            threading.Thread(
+                target=self._pinned, args=(name, target, args), name=f"{InferencePipeline.__name__}-{name}", daemon=True
+            )
+            for name, (target, args) in zip(InferencePipeline.STAGES, workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Started %s", InferencePipeline.__name__)
+
+    def stop(self, timeout: float = 2):
+        """Stops the worker threads and releases frames still queued."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        for stage_queue in self._queues.values():
+            while not stage_queue.empty():
+                item = stage_queue.get_nowait()
+                if item is not None and item.lease is not None:
+                    item.lease.release()
+        logger.info("Stopped %s", InferencePipeline.__name__)
+
+    def run(self, log_interval: float = 1):
+        """
+        Starts the pipeline and blocks until interrupted or the end of the stream, logging the per-stage
+        throughput.
+
+        Args:
+            log_interval (float): Seconds between throughput logs, 0 to disable.
+        """
+        self.start()
+        try:
+            while all(thread.is_alive() for thread in self._threads):
+                time.sleep(log_interval or 1)
+                if log_interval:
+                    logger.info("%s", ", ".join(repr(stats) for stats in self.stats.values()))
+            if self._ended.is_set():
+                for thread in self._threads:
+                    thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
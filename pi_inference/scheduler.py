@@ -0,0 +1,255 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import supervision as sv
+
+from . import functions as f
+from .affinity import CAPTURE, INFERENCE, CpuPlan
+from .metrics import metrics
+from .runner import StageStats, warmup
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class MultiStreamScheduler:
+    """
+    Routes frames from several `VideoSource`s through a shared pool of loaded ncnn nets.
+
+    Every stream keeps only its newest pending frame. Whenever a net is idle the pending frames are
+    dispatched earliest-deadline-first, where a frame's deadline is its capture time plus the stream's
+    latency budget, so a busy stream cannot starve the others. Frames that already missed their deadline
+    are dropped instead of being inferred late.
+
+    The model is loaded `num_nets` times for the whole process instead of once per camera. If the model
+    can infer several frames in one call, pass `batch_infer` and up to `max_batch` frames from different
+    streams are inferred together on one net.
+
+    Args:
+        sources (Dict[str, VideoSource]): The streams by name.
+        net_factory (Callable[[], Any]): Loads a net, e.g. `lambda: get_model("yolov8s", num_threads=2)`.
+        on_result (Callable[[str, FrameLease, sv.Detections], None]): Called from a worker thread with the
+            stream name, the frame and its detections. The frame is released when the callback returns.
+        num_nets (int): The number of nets loaded and run concurrently.
+        infer (Callable[[np.ndarray, Any], sv.Detections]): Runs one frame through a net.
+        batch_infer (Callable[[List[np.ndarray], Any], List[sv.Detections]], optional): Runs a batch
+            of frames through a net.
+        max_batch (int): The maximum batch size when `batch_infer` is set.
+        latency_budget (Union[float, Dict[str, float]]): The maximum age in seconds of a frame when it is
+            dispatched, for all streams or per stream name. Streams missing from the dict get
+            `DEFAULT_LATENCY_BUDGET`.
+        capture_timeout (float): The capture timeout in milliseconds.
+        cpu_plan (CpuPlan, optional): Pins the capture threads to the capture CPUs, and the inference
+            threads and the warm-up to the inference CPUs.
+    """
+
+    DEFAULT_LATENCY_BUDGET = 0.5
+
+    def __init__(
+        self,
+        sources: Dict[str, Any],
+        net_factory: Callable[[], Any],
+        on_result: Callable[[str, Any, sv.Detections], None],
+        num_nets: int = 1,
+        infer: Callable[[np.ndarray, Any], sv.Detections] = f.from_ncnn,
+        batch_infer: Optional[Callable[[List[np.ndarray], Any], List[sv.Detections]]] = None,
+        max_batch: int = 4,
+        latency_budget: Union[float, Dict[str, float]] = DEFAULT_LATENCY_BUDGET,
+        capture_timeout: float = 300,
+        cpu_plan: Optional[CpuPlan] = None,
+    ):
+        self.sources = sources
+        self.on_result = on_result
+        self.infer = infer
+        self.batch_infer = batch_infer
+        self.max_batch = max_batch
+        self.latency_budget = latency_budget
+        self.capture_timeout = capture_timeout
+        self.cpu_plan = cpu_plan
+        self.stats: Dict[str, StageStats] = {name: StageStats(name) for name in sources}
+        self.dropped: Dict[str, int] = {name: 0 for name in sources}
+
+        logger.info("Loading %s nets for %s streams", num_nets, len(sources))
+        self._nets = queue.Queue()
+        for _ in range(num_nets):
+            self._nets.put(net_factory())
+        self._idle = num_nets
+        self._executor = ThreadPoolExecutor(
+            num_nets,
+            thread_name_prefix=MultiStreamScheduler.__name__,
+            initializer=self._pin,
+            initargs=(INFERENCE,),
+        )
+        self._pending: Dict[str, Any] = {name: None for name in sources}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def budget(self, name: str) -> float:
+        if isinstance(self.latency_budget, dict):
+            return self.latency_budget.get(name, MultiStreamScheduler.DEFAULT_LATENCY_BUDGET)
+        return self.latency_budget
+
+    def _drop(self, name: str, lease):
+        # Capture threads drop replaced frames and the dispatcher drops late ones
+        with self._cond:
+            self.dropped[name] += 1
+        metrics.inc("scheduler_dropped_total", stream=name)
+        lease.release()
+
+    def _pin(self, role: str):
+        if self.cpu_plan is not None:
+            self.cpu_plan.pin(role)
+
+    def _capture(self, name: str, video_source):
+        self._pin(CAPTURE)
+        while not self._stop.is_set():
+            lease = video_source.capture_ex(timeout=self.capture_timeout)
+            if lease is None:
+                continue
+            with self._cond:
+                stale, self._pending[name] = self._pending[name], lease
+                self._cond.notify_all()
+            if stale is not None:
+                self._drop(name, stale)
+
+    def _next_batch(self) -> List[Tuple[str, Any]]:
+        # Called with the lock held, returns the pending frames to dispatch earliest-deadline-first
+        capacity = self.max_batch if self.batch_infer is not None else self._idle
+        now = time.time()
+        ready = sorted(
+            (lease.timestamp + self.budget(name), name) for name, lease in self._pending.items() if lease is not None
+        )
+        batch = []
+        for deadline, name in ready:
+            if len(batch) >= capacity:
+                break
+            lease, self._pending[name] = self._pending[name], None
+            if deadline < now:
+                self._drop(name, lease)
+                continue
+            batch.append((name, lease))
+        return batch
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            with self._cond:
+                has_work = self._cond.wait_for(
+                    lambda: self._idle > 0 and any(lease is not None for lease in self._pending.values()), timeout=0.1
+                )
+                if not has_work:
+                    continue
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                if self.batch_infer is not None:
+                    self._idle -= 1
+                    jobs = [batch]
+                else:
+                    self._idle -= len(batch)
+                    jobs = [[item] for item in batch]
+            for job in jobs:
+                self._executor.submit(self._run, job)
+
+    def _run(self, job: List[Tuple[str, Any]]):
+        net = self._nets.get()
+        try:
+            frames = [lease.array for _, lease in job]
+            start = time.perf_counter()
+            if self.batch_infer is not None:
+                results = self.batch_infer(frames, net)
+            else:
+                results = [self.infer(frames[0], net)]
+            elapsed = time.perf_counter() - start
+            for name, _ in job:
+                metrics.record_stage("infer", elapsed, stream=name)
+        except Exception:
+            logger.exception("Inference failed for %s", [name for name, _ in job])
+            results = [None] * len(job)
+        finally:
+            self._nets.put(net)
+            with self._cond:
+                self._idle += 1
+                self._cond.notify_all()
+
+        for (name, lease), detections in zip(job, results):
+            try:
+                if detections is not None:
+                    self.on_result(name, lease, detections)
+                    self.stats[name].record(lease.age)
+                    metrics.observe("capture_to_result_seconds", lease.age, stream=name)
+            except Exception:
+                logger.exception("Result callback failed for %s", name)
+            finally:
+                lease.release()
+
+    def prepare(self, timeout: float = 5, warmup_runs: int = 1) -> Dict[str, Optional[float]]:
+        """
+        Starts every source and runs inferences on a blank frame through every net, so the first frames
+        aren't slowed down by start-up.
+
+        Args:
+            timeout (float): The maximum time to wait for each source in seconds.
+            warmup_runs (int): The number of warm-up inferences per net.
+
+        Returns:
+            Dict[str, Optional[float]]: The time to the first frame of every stream in seconds, None on timeout.
+        """
+        report = {name: video_source.prepare(timeout) for name, video_source in self.sources.items()}
+        shape = next((source.frame_shape for source in self.sources.values() if source.frame_shape), None)
+        if warmup_runs and shape is not None:
+            nets = [self._nets.get() for _ in range(self._nets.qsize())]
+            try:
+                # Warm up on the inference threads, so the model's thread pools start on their CPUs
+                warmups = []
+                for net in nets:
+                    if self.batch_infer is not None:
+                        infer = lambda frame, net=net: self.batch_infer([frame], net)
+                    else:
+                        infer = lambda frame, net=net: self.infer(frame, net)
+                    warmups.append(self._executor.submit(warmup, infer, shape, warmup_runs))
+                for future in warmups:
+                    future.result()
+            finally:
+                for net in nets:
+                    self._nets.put(net)
+        return report
+
+    def start(self):
+        """Starts one capture thread per stream and the dispatcher."""
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture, args=(name, video_source), name=f"capture-{name}", daemon=True)
+            for name, video_source in self.sources.items()
+        ]
+        self._threads.append(threading.Thread(target=self._dispatch, name="dispatch", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info("Started %s with %s streams", MultiStreamScheduler.__name__, len(self.sources))
+
+    def stop(self, timeout: float = 2):
+        """Stops the threads, waits for running inferences and releases pending frames."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        with self._cond:
+            pending = [lease for lease in self._pending.values() if lease is not None]
+            self._pending = {name: None for name in self.sources}
+        for lease in pending:
+            lease.release()
+        logger.info("Stopped %s", MultiStreamScheduler.__name__)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the per-stream inference rate, mean capture-to-result latency and dropped frames.
+        """
+        return {
+            name: {"fps": stats.fps, "latency": stats.latency, "dropped": self.dropped[name]}
+            for name, stats in self.stats.items()
+        }
@@ -1,24 +1,103 @@
 import logging
+from typing import TYPE_CHECKING, List, Optional, Sequence, Union
 
 import numpy as np
 
 from .factory import PipelineFactory
+from .metadata import MetadataOutput
+
+if TYPE_CHECKING:
+    import supervision as sv
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
 class VideoOutput:
-    def __init__(self, output: str, options: dict):
+    """
+    Renders frames to one output URI, or to a list of URIs sharing one conversion and encode.
+    """
+
+    def __init__(self, output: Union[str, List[str]], options: dict):
         self.output = output
         self.initialized = False
         self.pipeline = PipelineFactory.make(output, options)
+        self.pipeline.label = str(output)
 
     def on_terminate(self):
         self.pipeline.terminate()
 
-    def render(self, frame: np.ndarray):
+    def start(self):
         if not self.initialized:
             self.initialized = True
             self.pipeline.start()
-        self.pipeline.on_frame(frame)
+
+    def prepare(self, timeout: float = 5, blank_frames: int = 0) -> bool:
+        """
+        Starts the pipeline ahead of the first `render`.
+
+        Args:
+            timeout (float): The maximum time to wait for the pipeline in seconds.
+            blank_frames (int): The number of zero-filled frames to render, so the encoder initializes before the
+                first real frame. They appear at the start of the output.
+
+        Returns:
+            bool: False if the pipeline failed or timed out.
+        """
+        prepared = self.pipeline.prepare(timeout)
+        self.start()
+        for _ in range(blank_frames):
+            frame = self.pipeline.acquire_frame()
+            frame.fill(0)
+            self.pipeline.on_frame(frame)
+        return prepared
+
+    def acquire_frame(self) -> np.ndarray:
+        """
+        Returns a writable frame backed by the next Gst buffer. Draw into it and pass it to `render` to push
+        it without a copy, or give it back with `release_frame`.
+        """
+        return self.pipeline.acquire_frame()
+
+    def release_frame(self, frame: np.ndarray):
+        self.pipeline.release_frame(frame)
+
+    @property
+    def overlays(self) -> bool:
+        """True if the pipeline draws the detections passed to `render` with the `overlay` option."""
+        overlay = getattr(self.pipeline, "overlay", None)
+        return overlay is not None and overlay.boxes
+
+    def render(
+        self,
+        frame: np.ndarray,
+        detections: Optional[Union["sv.Detections", np.ndarray]] = None,
+        labels: Optional[Sequence[str]] = None,
+    ):
+        """
+        Pushes a frame.
+
+        Args:
+            frame (np.ndarray): The frame.
+            detections (Union[sv.Detections, np.ndarray], optional): The detections the overlay draws on this
+                frame, see `Overlay`. Ignored without the `overlay` option.
+            labels (Sequence[str], optional): The label of every detection.
+        """
+        self.start()
+        self.pipeline.on_frame(frame, detections, labels)
+
+    async def render_async(
+        self,
+        frame: np.ndarray,
+        detections: Optional[Union["sv.Detections", np.ndarray]] = None,
+        labels: Optional[Sequence[str]] = None,
+    ):
+        """
+        Pushes a frame once appsrc signals it needs data, without blocking the event loop.
+        """
+        self.start()
+        await self.pipeline.wait_ready()
+        self.pipeline.on_frame(frame, detections, labels)
+
+
+__all__ = ["VideoOutput", "MetadataOutput"]
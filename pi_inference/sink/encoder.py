@@ -0,0 +1,163 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from .. import functions as f
+from ..gst import Gst
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Named encoder profiles. keyframe-interval is in seconds, bitrate in kbit/s.
+ENCODER_PROFILES: Dict[str, dict] = {
+    "low-latency": {
+        "encoders": ["v4l2h264enc", "x264enc", "openh264enc"],
+        "speed": "ultrafast",
+        "tune": "zerolatency",
+        "rate-control": "cbr",
+        "bitrate": 2000,
+        "keyframe-interval": 1,
+        "bframes": 0,
+        "lookahead": 0,
+        "threads": 2,
+    },
+    "balanced": {
+        "encoders": ["v4l2h264enc", "x264enc", "openh264enc"],
+        "speed": "veryfast",
+        "tune": "zerolatency",
+        "rate-control": "vbr",
+        "bitrate": 4000,
+        "keyframe-interval": 2,
+        "bframes": 0,
+        "lookahead": 10,
+        "threads": 0,
+    },
+    "archival": {
+        "encoders": ["x264enc", "openh264enc", "v4l2h264enc"],
+        "speed": "medium",
+        "tune": None,
+        "rate-control": "quality",
+        "bitrate": 8000,
+        "keyframe-interval": 10,
+        "bframes": 3,
+        "lookahead": 40,
+        "threads": 0,
+    },
+}
+
+CODECS = {"x264enc": "H264", "openh264enc": "H264", "v4l2h264enc": "H264", "jpegenc": "JPEG"}
+
+
+def is_available(element_name: str) -> bool:
+    """
+    Checks if a GStreamer element is installed.
+
+    Args:
+        element_name (str): The name of the element factory.
+
+    Returns:
+        bool: True if the element can be created.
+    """
+    return Gst.ElementFactory.find(element_name) is not None
+
+
+def encoder_properties(encoder: str, profile: dict, framerate: int) -> Dict[str, Optional[str]]:
+    """
+    Maps the settings of a profile onto the properties of an encoder element.
+
+    Args:
+        encoder (str): The name of the encoder element.
+        profile (dict): The profile settings, see `ENCODER_PROFILES`.
+        framerate (int): The output framerate, to convert the keyframe interval to frames.
+
+    Returns:
+        Dict[str, Optional[str]]: The property values as strings, None values are left at their defaults.
+    """
+    bitrate = int(profile["bitrate"])
+    keyframes = max(1, int(float(profile["keyframe-interval"]) * framerate))
+    threads = int(profile["threads"])
+    if encoder == "x264enc":
+        rate_control = {"cbr": "cbr", "vbr": "pass1", "quality": "qual"}[profile["rate-control"]]
+        return {
+            "speed-preset": profile["speed"],
+            "tune": profile["tune"],
+            "pass": rate_control,
+            "bitrate": str(bitrate),
+            "key-int-max": str(keyframes),
+            "bframes": str(profile["bframes"]),
+            "rc-lookahead": str(profile["lookahead"]),
+            "threads": str(threads),
+            "sliced-threads": "true" if profile["tune"] == "zerolatency" else None,
+        }
+    if encoder == "openh264enc":
+        rate_control = {"cbr": "bitrate", "vbr": "buffer", "quality": "quality"}[profile["rate-control"]]
+        return {
+            "rate-control": rate_control,
+            "bitrate": str(bitrate * 1000),
+            "gop-size": str(keyframes),
+            "complexity": "low" if profile["speed"] in ("ultrafast", "superfast", "veryfast") else "medium",
+            "multi-thread": str(threads),
+        }
+    if encoder == "v4l2h264enc":
+        return {
+            "extra-controls": f"controls,video_bitrate={bitrate * 1000},h264_i_frame_period={keyframes}",
+        }
+    if encoder == "jpegenc":
+        return {"quality": "70" if profile["speed"] in ("ultrafast", "superfast") else "85"}
+    return {}
+
+
+def make_encoder(options: dict, framerate: int, codecs: Tuple[str, ...] = ("H264",)) -> Tuple[List[Gst.Element], str]:
+    """
+    Creates the encoder elements for the `encoder-profile` option, falling back to the next encoder of the
+    profile when an element isn't installed or can't be created.
+
+    Options:
+        encoder-profile (str): low-latency, balanced or archival. Without it a bare x264enc is used.
+        encoder (str): The encoder element to prefer, e.g. openh264enc or jpegenc.
+        bitrate (int): Overrides the profile bitrate in kbit/s.
+        keyframe-interval (float): Overrides the profile keyframe interval in seconds.
+        encoder-threads (int): Overrides the profile thread count, 0 for automatic.
+
+    Args:
+        options (dict): The output options.
+        framerate (int): The output framerate.
+        codecs (Tuple[str, ...]): The codecs the rest of the sink can handle.
+
+    Returns:
+        Tuple[List[Gst.Element], str]: The encoder followed by its parser if any, and the codec name.
+    """
+    profile_name = options.get("encoder-profile")
+    if profile_name is None and options.get("encoder") is None:
+        encoder = f.make_element("x264enc")
+        if options.get("encoder-threads") is not None:
+            encoder.set_property("threads", int(options["encoder-threads"]))
+        return [encoder], "H264"
+    if profile_name is not None and profile_name not in ENCODER_PROFILES:
+        raise ValueError(f"Encoder profile {profile_name} not supported, expected one of {list(ENCODER_PROFILES)}")
+
+    profile = dict(ENCODER_PROFILES[profile_name or "balanced"])
+    for key in ("bitrate", "keyframe-interval"):
+        if options.get(key) is not None:
+            profile[key] = options[key]
+    if options.get("encoder-threads") is not None:
+        profile["threads"] = options["encoder-threads"]
+
+    preferred = [options["encoder"]] if options.get("encoder") else []
+    candidates = [name for name in preferred + profile["encoders"] if CODECS.get(name) in codecs]
+    for name in dict.fromkeys(candidates):
+        # An installed element can still fail to create, e.g. a hardware encoder without its device
+        encoder = Gst.ElementFactory.make(name, name) if is_available(name) else None
+        if encoder is None:
+            logger.info("Encoder %s not available", name)
+            continue
+        for key, value in encoder_properties(name, profile, framerate).items():
+            if value is not None:
+                Gst.util_set_object_arg(encoder, key, value)
+        logger.info("Using %s with %s profile", name, profile_name or "balanced")
+        codec = CODECS[name]
+        elements = [encoder]
+        if codec == "H264":
+            elements.append(f.make_element("h264parse"))
+        return elements, codec
+
+    raise NotImplementedError(f"None of the encoders {candidates} are available")
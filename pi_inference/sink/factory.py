@@ -1,34 +1,70 @@
+import importlib
 import logging
-from typing import Dict, Type
+from typing import TYPE_CHECKING, Dict, List, Type, Union
 
-from .pipeline import (
-    AppSrcPipeline,
-    DisplaySinkPipeline,
-    FileSinkPipeline,
-    RtspSinkPipeline,
-    TcpServerSinkPipeline,
-)
+from ..affinity import ENCODE, CpuPlan
+
+if TYPE_CHECKING:
+    from .pipeline import AppSrcPipeline
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
 class PipelineFactory:
+    # Backends are imported by "module:class" when their URI scheme is first requested
+    pipeline_classes: Dict[str, Union[str, Type["AppSrcPipeline"]]] = {
+        "rtsp://": ".pipeline:RtspSinkPipeline",
+        "tcp://": ".pipeline:TcpServerSinkPipeline",
+        "file://": ".pipeline:FileSinkPipeline",
+        "display://": ".pipeline:DisplaySinkPipeline",
+        "null://": ".pipeline:NullSinkPipeline",
+    }
+
     @classmethod
-    def make(cls, output: str, options) -> AppSrcPipeline:
-        pipeline_classes: Dict[str, Type[AppSrcPipeline]] = {
-            "rtsp://": RtspSinkPipeline,
-            "tcp://": TcpServerSinkPipeline,
-            "file://": FileSinkPipeline,
-            "display://": DisplaySinkPipeline,
-        }
-
-        for prefix, pipeline_class in pipeline_classes.items():
-            if output.startswith(prefix):
-                logger.info("Creating %s", pipeline_class.__name__)
-                pipeline = pipeline_class()
-                pipeline.create(output, options)
-                logger.info("Creating %s [DONE]", pipeline_class.__name__)
-                return pipeline
+    def register(cls, prefix: str, pipeline_class: Union[str, Type["AppSrcPipeline"]]):
+        """
+        Adds an output backend.
 
+        Args:
+            prefix (str): The URI scheme, e.g. "srt://".
+            pipeline_class (Union[str, Type[AppSrcPipeline]]): The pipeline class, or "package.module:Class"
+                to import it on first use. Module names starting with a dot are relative to this package.
+        """
+        cls.pipeline_classes[prefix] = pipeline_class
+
+    @classmethod
+    def find(cls, output: str) -> Type["AppSrcPipeline"]:
+        for prefix, pipeline_class in cls.pipeline_classes.items():
+            if not output.startswith(prefix):
+                continue
+            if isinstance(pipeline_class, str):
+                module_name, class_name = pipeline_class.split(":")
+                module = importlib.import_module(module_name, __package__)
+                pipeline_class = cls.pipeline_classes[prefix] = getattr(module, class_name)
+            return pipeline_class
         raise NotImplementedError(f"Output {output} not supported")
+
+    @classmethod
+    def make(cls, output: Union[str, List[str]], options) -> "AppSrcPipeline":
+        if not isinstance(output, str) and len(output) == 1:
+            output = output[0]
+
+        if isinstance(output, str):
+            pipeline_class = cls.find(output)
+            logger.info("Creating %s", pipeline_class.__name__)
+            pipeline = pipeline_class()
+        else:
+            from .pipeline import TeeSinkPipeline
+
+            logger.info("Creating %s for %s outputs", TeeSinkPipeline.__name__, len(output))
+            pipeline_class = TeeSinkPipeline
+            pipeline = TeeSinkPipeline([(uri, cls.find(uri)) for uri in output])
+        plan = CpuPlan.from_options(options)
+        if plan is not None:
+            options = plan.thread_options(options, ENCODE)
+        pipeline.create(output, options)
+        if plan is not None:
+            pipeline.set_cpu_plan(plan, ENCODE)
+        logger.info("Creating %s [DONE]", pipeline_class.__name__)
+        return pipeline
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ..metrics import metrics
+
+if TYPE_CHECKING:
+    import supervision as sv
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+JSONL = "jsonl"
+BINARY = "binary"
+
+# Binary record: magic, version, PTS in nanoseconds (-1 if unknown), wall-clock timestamp, detection count,
+# followed by one DETECTION per detection, all little-endian
+HEADER = struct.Struct("<2sHqdI")
+MAGIC = b"PD"
+VERSION = 1
+DETECTION = np.dtype(
+    [
+        ("x0", "<f4"),
+        ("y0", "<f4"),
+        ("x1", "<f4"),
+        ("y1", "<f4"),
+        ("score", "<f4"),
+        ("class_id", "<i4"),
+        ("tracker_id", "<i4"),
+    ]
+)
+
+
+def to_records(detections: Optional["sv.Detections"]) -> np.ndarray:
+    """
+    Packs detections into DETECTION records. Missing scores are NaN, missing class and tracker ids -1.
+
+    Args:
+        detections (sv.Detections, optional): The detections, None for a frame without detections.
+
+    Returns:
+        np.ndarray: The (N,) DETECTION records.
+    """
+    if detections is None or len(detections) == 0:
+        return np.empty(0, dtype=DETECTION)
+    records = np.empty(len(detections), dtype=DETECTION)
+    xyxy = np.asarray(detections.xyxy, dtype=np.float32)
+    for i, name in enumerate(("x0", "y0", "x1", "y1")):
+        records[name] = xyxy[:, i]
+    records["score"] = np.nan if detections.confidence is None else detections.confidence
+    records["class_id"] = -1 if detections.class_id is None else detections.class_id
+    records["tracker_id"] = -1 if detections.tracker_id is None else detections.tracker_id
+    return records
+
+
+def encode_binary(pts: Optional[int], timestamp: float, detections: Optional["sv.Detections"]) -> bytes:
+    records = to_records(detections)
+    return HEADER.pack(MAGIC, VERSION, -1 if pts is None else pts, timestamp, len(records)) + records.tobytes()
+
+
+def encode_jsonl(pts: Optional[int], timestamp: float, detections: Optional["sv.Detections"]) -> bytes:
+    records = to_records(detections)
+    scores = records["score"].round(3)
+    record = {
+        "pts": pts,
+        "timestamp": round(timestamp, 6),
+        "boxes": np.stack([records[name] for name in ("x0", "y0", "x1", "y1")], axis=1).round(1).tolist(),
+        "classes": records["class_id"].tolist(),
+        # NaN isn't valid JSON, so missing scores are null
+        "scores": [None if np.isnan(score) else score for score in scores.tolist()],
+        "tracker_ids": records["tracker_id"].tolist(),
+    }
+    names = detections.data.get("class_name") if detections is not None and len(detections) else None
+    if names is not None:
+        record["names"] = [str(name) for name in names]
+    return json.dumps(record, separators=(",", ":"), allow_nan=False).encode() + b"\n"
+
+
+ENCODERS = {JSONL: encode_jsonl, BINARY: encode_binary}
+
+
+def read_binary(stream: BinaryIO) -> Iterator[dict]:
+    """
+    Reads the records of a binary metadata stream until it ends.
+
+    Args:
+        stream (BinaryIO): A file or a socket's `makefile("rb")`.
+
+    Yields:
+        dict: The pts (None if unknown), timestamp and DETECTION records of every frame.
+    """
+    while True:
+        header = stream.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        magic, version, pts, timestamp, count = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a metadata record: {magic!r} version {version}")
+        size = count * DETECTION.itemsize
+        data = stream.read(size)
+        if len(data) < size:
+            return
+        yield {"pts": None if pts < 0 else pts, "timestamp": timestamp, "detections": np.frombuffer(data, DETECTION)}
+
+
+class _FileWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "ab")
+        logger.info("Saving metadata @ %s", path)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ServerWriter:
+    """
+    Streams to every client connected to a TCP or Unix socket. Clients that connect late start at the next
+    batch, and clients too slow to take a batch within `timeout` are disconnected.
+    """
+
+    def __init__(self, server: socket.socket, address: str, timeout: float):
+        self.server = server
+        self.server.setblocking(False)
+        self.server.listen()
+        self.address = address
+        self.timeout = timeout
+        self.clients: List[socket.socket] = []
+        logger.info("Streaming metadata @ %s", address)
+
+    def accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client.settimeout(self.timeout)
+            self.clients.append(client)
+            logger.info("Metadata client connected to %s", self.address)
+
+    def write(self, data: bytes):
+        self.accept()
+        for client in list(self.clients):
+            try:
+                client.sendall(data)
+            except OSError as e:
+                logger.warning("Disconnecting metadata client of %s: %s", self.address, e)
+                self.clients.remove(client)
+                client.close()
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self.server.close()
+
+
+class MetadataOutput:
+    """
+    Streams the detections of every frame without video, so headless nodes don't encode frames at all.
+
+    Records are encoded on the caller's thread and written in batches by a writer thread. At most
+    `metadata-queue-size` records wait for the writer; when it falls behind, the oldest are dropped.
+
+    Outputs:
+        file:///path/detections.jsonl: Appends to a file.
+        tcp://127.0.0.1:9200: Listens on a TCP socket and streams to every connected client.
+        unix:///tmp/detections.sock: Listens on a Unix socket and streams to every connected client.
+
+    Options:
+        metadata-format (str): jsonl (default), one JSON object per line, or binary, fixed-size records
+            read with `read_binary`.
+        metadata-batch-size (int): The number of records written at once, defaults to 32.
+        metadata-flush-interval (float): The maximum time in seconds a record waits for its batch to fill,
+            defaults to 0.1.
+        metadata-queue-size (int): The maximum number of records waiting to be written, defaults to 256.
+        metadata-timeout (float): The time in seconds a socket client has to take a batch, defaults to 1.
+
+    Args:
+        output (str): The output URI.
+        options (dict): The output options.
+    """
+
+    def __init__(self, output: str, options: dict):
+        self.output = output
+        self.format = options.get("metadata-format", JSONL)
+        if self.format not in ENCODERS:
+            raise ValueError(f"Metadata format {self.format} not supported, use one of {list(ENCODERS)}")
+        self.encode = ENCODERS[self.format]
+        self.batch_size = int(options.get("metadata-batch-size", 32))
+        self.flush_interval = float(options.get("metadata-flush-interval", 0.1))
+        self.dropped = 0
+        self._pending = deque(maxlen=int(options.get("metadata-queue-size", 256)))
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = self._open(output, float(options.get("metadata-timeout", 1)))
+        self._thread = threading.Thread(target=self._run, name=MetadataOutput.__name__, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _open(output: str, timeout: float):
+        if output.startswith("file://"):
+            return _FileWriter(output.replace("file://", ""))
+        if output.startswith("tcp://"):
+            # Parsed without GStreamer, which a metadata-only node doesn't need to load
+            address = urlsplit(output)
+            if address.port is None:
+                raise ValueError(f"Metadata output {output} has no port, e.g. tcp://127.0.0.1:9200")
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((address.hostname or "127.0.0.1", address.port))
+            return _ServerWriter(server, output, timeout)
+        if output.startswith("unix://"):
+            path = output.replace("unix://", "")
+            if os.path.exists(path):
+                os.unlink(path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            return _ServerWriter(server, output, timeout)
+        raise NotImplementedError(f"Metadata output {output} not supported")
+
+    def write(
+        self,
+        detections: Optional["sv.Detections"],
+        pts: Optional[int] = None,
+        timestamp: Optional[float] = None,
+    ):
+        """
+        Queues the detections of a frame.
+
+        Args:
+            detections (sv.Detections, optional): The detections, None or empty for a frame without any.
+            pts (int, optional): The presentation timestamp of the frame in nanoseconds.
+            timestamp (float, optional): The capture time of the frame, defaults to now.
+        """
+        data = self.encode(pts, time.time() if timestamp is None else timestamp, detections)
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+                metrics.inc("metadata_dropped_total")
+            self._pending.append(data)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    if not self._closed and len(self._pending) < self.batch_size:
+                        self._condition.wait(self.flush_interval)
+                    batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.batch_size))]
+                    closed = self._closed and not self._pending
+                if batch:
+                    try:
+                        self._writer.write(b"".join(batch))
+                    except OSError:
+                        logger.exception("Failed to write metadata to %s", self.output)
+                if closed:
+                    break
+        finally:
+            # Closed by the writer thread, so a write in progress never hits a closed output
+            self._writer.close()
+
+    def on_terminate(self, timeout: float = 5):
+        """
+        Writes the queued records and closes the output. If they aren't written within `timeout` seconds,
+        the writer thread closes the output once it is done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Metadata for %s still writing after %ss, closing when done", self.output, timeout)
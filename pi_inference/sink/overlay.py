@@ -0,0 +1,162 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .. import functions as f
+from ..gst import Gst
+
+if TYPE_CHECKING:
+    import supervision as sv
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# RGB colors per class id, from the supervision default palette
+PALETTE = (
+    (0xA3, 0x51, 0xFB),
+    (0xE6, 0x19, 0x4B),
+    (0x3C, 0xB4, 0x4B),
+    (0xFF, 0xE1, 0x19),
+    (0x43, 0x63, 0xD8),
+    (0xF5, 0x82, 0x31),
+    (0x91, 0x1E, 0xB4),
+    (0x46, 0xF0, 0xF0),
+)
+
+Annotations = Tuple[np.ndarray, np.ndarray, List[str]]
+
+
+def to_annotations(
+    detections: Union["sv.Detections", np.ndarray], labels: Optional[Sequence[str]] = None
+) -> Annotations:
+    """
+    Converts detections to the boxes, class ids and labels the overlay draws.
+
+    Args:
+        detections (Union[sv.Detections, np.ndarray]): The detections, or an (N, 4) array of xyxy boxes.
+        labels (Sequence[str], optional): The label of every box. By default the class name and confidence
+            of `sv.Detections`, and no labels for plain boxes.
+
+    Returns:
+        Annotations: The (N, 4) boxes, the (N,) class ids and the labels.
+    """
+    if isinstance(detections, np.ndarray):
+        xyxy = detections.reshape(-1, 4)
+        class_id = np.zeros(len(xyxy), dtype=int)
+        return xyxy, class_id, list(labels) if labels is not None else [""] * len(xyxy)
+
+    xyxy = detections.xyxy
+    class_id = detections.class_id if detections.class_id is not None else np.zeros(len(xyxy), dtype=int)
+    if labels is None:
+        names = detections.data.get("class_name")
+        confidence = detections.confidence
+        labels = []
+        for i in range(len(xyxy)):
+            parts = []
+            if names is not None:
+                parts.append(str(names[i]))
+            if confidence is not None:
+                parts.append(f"{confidence[i]:.2f}")
+            labels.append(" ".join(parts))
+    return xyxy, class_id, list(labels)
+
+
+class Overlay:
+    """
+    Draws boxes, labels and the clock in the sink's streaming thread with cairooverlay and clockoverlay,
+    so Python doesn't touch the pixels of rendered frames.
+
+    The annotations of a frame are stored by the PTS of its buffer when it is pushed, and drawn when the
+    buffer reaches the overlay.
+
+    Options:
+        overlay (bool): Draw the detections passed to `VideoOutput.render`.
+        overlay-clock (bool): Draw the wall-clock time in the top left corner.
+        overlay-line-width (float): The box line width in pixels, defaults to 2.
+        overlay-font-size (float): The label font size in pixels, defaults to 14.
+
+    Args:
+        options (dict): The output options.
+    """
+
+    # Annotations kept for buffers not drawn yet
+    MAX_PENDING = 32
+
+    def __init__(self, options: dict):
+        self.boxes = f.to_bool(options.get("overlay", False))
+        self.clock = f.to_bool(options.get("overlay-clock", False))
+        self.line_width = float(options.get("overlay-line-width", 2))
+        self.font_size = float(options.get("overlay-font-size", 14))
+        self._pending: "OrderedDict[int, Annotations]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.boxes or self.clock
+
+    def make_elements(self, options: dict) -> List[Gst.Element]:
+        """
+        Creates the overlay elements, linked right after appsrc so they run in its streaming thread.
+
+        Returns:
+            List[Gst.Element]: The elements to link in order, empty if the overlay is disabled.
+        """
+        elements = []
+        if self.boxes:
+            import gi
+
+            # cairooverlay hands the draw callback a cairo context, which needs pycairo
+            gi.require_foreign("cairo")
+            cairooverlay = f.make_element("cairooverlay")
+            cairooverlay.connect("draw", self.on_draw)
+            elements += [f.make_converter(options, name="overlay_convert"), cairooverlay]
+        if self.clock:
+            clockoverlay = f.make_element("clockoverlay")
+            clockoverlay.set_property("time-format", "%d/%m/%Y %H:%M:%S")
+            Gst.util_set_object_arg(clockoverlay, "halignment", "left")
+            Gst.util_set_object_arg(clockoverlay, "valignment", "top")
+            clockoverlay.set_property("shaded-background", True)
+            elements.append(clockoverlay)
+        return elements
+
+    def add(self, pts: int, detections: Union["sv.Detections", np.ndarray], labels: Optional[Sequence[str]] = None):
+        """
+        Stores the annotations of the buffer with the given PTS.
+        """
+        if not self.boxes:
+            return
+        annotations = to_annotations(detections, labels)
+        with self._lock:
+            self._pending[pts] = annotations
+            while len(self._pending) > Overlay.MAX_PENDING:
+                self._pending.popitem(last=False)
+
+    def on_draw(self, overlay, context, timestamp, duration):
+        with self._lock:
+            annotations = self._pending.pop(timestamp, None)
+            # Buffers are drawn in order, so older annotations belong to dropped buffers
+            while self._pending and next(iter(self._pending)) < timestamp:
+                self._pending.popitem(last=False)
+        if annotations is None or len(annotations[0]) == 0:
+            return
+        xyxy, class_id, labels = annotations
+        context.set_line_width(self.line_width)
+        context.set_font_size(self.font_size)
+        for (x0, y0, x1, y1), cls, label in zip(xyxy.tolist(), class_id.tolist(), labels):
+            red, green, blue = (channel / 255 for channel in PALETTE[cls % len(PALETTE)])
+            context.set_source_rgb(red, green, blue)
+            context.rectangle(x0, y0, x1 - x0, y1 - y0)
+            context.stroke()
+            if not label:
+                continue
+            extents = context.text_extents(label)
+            padding = 3
+            top = max(0, y0 - extents.height - 2 * padding)
+            context.rectangle(x0, top, extents.x_advance + 2 * padding, extents.height + 2 * padding)
+            context.fill()
+            context.set_source_rgb(1, 1, 1)
+            context.move_to(x0 + padding, top + padding + extents.height)
+            context.show_text(label)
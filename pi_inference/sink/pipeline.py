@@ -1,132 +1,392 @@
+import asyncio
+import itertools
 import logging
 import threading
+from abc import abstractmethod
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
 
-import gi
 import numpy as np
 from typing_extensions import override
 
-gi.require_version("Gst", "1.0")
-from gi.repository import Gst
-
 from .. import functions as f
 from ..common import GstPipeline
+from ..gst import Gst
+from .encoder import make_encoder
+from .overlay import Overlay
+
+if TYPE_CHECKING:
+    import supervision as sv
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
-Gst.init(None)
 
 
 class AppSrcPipeline(GstPipeline):
+    """
+    Pushes frames into the pipeline through appsrc.
+
+    Options:
+        buffer-pool (int): The minimum number of buffers in the GstBufferPool frames are written into,
+            0 to wrap a copy of every frame in a new buffer instead.
+        timestamp (str): running-time (default) stamps buffers with the pipeline running time when pushed,
+            frame-counter stamps them from the frame count and framerate for evenly spaced output.
+        format (str): The pixel format of the rendered frames, RGB (default), BGR, BGRx, NV12 or GRAY8.
+            Drawing with OpenCV on BGR frames avoids a channel swap before rendering.
+        convert-threads (int): The number of threads videoconvert uses, 0 for one per core.
+
+    See `Overlay` for the options that draw detections and the clock in the pipeline.
+    """
+
+    RUNNING_TIME = "running-time"
+    FRAME_COUNTER = "frame-counter"
+    # The codecs the branch consumes, None for branches that take raw video
+    CODECS: Optional[Tuple[str, ...]] = None
+
     def __init__(self) -> None:
         super().__init__(pipeline_name=AppSrcPipeline.__name__)
         self.appsrc = f.make_element("appsrc")
         self.appsrc.set_property("is-live", True)
         self.appsrc.set_property("block", True)
         self.appsrc.set_property("format", Gst.Format.TIME)
+        self.appsrc.connect("need-data", self.on_need_data)
+        self.appsrc.connect("enough-data", self.on_enough_data)
+        self.accepting = True
+        self._waiters = []
+        self._lock = threading.Lock()
+        self.frame_shape = None
+        self.frame_strides = None
+        self.frame_size = 0
+        self.framerate = 30
+        self.frame_duration = Gst.CLOCK_TIME_NONE
+        self.frame_count = 0
+        self.timestamp = AppSrcPipeline.RUNNING_TIME
+        self.buffer_pool = None
+        self.overlay = None
+        self._leased = {}
+
+    def on_need_data(self, appsrc, length):
+        with self._lock:
+            self.accepting = True
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(AppSrcPipeline._resolve, future)
+
+    def on_enough_data(self, appsrc):
+        with self._lock:
+            self.accepting = False
 
-    def on_frame(self, frame: np.ndarray):
-        buffer = Gst.Buffer.new_wrapped(frame.tobytes())
-        buffer.pts = self.appsrc.get_current_running_time()
+    @staticmethod
+    def _resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    async def wait_ready(self):
+        """
+        Awaits until appsrc has room for another buffer, resolved from the need-data signal.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.accepting:
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        await future
+
+    @classmethod
+    @abstractmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
+        """
+        Creates the elements after the encoder, or after appsrc for raw branches.
+
+        Args:
+            resource_uri (str): The output URI.
+            options (dict): The output options.
+            codec (str, optional): The codec of the encoded stream, None for raw branches.
+
+        Returns:
+            List[Gst.Element]: The elements to link in order.
+        """
+
+    @override
+    def create(self, resource_uri: str, options: dict):
+        self.configure_caps(options)
+        self.overlay = Overlay(options)
+        elements = [self.appsrc, *self.overlay.make_elements(options)]
+        codec = None
+        if self.CODECS:
+            encoders, codec = make_encoder(options, self.framerate, codecs=self.CODECS)
+            elements += [f.make_converter(options), *encoders]
+        elements += self.make_branch(resource_uri, options, codec)
+        f.add_elements(self.pipeline, elements)
+        f.link_elements(elements)
+
+    def configure_caps(self, options: dict):
+        """
+        Sets the appsrc caps from the output options and creates the buffer pool for frames of that size.
+        """
+        width = int(options.get("output-width") or options.get("width") or 1280)
+        height = int(options.get("output-height") or options.get("height") or 720)
+        framerate = int(options.get("framerate", 30))
+        format = options.get("format", "RGB")
+        self.frame_shape, self.frame_strides, self.frame_size = f.frame_layout(format, width, height)
+        caps = Gst.Caps.from_string(
+            f"video/x-raw,format={format},width={width},height={height},framerate={framerate}/1"
+        )
+        self.appsrc.set_property("caps", caps)
+
+        self.framerate = framerate
+        self.frame_duration = Gst.util_uint64_scale_int(Gst.SECOND, 1, framerate)
+        self.timestamp = options.get("timestamp", AppSrcPipeline.RUNNING_TIME)
+        if self.timestamp not in (AppSrcPipeline.RUNNING_TIME, AppSrcPipeline.FRAME_COUNTER):
+            raise ValueError(f"Timestamp mode {self.timestamp} not supported")
+
+        pool_size = int(options.get("buffer-pool", 4))
+        if pool_size > 0:
+            self.buffer_pool = Gst.BufferPool.new()
+            config = self.buffer_pool.get_config()
+            Gst.BufferPool.config_set_params(config, caps, self.frame_size, pool_size, 0)
+            self.buffer_pool.set_config(config)
+            self.buffer_pool.set_active(True)
+
+    def map_buffer(self):
+        """
+        Acquires a buffer from the pool and maps it writable as a frame.
+
+        Returns:
+            Optional[Tuple[Gst.Buffer, Gst.MapInfo, np.ndarray]]: The buffer, its mapping and the frame view,
+                or None if no writable pooled buffer is available.
+        """
+        if self.buffer_pool is None:
+            return None
+        result, buffer = self.buffer_pool.acquire_buffer(None)
+        if result != Gst.FlowReturn.OK:
+            logger.warning("Failed to acquire buffer: %s", result)
+            return None
+        success, map_info = buffer.map(Gst.MapFlags.WRITE)
+        if not success:
+            return None
+        frame = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=map_info.data, strides=self.frame_strides)
+        if not frame.flags.writeable:
+            logger.warning("Gst buffers are not writable from Python, disabling the buffer pool")
+            buffer.unmap(map_info)
+            self.buffer_pool = None
+            return None
+        return buffer, map_info, frame
+
+    def acquire_frame(self) -> np.ndarray:
+        """
+        Returns a frame backed by a pooled Gst buffer. Drawing into it and passing it to `on_frame` pushes
+        the buffer without copying. The buffer is held until the frame is pushed or `release_frame` is called.
+
+        Returns:
+            np.ndarray: The writable frame, a plain array if the buffer pool is unavailable.
+        """
+        mapped = self.map_buffer()
+        if mapped is None:
+            return np.empty(self.frame_shape, dtype=np.uint8)
+        buffer, map_info, frame = mapped
+        self._leased[frame.ctypes.data] = (buffer, map_info)
+        return frame
+
+    def release_frame(self, frame: np.ndarray):
+        """Returns a frame from `acquire_frame` to the pool without pushing it."""
+        leased = self._leased.pop(frame.ctypes.data, None)
+        if leased is not None:
+            buffer, map_info = leased
+            buffer.unmap(map_info)
+
+    def make_buffer(self, frame: np.ndarray) -> Gst.Buffer:
+        leased = self._leased.pop(frame.ctypes.data, None) if self._leased else None
+        if leased is not None:
+            buffer, map_info = leased
+            buffer.unmap(map_info)
+            return buffer
+
+        mapped = self.map_buffer()
+        if mapped is None:
+            # Pad the rows to the stride GStreamer expects
+            data = np.zeros(self.frame_size, dtype=np.uint8)
+            np.copyto(np.ndarray(self.frame_shape, dtype=np.uint8, buffer=data, strides=self.frame_strides), frame)
+            return Gst.Buffer.new_wrapped(data.tobytes())
+        buffer, map_info, view = mapped
+        np.copyto(view, frame)
+        buffer.unmap(map_info)
+        return buffer
+
+    def on_frame(
+        self,
+        frame: np.ndarray,
+        detections: Optional[Union["sv.Detections", np.ndarray]] = None,
+        labels: Optional[Sequence[str]] = None,
+    ):
+        buffer = self.make_buffer(frame)
+        if self.timestamp == AppSrcPipeline.FRAME_COUNTER:
+            buffer.pts = self.frame_count * self.frame_duration
+            buffer.duration = self.frame_duration
+        else:
+            buffer.pts = self.appsrc.get_current_running_time()
+            buffer.duration = Gst.CLOCK_TIME_NONE
         buffer.dts = Gst.CLOCK_TIME_NONE
-        buffer.duration = Gst.CLOCK_TIME_NONE
+        self.frame_count += 1
+        if detections is not None and self.overlay is not None:
+            self.overlay.add(buffer.pts, detections, labels)
         result = self.appsrc.emit("push-buffer", buffer)
         if result != Gst.FlowReturn.OK:
             logger.critical("Failed to push buffer: %s", result)
 
 
 class FileSinkPipeline(AppSrcPipeline):
-    @override
-    def create(self, resource_uri: str, options: dict):
+    CODECS = ("H264", "JPEG")
+
+    @classmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
         filepath = resource_uri.replace("file://", "")
-        width = options.get("output-width") or options.get("width") or 1280
-        height = options.get("output-height") or options.get("height") or 720
-        framerate = options.get("framerate", 30)
-        self.appsrc.set_property(
-            "caps",
-            Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1"),
-        )
-        videoconvert = f.make_element("videoconvert")
-        encoder = f.make_element("x264enc")
         mux = f.make_element("matroskamux")
         filesink = f.make_element("filesink")
         filesink.set_property("location", filepath)
-        f.add_elements(self.pipeline, [self.appsrc, videoconvert, encoder, mux, filesink])
-        f.link_elements([self.appsrc, videoconvert, encoder, mux, filesink])
         logger.info("Saving video @ %s", filepath)
+        return [mux, filesink]
 
 
 class TcpServerSinkPipeline(AppSrcPipeline):
-    @override
-    def create(self, resource_uri: str, options: dict):
+    @classmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
         host, port = f.extract_tcp(resource_uri)
-        width = options.get("output-width") or options.get("width") or 1280
-        height = options.get("output-height") or options.get("height") or 720
-        framerate = options.get("framerate", 30)
-        self.appsrc.set_property(
-            "caps",
-            Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1"),
-        )
         encoder = f.make_element("jpegenc")
         multipartmux = f.make_element("multipartmux")
         tcpserversink = f.make_element("tcpserversink")
         tcpserversink.set_property("host", host)
         tcpserversink.set_property("port", int(port))
-        f.add_elements(self.pipeline, [self.appsrc, encoder, multipartmux, tcpserversink])
-        f.link_elements([self.appsrc, encoder, multipartmux, tcpserversink])
         logger.info("View TCP stream @ tcp://%s:%s", host, port)
+        return [encoder, multipartmux, tcpserversink]
 
 
 class RtspSinkPipeline(AppSrcPipeline):
     UDP_HOST = "0.0.0.0"
     UDP_PORT = 5000
     UDP_PAYLOAD = 96
+    PAYLOADERS = {"H264": ("rtph264pay", UDP_PAYLOAD), "JPEG": ("rtpjpegpay", 26)}
+    CODECS = tuple(PAYLOADERS)
+    # Every branch streams to its RTSP server on its own UDP port, counting up from UDP_PORT
+    _udp_ports = itertools.count(UDP_PORT)
 
-    @override
-    def create(self, resource_uri: str, options: dict):
+    @classmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
         _, port, base = f.extract_rtsp(resource_uri)
-        width = options.get("output-width") or options.get("width") or 1280
-        height = options.get("output-height") or options.get("height") or 720
-        framerate = options.get("framerate", 30)
-        self.appsrc.set_property(
-            "caps",
-            Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1"),
-        )
-        videoconvert = f.make_element("videoconvert")
-        encoder = f.make_element("x264enc")
-        rtph264pay = f.make_element("rtph264pay")
+        udp_port = next(RtspSinkPipeline._udp_ports)
+        payloader_name, payload = RtspSinkPipeline.PAYLOADERS[codec]
+        payloader = f.make_element(payloader_name)
         queue = f.make_element("queue")
         udpsink = f.make_element("udpsink")
         udpsink.set_property("host", RtspSinkPipeline.UDP_HOST)
-        udpsink.set_property("port", RtspSinkPipeline.UDP_PORT)
+        udpsink.set_property("port", udp_port)
         udpsink.set_property("async", False)
-        rtph264pay.set_property("pt", RtspSinkPipeline.UDP_PAYLOAD)
-        f.add_elements(self.pipeline, [self.appsrc, videoconvert, encoder, rtph264pay, queue, udpsink])
-        f.link_elements([self.appsrc, videoconvert, encoder, rtph264pay, queue, udpsink])
+        payloader.set_property("pt", payload)
 
         threading.Thread(
             target=f.launch_rtsp_server,
             kwargs={
                 "rtsp_port": port,
-                "udp_port": RtspSinkPipeline.UDP_PORT,
-                "payload": RtspSinkPipeline.UDP_PAYLOAD,
+                "udp_port": udp_port,
+                "codec": codec,
+                "payload": payload,
                 "endpoint": base,
             },
             daemon=True,
         ).start()
         logger.info("RTSP server started at rtsp://@:%s/%s", port, base)
+        return [payloader, queue, udpsink]
 
 
 class DisplaySinkPipeline(AppSrcPipeline):
-    @override
-    def create(self, resource_uri: str, options: dict):
-        width = options.get("output-width") or options.get("width") or 1280
-        height = options.get("output-height") or options.get("height") or 720
-        framerate = options.get("framerate", 30)
-        self.appsrc.set_property(
-            "caps",
-            Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1"),
-        )
-        videoconvert = f.make_element("videoconvert")
+    @classmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
+        videoconvert = f.make_converter(options)
         autovideosink = f.make_element("autovideosink")
-        f.add_elements(self.pipeline, [self.appsrc, videoconvert, autovideosink])
-        f.link_elements([self.appsrc, videoconvert, autovideosink])
+        return [videoconvert, autovideosink]
+
+
+class NullSinkPipeline(AppSrcPipeline):
+    """
+    Discards frames in a fakesink, to measure the cost of the rest of the pipeline.
+    """
+
+    @classmethod
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
+        fakesink = f.make_element("fakesink")
+        fakesink.set_property("sync", False)
+        fakesink.set_property("async", False)
+        return [fakesink]
+
+
+class TeeSinkPipeline(AppSrcPipeline):
+    """
+    Fans one appsrc out to several outputs. Raw video is converted once and outputs that take the same
+    encoded stream share a single encoder. Every output gets a leaky queue so a slow consumer drops its
+    own buffers instead of stalling the others.
+
+    Options:
+        branch-queue-size (int): The number of buffers each output queue holds before dropping, defaults to 30.
+    """
+
+    def __init__(self, branches: List[Tuple[str, type]]) -> None:
+        super().__init__()
+        self.branches = branches
+        # Every RTSP output runs its own server, which can't share a port with another
+        rtsp_ports = [
+            f.extract_rtsp(uri)[1] for uri, pipeline_class in branches if issubclass(pipeline_class, RtspSinkPipeline)
+        ]
+        if len(set(rtsp_ports)) < len(rtsp_ports):
+            raise ValueError(f"RTSP outputs need distinct ports, got {rtsp_ports}")
+
+    @classmethod
+    @override
+    def make_branch(cls, resource_uri: str, options: dict, codec: Optional[str]) -> List[Gst.Element]:
+        """Creates the branch of a single output with the pipeline class registered for its URI."""
+        from .factory import PipelineFactory
+
+        return PipelineFactory.find(resource_uri).make_branch(resource_uri, options, codec)
+
+    def make_queue(self, name: str, options: dict) -> Gst.Element:
+        queue = f.make_element("queue", name=name)
+        queue.set_property("max-size-buffers", int(options.get("branch-queue-size", 30)))
+        queue.set_property("max-size-bytes", 0)
+        queue.set_property("max-size-time", 0)
+        Gst.util_set_object_arg(queue, "leaky", "downstream")
+        return queue
+
+    def add_branch(self, tee: Gst.Element, elements: List[Gst.Element]):
+        f.add_elements(self.pipeline, elements)
+        if not tee.link(elements[0]):
+            logger.error("Failed to link %s to %s", tee, elements[0])
+            exit(-1)
+        f.link_elements(elements)
+
+    @override
+    def create(self, resource_uri: Union[str, List[str]], options: dict):
+        self.configure_caps(options)
+        self.overlay = Overlay(options)
+        videoconvert = f.make_converter(options)
+        raw_tee = f.make_element("tee", name="raw_tee")
+        raw_tee.set_property("allow-not-linked", True)
+        elements = [self.appsrc, *self.overlay.make_elements(options), videoconvert, raw_tee]
+        f.add_elements(self.pipeline, elements)
+        f.link_elements(elements)
+
+        encoded = [(uri, pipeline_class) for uri, pipeline_class in self.branches if pipeline_class.CODECS]
+        encoded_tee, codec = None, None
+        if encoded:
+            codecs = tuple(codec for codec in encoded[0][1].CODECS if all(codec in cls.CODECS for _, cls in encoded))
+            encoders, codec = make_encoder(options, self.framerate, codecs=codecs)
+            encoded_tee = f.make_element("tee", name="encoded_tee")
+            encoded_tee.set_property("allow-not-linked", True)
+            self.add_branch(raw_tee, [f.make_element("queue", name="encoder_queue"), *encoders, encoded_tee])
+
+        for index, (uri, pipeline_class) in enumerate(self.branches):
+            elements = pipeline_class.make_branch(uri, options, codec if pipeline_class.CODECS else None)
+            for element in elements:
+                element.set_name(f"{element.get_name()}_{index}")
+            queue = self.make_queue(f"branch_queue_{index}", options)
+            self.add_branch(encoded_tee if pipeline_class.CODECS else raw_tee, [queue, *elements])
+            logger.info("Added %s branch for %s", pipeline_class.__name__, uri)
@@ -1,9 +1,13 @@
 import logging
-from typing import Optional
+import time
+from typing import Optional, Tuple, Union
 
 import numpy as np
 
+from ..metrics import metrics
 from .factory import PipelineFactory
+from .frame import FrameLease, FramePool, FrameQueue, Letterbox
+from .shared import FrameRing, SharedVideoSource
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -14,19 +18,112 @@ class VideoSource:
         self.input = input
         self.initialized = False
         self.pipeline = PipelineFactory.make(input, options)
+        self.pipeline.label = str(input)
+        self.frame_shape: Optional[Tuple[int, ...]] = None
+        self.time_to_first_frame: Optional[float] = None
 
     def on_terminate(self):
         self.pipeline.terminate()
 
-    def capture(self, timeout: float = 100) -> Optional[np.ndarray]:
+    def start(self):
         if not self.initialized:
             self.initialized = True
             self.pipeline.start()
 
-        timeout_s = timeout / 1000
-        if self.pipeline.frame_available.wait(timeout_s):
-            frame = self.pipeline.last_frame
-            self.pipeline.frame_available.clear()
-            return frame
-        logger.warning("Capture timeout (%s ms)", timeout)
-        return None
+    def prepare(self, timeout: float = 5) -> Optional[float]:
+        """
+        Starts the pipeline ahead of the first `capture` and waits for the first frame, without taking it.
+        The element start-up and caps negotiation happen here instead of in the first `capture`.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            Optional[float]: The time to the first frame in seconds, or None on timeout.
+        """
+        start = time.perf_counter()
+        self.pipeline.prepare(timeout)
+        self.start()
+        self.frame_shape = self.pipeline.frames.wait(max(0.0, timeout - (time.perf_counter() - start)))
+        if self.frame_shape is None:
+            logger.warning("No frame from %s within %s s", self.input, timeout)
+            return None
+        self.time_to_first_frame = time.perf_counter() - start
+        metrics.set("time_to_first_frame_seconds", self.time_to_first_frame, pipeline=self.input)
+        logger.info("First frame from %s after %.0f ms", self.input, self.time_to_first_frame * 1000)
+        return self.time_to_first_frame
+
+    def capture_ex(self, timeout: float = 100) -> Optional[FrameLease]:
+        """
+        Waits for the next frame and returns it with its metadata.
+
+        Args:
+            timeout (float): The maximum time to wait in milliseconds.
+
+        Returns:
+            Optional[FrameLease]: The frame with its PTS, sequence number, capture time and the cumulative
+                dropped-frame count, or None on timeout. Release it after use.
+        """
+        self.start()
+        lease = self.pipeline.frames.take(timeout / 1000)
+        if lease is None and not self.eos:
+            logger.warning("Capture timeout (%s ms)", timeout)
+        return lease
+
+    @property
+    def eos(self) -> bool:
+        """
+        True once the source ended and every frame was captured, e.g. at the end of a file with the
+        `offline` option, so a None from `capture` isn't a timeout.
+        """
+        return self.pipeline.frames.finished
+
+    def capture(self, timeout: float = 100) -> Optional[Union[np.ndarray, FrameLease]]:
+        """
+        Waits for the next frame.
+
+        Args:
+            timeout (float): The maximum time to wait in milliseconds.
+
+        Returns:
+            Optional[Union[np.ndarray, FrameLease]]: The frame, or None on timeout. With the `frame-pool`
+                or `zero-copy` option the frame is a `FrameLease` that must be released after use.
+        """
+        lease = self.capture_ex(timeout)
+        if lease is None or self.pipeline.leases_frames:
+            return lease
+        return lease.array
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Union[np.ndarray, FrameLease]:
+        """
+        Waits for the next frame, as returned by `capture`. Iteration stops at the end of the stream or when
+        the source terminates.
+        """
+        self.start()
+        lease = self.pipeline.frames.take()
+        if lease is None:
+            raise StopIteration
+        if self.pipeline.leases_frames:
+            return lease
+        return lease.array
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Union[np.ndarray, FrameLease]:
+        """
+        Awaits the next frame, as returned by `capture`. Iteration stops when the source terminates.
+        """
+        self.start()
+        lease = await self.pipeline.frames.take_async()
+        if lease is None:
+            raise StopAsyncIteration
+        if self.pipeline.leases_frames:
+            return lease
+        return lease.array
+
+
+__all__ = ["VideoSource", "SharedVideoSource", "FrameLease", "FramePool", "FrameQueue", "FrameRing", "Letterbox"]
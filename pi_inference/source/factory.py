@@ -1,34 +1,61 @@
+import importlib
 import logging
+from typing import TYPE_CHECKING, Dict, Type, Union
 
-from .pipeline import (
-    AppSinkPipeline,
-    LibcameraPipeline,
-    PiCameraPipeline,
-    UriSrcPipeline,
-    V4l2Pipeline,
-)
+from ..affinity import CAPTURE, CpuPlan
+
+if TYPE_CHECKING:
+    from ..common import Pipeline
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
 class PipelineFactory:
+    # Backends are imported by "module:class" when their URI scheme is first requested
+    pipeline_classes: Dict[str, Union[str, Type["Pipeline"]]] = {
+        "v4l2://": ".pipeline:V4l2Pipeline",
+        "rtsp://": ".pipeline:RtspSrcPipeline",
+        "file://": ".pipeline:UriSrcPipeline",
+        "csi://": ".pipeline:LibcameraPipeline",
+        "picam://": ".picamera:PiCameraPipeline",
+        "test://": ".pipeline:TestSrcPipeline",
+    }
+
     @classmethod
-    def make(cls, input: str, options: dict) -> AppSinkPipeline:
-        pipeline_classes = {
-            "v4l2://": V4l2Pipeline,
-            "rtsp://": UriSrcPipeline,
-            "file://": UriSrcPipeline,
-            "csi://": LibcameraPipeline,
-            "picam://": PiCameraPipeline,
-        }
-
-        for prefix, pipeline_class in pipeline_classes.items():
-            if input.startswith(prefix):
-                logger.info("Creating %s", pipeline_class.__name__)
-                pipeline = pipeline_class()
-                pipeline.create(input, options)
-                logger.info("Creating %s [DONE]", pipeline_class.__name__)
-                return pipeline
+    def register(cls, prefix: str, pipeline_class: Union[str, Type["Pipeline"]]):
+        """
+        Adds a source backend.
+
+        Args:
+            prefix (str): The URI scheme, e.g. "http://".
+            pipeline_class (Union[str, Type[Pipeline]]): The pipeline class, or "package.module:Class" to
+                import it on first use. Module names starting with a dot are relative to this package.
+        """
+        cls.pipeline_classes[prefix] = pipeline_class
 
+    @classmethod
+    def find(cls, input: str) -> Type["Pipeline"]:
+        for prefix, pipeline_class in cls.pipeline_classes.items():
+            if not input.startswith(prefix):
+                continue
+            if isinstance(pipeline_class, str):
+                module_name, class_name = pipeline_class.split(":")
+                module = importlib.import_module(module_name, __package__)
+                pipeline_class = cls.pipeline_classes[prefix] = getattr(module, class_name)
+            return pipeline_class
         raise NotImplementedError(f"Input {input} not supported")
+
+    @classmethod
+    def make(cls, input: str, options: dict) -> "Pipeline":
+        pipeline_class = cls.find(input)
+        logger.info("Creating %s", pipeline_class.__name__)
+        pipeline = pipeline_class()
+        plan = CpuPlan.from_options(options)
+        if plan is not None:
+            options = plan.thread_options(options, CAPTURE)
+        pipeline.create(input, options)
+        if plan is not None:
+            pipeline.set_cpu_plan(plan, CAPTURE)
+        logger.info("Creating %s [DONE]", pipeline_class.__name__)
+        return pipeline
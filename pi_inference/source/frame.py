@@ -0,0 +1,379 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class FramePool:
+    """
+    A fixed set of preallocated frames that are recycled instead of allocated per sample.
+
+    Args:
+        size (int): The number of frames to preallocate.
+        shape (Tuple[int, ...], optional): The frame shape. If not provided, the pool is
+            allocated on the first `lease_copy`.
+        dtype: The numpy dtype of the frames.
+    """
+
+    def __init__(self, size: int, shape: Optional[Tuple[int, ...]] = None, dtype=np.uint8):
+        self.size = size
+        self.shape = None
+        self.dtype = np.dtype(dtype)
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._free = deque()
+        if shape is not None:
+            self.reshape(shape, dtype)
+
+    def reshape(self, shape: Tuple[int, ...], dtype=np.uint8):
+        """
+        Drops the free frames and preallocates new ones with the given shape and dtype.
+        Leased frames of the old shape are discarded when released.
+        """
+        with self._lock:
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            self._free = deque(np.empty(self.shape, dtype=self.dtype) for _ in range(self.size))
+        logger.info("Allocated frame pool of %s x %s %s", self.size, self.shape, self.dtype)
+
+    def acquire(self) -> np.ndarray:
+        """
+        Takes a frame from the pool, allocating a new one if the pool is exhausted.
+
+        Returns:
+            np.ndarray: A frame with the pool's shape and dtype, content undefined.
+        """
+        with self._lock:
+            if self._free:
+                return self._free.popleft()
+            self.misses += 1
+        logger.debug("Frame pool exhausted (%s misses), allocating", self.misses)
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def release(self, frame: np.ndarray):
+        """
+        Returns a frame to the pool. Frames beyond the pool size or of a stale shape are dropped.
+
+        Args:
+            frame (np.ndarray): A frame previously returned by `acquire`.
+        """
+        with self._lock:
+            if frame.shape == self.shape and frame.dtype == self.dtype and len(self._free) < self.size:
+                self._free.append(frame)
+
+    def available(self) -> int:
+        with self._lock:
+            return len(self._free)
+
+    def lease_copy(self, src: np.ndarray) -> "FrameLease":
+        """
+        Copies `src` into a pooled frame and leases it out. The frame returns to the pool on release.
+
+        Args:
+            src (np.ndarray): The frame to copy, typically a view of mapped memory.
+
+        Returns:
+            FrameLease: The lease over the pooled copy.
+        """
+        if src.shape != self.shape or src.dtype != self.dtype:
+            self.reshape(src.shape, src.dtype)
+        frame = self.acquire()
+        np.copyto(frame, src)
+        return FrameLease(frame, functools.partial(self.release, frame))
+
+
+class Letterbox:
+    """
+    The scale and padding that fit a frame into a square model input, keeping its aspect ratio.
+
+    Args:
+        frame_size (Tuple[int, int]): The (width, height) of the full-resolution frame.
+        size (int): The width and height of the letterboxed frame.
+    """
+
+    def __init__(self, frame_size: Tuple[int, int], size: int):
+        width, height = frame_size
+        self.frame_size = (width, height)
+        self.size = size
+        self.scale = min(size / width, size / height)
+        self.pad_x = (size - round(width * self.scale)) // 2
+        self.pad_y = (size - round(height * self.scale)) // 2
+
+    def to_source(self, xyxy: np.ndarray) -> np.ndarray:
+        """
+        Maps boxes from the letterboxed frame back to the full-resolution frame.
+
+        Args:
+            xyxy (np.ndarray): The (N, 4) boxes in letterboxed coordinates.
+
+        Returns:
+            np.ndarray: The boxes in full-resolution coordinates, clipped to the frame, since boxes may
+                reach into the padding.
+        """
+        boxes = (xyxy - np.array([self.pad_x, self.pad_y, self.pad_x, self.pad_y], dtype=xyxy.dtype)) / self.scale
+        width, height = self.frame_size
+        return np.clip(boxes, 0, np.array([width, height, width, height], dtype=boxes.dtype))
+
+    def __repr__(self):
+        return f"Letterbox(size={self.size}, scale={self.scale:.4f}, pad=({self.pad_x}, {self.pad_y}))"
+
+
+class FrameLease:
+    """
+    A frame handed out to the caller until `release` is called.
+
+    The lease may be backed by a pooled ndarray or by a still-mapped Gst buffer, so the
+    array must not be used after release. It can be used as a context manager.
+
+    Args:
+        array (np.ndarray): The frame data.
+        on_release (Callable[[], None], optional): Called once when the lease is released.
+        pts (int, optional): The presentation timestamp of the frame in nanoseconds.
+        timestamp (float, optional): The wall-clock time the frame was received, as `time.time()`.
+
+    Attributes:
+        sequence (int): The number of the frame since the source started, gaps mean dropped frames.
+        dropped (int): The cumulative number of frames dropped by the source when this frame was taken.
+        inference (np.ndarray, optional): The letterboxed model-sized frame with the same PTS, if the
+            source has the `inference-size` option.
+        letterbox (Letterbox, optional): How `inference` maps to `array`.
+    """
+
+    def __init__(
+        self,
+        array: np.ndarray,
+        on_release: Optional[Callable[[], None]] = None,
+        pts: Optional[int] = None,
+        timestamp: Optional[float] = None,
+    ):
+        self.array = array
+        self.pts = pts
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.sequence = -1
+        self.dropped = 0
+        self.inference: Optional[np.ndarray] = None
+        self.letterbox: Optional[Letterbox] = None
+        self._on_release = on_release
+        self._released = False
+
+    @property
+    def released(self) -> bool:
+        return self._released
+
+    @property
+    def age(self) -> float:
+        """Seconds since the frame was received."""
+        return time.time() - self.timestamp
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._on_release is not None:
+            self._on_release()
+            self._on_release = None
+
+    def __enter__(self) -> np.ndarray:
+        return self.array
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class FrameQueue:
+    """
+    Buffers frame leases between the streaming thread and `VideoSource.capture`.
+
+    Policies:
+        latest: Keep only the newest frame, overwriting unread ones.
+        drop-oldest: Keep up to `maxsize` frames, dropping the oldest when full.
+        block: Keep up to `maxsize` frames, blocking the producer when full (backpressure).
+
+    Dropped leases are released and counted.
+
+    Args:
+        policy (str): One of `FrameQueue.POLICIES`.
+        maxsize (int): The queue capacity, ignored for the latest policy.
+    """
+
+    LATEST = "latest"
+    DROP_OLDEST = "drop-oldest"
+    BLOCK = "block"
+    POLICIES = (LATEST, DROP_OLDEST, BLOCK)
+
+    def __init__(self, policy: str = LATEST, maxsize: int = 1):
+        if policy not in FrameQueue.POLICIES:
+            raise ValueError(f"Frame delivery policy {policy} not supported, expected one of {FrameQueue.POLICIES}")
+        self.policy = policy
+        self.maxsize = 1 if policy == FrameQueue.LATEST else max(1, maxsize)
+        self.sequence = 0
+        self.dropped = 0
+        self.closed = False
+        self._leases = deque()
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    def put(self, lease: FrameLease) -> bool:
+        """
+        Adds a frame, dropping or blocking according to the policy.
+
+        Args:
+            lease (FrameLease): The frame to add.
+
+        Returns:
+            bool: False if the queue was closed and the frame released.
+        """
+        stale = []
+        handoff = None
+        with self._cond:
+            if self.policy == FrameQueue.BLOCK:
+                while len(self._leases) >= self.maxsize and not self.closed:
+                    self._cond.wait()
+            accepted = not self.closed
+            if not accepted:
+                stale.append(lease)
+            else:
+                while len(self._leases) >= self.maxsize:
+                    stale.append(self._leases.popleft())
+                    self.dropped += 1
+                lease.sequence = self.sequence
+                self.sequence += 1
+                self._leases.append(lease)
+                self._cond.notify_all()
+                handoff = self._handoff()
+        for stale_lease in stale:
+            stale_lease.release()
+        if handoff is not None:
+            loop, future, lease = handoff
+            try:
+                loop.call_soon_threadsafe(FrameQueue._resolve, future, lease)
+            except RuntimeError:
+                logger.warning("Event loop closed, dropping frame %s", lease.sequence)
+                lease.release()
+        return accepted
+
+    def _handoff(self):
+        # Called with the lock held, hands the oldest frame to the first asyncio waiter
+        if not self._waiters:
+            return None
+        loop, future = self._waiters.popleft()
+        lease = self._leases.popleft()
+        lease.dropped = self.dropped
+        self._cond.notify_all()
+        return loop, future, lease
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, lease: Optional[FrameLease]):
+        if future.done():
+            if lease is not None:
+                lease.release()
+            return
+        future.set_result(lease)
+
+    def take(self, timeout: Optional[float] = None) -> Optional[FrameLease]:
+        """
+        Waits for a frame and takes ownership of it.
+
+        Args:
+            timeout (float, optional): The maximum time to wait in seconds.
+
+        Returns:
+            Optional[FrameLease]: The oldest queued lease, or None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._leases or self.closed, timeout) or not self._leases:
+                return None
+            lease = self._leases.popleft()
+            lease.dropped = self.dropped
+            self._cond.notify_all()
+        return lease
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Waits until a frame is queued without taking it.
+
+        Args:
+            timeout (float, optional): The maximum time to wait in seconds.
+
+        Returns:
+            Optional[Tuple[int, ...]]: The shape of the oldest queued frame, or None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._leases or self.closed, timeout) or not self._leases:
+                return None
+            return self._leases[0].array.shape
+
+    async def take_async(self) -> Optional[FrameLease]:
+        """
+        Awaits the next frame. The future is resolved on the event loop by the producer thread,
+        so no thread waits on the queue.
+
+        Returns:
+            Optional[FrameLease]: The oldest queued lease, or None once the queue is closed.
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self._leases:
+                lease = self._leases.popleft()
+                lease.dropped = self.dropped
+                self._cond.notify_all()
+                return lease
+            if self.closed:
+                return None
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            with self._cond:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+            raise
+
+    def __len__(self):
+        with self._cond:
+            return len(self._leases)
+
+    def open(self):
+        with self._cond:
+            self.closed = False
+
+    @property
+    def finished(self) -> bool:
+        """True once the queue is closed and every queued frame was taken."""
+        with self._cond:
+            return self.closed and not self._leases
+
+    def finish(self):
+        """
+        Closes the queue at the end of the stream. Unlike `close`, the queued frames can still be taken,
+        after which `take` returns None without waiting.
+        """
+        with self._cond:
+            self.closed = True
+            waiters, self._waiters = self._waiters, deque()
+            self._cond.notify_all()
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(FrameQueue._resolve, future, None)
+
+    def close(self):
+        """Releases the queued frames and wakes up blocked producers and consumers."""
+        with self._cond:
+            self.closed = True
+            stale, self._leases = self._leases, deque()
+            waiters, self._waiters = self._waiters, deque()
+            self._cond.notify_all()
+        for lease in stale:
+            lease.release()
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(FrameQueue._resolve, future, None)
@@ -0,0 +1,77 @@
+import importlib.util
+import logging
+
+if not importlib.util.find_spec("libcamera") or not importlib.util.find_spec("picamera2"):
+    from unittest.mock import Mock
+
+    libcamera = Mock()
+    picamera2 = Mock()
+else:
+    import libcamera
+    import picamera2
+
+from typing_extensions import override
+
+from ..common import Pipeline
+from .pipeline import FrameProducer
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class PiCameraPipeline(FrameProducer, Pipeline):
+    # libcamera names formats by the order of a little-endian word, BGR888 is RGB in memory
+    FORMATS = {"RGB": "BGR888", "BGR": "RGB888", "BGRx": "XRGB8888"}
+
+    def __init__(self):
+        self.init_frames()
+        self.picam = None
+
+    def on_request(self, request):
+        pts = request.get_metadata().get("SensorTimestamp")
+        with picamera2.MappedArray(request, "main") as m:
+            lease = self.lease_copy(m.array, pts)
+        self.frames.put(lease)
+
+    @override
+    def create(self, resource_uri: str, options: dict):
+        self.configure_frames(options)
+        if self.zero_copy:
+            logger.warning("zero-copy is not supported by %s, copying frames", PiCameraPipeline.__name__)
+            self.zero_copy = False
+        if self.inference_size:
+            logger.warning("inference-size is not supported by %s", PiCameraPipeline.__name__)
+            self.inference_size = None
+        camera_number = resource_uri.replace("picam://", "")
+        if self.format not in PiCameraPipeline.FORMATS:
+            logger.warning("Format %s is not supported by %s, using RGB", self.format, PiCameraPipeline.__name__)
+            self.format = "RGB"
+        format = PiCameraPipeline.FORMATS[self.format]
+        width = options.get("input-width") or options.get("width") or 1280
+        height = options.get("input-height") or options.get("height") or 720
+        framerate = options.get("framerate", 30)
+        hflip, vflip = options.get("hflip", 0), options.get("vflip", 0)
+        auto_focus = options.get("auto-focus", 0)
+        self.picam = picamera2.Picamera2(0 if camera_number == "" else int(camera_number))
+        transforma = libcamera.Transform(vflip=vflip, hflip=hflip)
+        config = self.picam.create_video_configuration(
+            main={"size": (int(width), int(height)), "format": format},
+            transform=transforma,
+        )
+        self.picam.configure(config)
+        if auto_focus:
+            self.picam.set_controls({"AfMode": libcamera.controls.AfModeEnum.Continuous, "FrameRate": int(framerate)})
+
+        self.picam.post_callback = self.on_request
+
+    @override
+    def start(self):
+        logger.info("Starting %s", PiCameraPipeline.__name__)
+        self.frames.open()
+        self.picam.start()
+
+    @override
+    def terminate(self):
+        logger.info("Stopping %s", PiCameraPipeline.__name__)
+        self.frames.close()
+        self.picam.stop()
@@ -1,40 +1,126 @@
-import importlib
+import functools
 import logging
 import threading
+from typing import Optional
 
-import gi
 import numpy as np
-
-if not importlib.util.find_spec("libcamera") or not importlib.util.find_spec("picamera2"):
-    from unittest.mock import Mock
-
-    libcamera = Mock()
-    picamera2 = Mock()
-else:
-    import libcamera
-    import picamera2
-
 from typing_extensions import override
 
-gi.require_version("Gst", "1.0")
-from gi.repository import Gst
-
-from ..common import GstPipeline, Pipeline
-from ..functions import add_elements, link_elements, make_element
+from ..common import GstPipeline
+from ..functions import (
+    PIXEL_FORMATS,
+    add_elements,
+    frame_layout,
+    link_elements,
+    make_converter,
+    make_element,
+    to_bool,
+)
+from ..gst import Gst
+from ..metrics import metrics
+from .frame import FrameLease, FramePool, FrameQueue, Letterbox
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
-Gst.init(None)
 
 
-class AppSinkPipeline(GstPipeline):
+class FrameProducer:
+    """
+    Frame delivery shared by the source pipelines.
+
+    Options:
+        frame-pool (int): Recycle this many preallocated frames instead of allocating one per sample.
+        zero-copy (bool): Lease frames that stay mapped on the Gst buffer until released.
+        delivery (str): The `FrameQueue` policy, latest (default), drop-oldest or block.
+        queue-size (int): The capacity of the drop-oldest and block queues, defaults to 8.
+        inference-size (int): Also deliver a letterboxed square frame of this size with every frame,
+            scaled inside GStreamer. Not supported by picam://.
+        format (str): The pixel format of the frames, RGB (default), BGR, BGRx, NV12 or GRAY8. Conversion is
+            skipped when the camera or decoder already produces it.
+        convert-threads (int): The number of threads videoconvert uses, 0 for one per core.
+
+    With frame-pool or zero-copy set, `VideoSource.capture` hands out `FrameLease`s which must be released.
+    """
+
+    def init_frames(self):
+        self.frames = FrameQueue()
+        self.frame_pool = None
+        self.zero_copy = False
+        self.inference_size = None
+        self.format = "RGB"
+
+    def configure_frames(self, options: dict):
+        pool_size = int(options.get("frame-pool", 0))
+        self.frame_pool = FramePool(pool_size) if pool_size > 0 else None
+        self.zero_copy = to_bool(options.get("zero-copy", False))
+        self.frames = FrameQueue(options.get("delivery", FrameQueue.LATEST), int(options.get("queue-size", 8)))
+        inference_size = options.get("inference-size")
+        self.inference_size = int(inference_size) if inference_size else None
+        self.format = options.get("format", "RGB")
+        if self.format not in PIXEL_FORMATS:
+            raise ValueError(f"Format {self.format} not supported, expected one of {list(PIXEL_FORMATS)}")
+
+    @property
+    def leases_frames(self) -> bool:
+        return self.frame_pool is not None or self.zero_copy
+
+    def lease_copy(self, view: np.ndarray, pts: Optional[int] = None) -> FrameLease:
+        if self.frame_pool is not None:
+            lease = self.frame_pool.lease_copy(view)
+            lease.pts = pts
+            return lease
+        return FrameLease(view.copy(), pts=pts)
+
+
+class AppSinkPipeline(FrameProducer, GstPipeline):
+    MAIN = "main"
+    INFERENCE = "inference"
+    # Unpaired frames kept while waiting for the other branch
+    MAX_PENDING = 8
 
     def __init__(self):
         super().__init__(pipeline_name=AppSinkPipeline.__name__)
-        self.last_frame = None
-        self.frame_available = threading.Event()
+        self.init_frames()
+        self.letterbox = None
+        self._pending = {AppSinkPipeline.MAIN: {}, AppSinkPipeline.INFERENCE: {}}
+        self._pending_lock = threading.Lock()
 
-    def on_rgb_sample(self, sink, data):
+    def make_appsink(self, sync: bool, branch: str = MAIN) -> Gst.Element:
+        sink = make_element("appsink", name=f"appsink_{branch}")
+        sink.set_property("emit-signals", True)
+        sink.set_property("sync", sync)
+        sink.connect("new-sample", self.on_sample, branch)
+        return sink
+
+    def add_appsinks(self, upstream: Gst.Element, sync: bool):
+        """
+        Links the appsink after the last element of the source. With `inference-size`, a tee also feeds a
+        videoscale branch producing the letterboxed inference frame in the streaming thread.
+        """
+        sink = self.make_appsink(sync)
+        if self.inference_size is None:
+            add_elements(self.pipeline, [sink])
+            link_elements([upstream, sink])
+            return
+
+        size = self.inference_size
+        tee = make_element("tee")
+        main_queue = make_element("queue", name="queue_main")
+        inference_queue = make_element("queue", name="queue_inference")
+        videoscale = make_element("videoscale")
+        videoscale.set_property("add-borders", True)
+        capsfilter = make_element("capsfilter", name="capsfilter_inference")
+        capsfilter.set_property(
+            "caps",
+            Gst.Caps.from_string(f"video/x-raw,format={self.format},width={size},height={size},pixel-aspect-ratio=1/1"),
+        )
+        inference_sink = self.make_appsink(sync, AppSinkPipeline.INFERENCE)
+        add_elements(self.pipeline, [tee, main_queue, sink, inference_queue, videoscale, capsfilter, inference_sink])
+        link_elements([upstream, tee, main_queue, sink])
+        link_elements([tee, inference_queue, videoscale, capsfilter, inference_sink])
+        logger.info("Delivering %sx%s inference frames", size, size)
+
+    def on_sample(self, sink, branch):
         sample = sink.emit("pull-sample")
         if sample is None:
             return Gst.FlowReturn.EOS
@@ -42,22 +128,101 @@ class AppSinkPipeline(GstPipeline):
         buf = sample.get_buffer()
         caps = sample.get_caps()
 
-        width = caps.get_structure(0).get_value("width")
-        height = caps.get_structure(0).get_value("height")
+        structure = caps.get_structure(0)
+        width = structure.get_value("width")
+        height = structure.get_value("height")
+        shape, strides, _ = frame_layout(structure.get_value("format"), width, height)
 
         success, map_info = buf.map(Gst.MapFlags.READ)
         if not success:
             return Gst.FlowReturn.ERROR
 
-        frame = np.ndarray((height, width, 3), buffer=map_info.data, dtype=np.uint8).copy()
-        self.last_frame = frame
-        self.frame_available.set()
+        pts = None if buf.pts == Gst.CLOCK_TIME_NONE else buf.pts
+        view = np.ndarray(shape, buffer=map_info.data, dtype=np.uint8, strides=strides)
+        if branch == AppSinkPipeline.INFERENCE:
+            inference = view.copy()
+            buf.unmap(map_info)
+            self.pair(pts, AppSinkPipeline.INFERENCE, inference)
+            return Gst.FlowReturn.OK
+
+        if self.zero_copy:
+            # The buffer stays mapped, and referenced, until the caller releases the lease
+            lease = FrameLease(view, functools.partial(buf.unmap, map_info), pts=pts)
+        else:
+            lease = self.lease_copy(view, pts)
+            buf.unmap(map_info)
+
+        if self.inference_size is None:
+            self.frames.put(lease)
+            return Gst.FlowReturn.OK
 
-        buf.unmap(map_info)
+        if self.letterbox is None or self.letterbox.frame_size != (width, height):
+            self.letterbox = Letterbox((width, height), self.inference_size)
+        self.pair(pts, AppSinkPipeline.MAIN, lease)
         return Gst.FlowReturn.OK
 
+    def pair(self, pts: Optional[int], branch: str, item):
+        """
+        Matches the full-resolution and inference frames of the same PTS and delivers them as one lease.
+        A frame without a PTS can't be matched, so it is delivered without its inference frame, and an
+        inference frame without a PTS is dropped.
+        """
+        if pts is None:
+            if branch == AppSinkPipeline.MAIN:
+                self.frames.put(item)
+            return
+        other = AppSinkPipeline.INFERENCE if branch == AppSinkPipeline.MAIN else AppSinkPipeline.MAIN
+        stale = []
+        with self._pending_lock:
+            match = self._pending[other].pop(pts, None)
+            if match is None:
+                pending = self._pending[branch]
+                pending[pts] = item
+                while len(pending) > AppSinkPipeline.MAX_PENDING:
+                    stale.append(pending.pop(next(iter(pending))))
+        for unpaired in stale:
+            if isinstance(unpaired, FrameLease):
+                unpaired.release()
+        if match is None:
+            return
+
+        lease, inference = (item, match) if branch == AppSinkPipeline.MAIN else (match, item)
+        lease.inference = inference
+        lease.letterbox = self.letterbox
+        self.frames.put(lease)
+
+    @override
+    def start(self):
+        self.frames.open()
+        super().start()
+
+    @override
+    def terminate(self):
+        self.frames.close()
+        super().terminate()
+        with self._pending_lock:
+            stale = list(self._pending[AppSinkPipeline.MAIN].values())
+            self._pending = {AppSinkPipeline.MAIN: {}, AppSinkPipeline.INFERENCE: {}}
+        for lease in stale:
+            lease.release()
+
 
 class UriSrcPipeline(AppSinkPipeline):
+    """
+    A video file source.
+
+    Options:
+        offline (bool): Decode as fast as possible instead of in real time, delivering every frame exactly
+            once. The `block` delivery policy is used, and `capture` returns None without waiting once the
+            file ended, see `VideoSource.eos`. The frames keep the file's framerate, and its resolution
+            unless `width` and `height` are set.
+        sync (bool): Pace the frames to their timestamps, defaults to true unless offline.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.offline = False
+
     @staticmethod
     def pad_added_handler(decodebin, pad, converter):
         converter_static_sink_pad = converter.get_static_pad("sink")
@@ -70,28 +235,195 @@ class UriSrcPipeline(AppSinkPipeline):
 
     @override
     def create(self, resource_uri: str, options: dict):
-        width = options.get("input-width") or options.get("width") or 1280
-        height = options.get("input-height") or options.get("height") or 720
-        framerate = options.get("framerate", 30)
+        self.offline = to_bool(options.get("offline", False))
+        if self.offline:
+            # Backpressure instead of dropping, and a bus thread to see the end-of-stream
+            options = {**options, "delivery": FrameQueue.BLOCK}
+            self.WATCH_BUS = True
+        self.configure_frames(options)
         uridecodebin = make_element("uridecodebin")
-        converter = make_element("videoconvert")
+        converter = make_converter(options)
         capsfilter = make_element("capsfilter")
-        sink = make_element("appsink")
-        sink.set_property("emit-signals", True)
-        sink.set_property("sync", options.get("sync", True))
-        sink.connect("new-sample", self.on_rgb_sample, None)
 
         uridecodebin.set_property("uri", resource_uri)
         uridecodebin.connect("pad-added", self.pad_added_handler, converter)
-        caps = Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1")
-        capsfilter.set_property("caps", caps)
-        add_elements(self.pipeline, [uridecodebin, converter, capsfilter, sink])
-        link_elements([converter, capsfilter, sink])
+        elements = [converter]
+        caps = f"video/x-raw,format={self.format}"
+        if self.offline:
+            width, height = options.get("width"), options.get("height")
+            if width and height:
+                elements.append(make_element("videoscale"))
+                caps += f",width={width},height={height}"
+        else:
+            width = options.get("input-width") or options.get("width") or 1280
+            height = options.get("input-height") or options.get("height") or 720
+            framerate = options.get("framerate", 30)
+            caps += f",width={width},height={height},framerate={framerate}/1"
+        capsfilter.set_property("caps", Gst.Caps.from_string(caps))
+        elements.append(capsfilter)
+        add_elements(self.pipeline, [uridecodebin, *elements])
+        link_elements(elements)
+        self.add_appsinks(capsfilter, sync=not self.offline and to_bool(options.get("sync", True)))
+
+    @override
+    def on_eos(self, bus, msg):
+        if not self.offline:
+            super().on_eos(bus, msg)
+            return
+        logger.info("End-Of-Stream reached after %s frames", self.frames.sequence)
+        self.frames.finish()
+        self.pipeline.set_state(Gst.State.NULL)
+
+    @override
+    def on_error(self, bus, msg):
+        if self.offline:
+            # Don't leave capture waiting for frames that won't come
+            self.frames.finish()
+
+
+class RtspSrcPipeline(AppSinkPipeline):
+    """
+    A low-latency RTSP source. The jitterbuffer is kept short, the decoded frames pass a leaky queue so the
+    newest frame is always delivered, and the stream reconnects on end-of-stream or error.
+
+    Options:
+        latency (int): The jitterbuffer size in milliseconds, defaults to 200 (rtspsrc uses 2000).
+        drop-on-latency (bool): Drop packets that arrive later than the latency, defaults to true.
+        protocols (str): The lower transport, tcp, udp or udp+tcp (default, udp with tcp fallback).
+        decoder-threads (int): The number of threads of decoders that support it, 0 for automatic.
+        leaky-queue-size (int): The decoded frames buffered before the oldest is dropped, defaults to 1.
+        reconnect (bool): Restart the stream on end-of-stream or error, defaults to true.
+        reconnect-delay (float): The initial delay before reconnecting in seconds, doubled up to 5 s while
+            the stream fails, defaults to 0.5.
+    """
+
+    WATCH_BUS = True
+    MAX_RECONNECT_DELAY = 5.0
+
+    def __init__(self):
+        super().__init__()
+        self.reconnect = True
+        self.reconnect_delay = 0.5
+        self.reconnects = 0
+        self._delay = 0.5
+        self._stopping = threading.Event()
+
+    @staticmethod
+    def on_rtsp_pad_added(rtspsrc, pad, decodebin):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        if caps.get_structure(0).get_value("media") != "video":
+            return
+        sink_pad = decodebin.get_static_pad("sink")
+        if not sink_pad.is_linked() and pad.link(sink_pad) != Gst.PadLinkReturn.OK:
+            logger.error("Failed to link rtspsrc to decodebin")
+
+    @staticmethod
+    def on_decoded_pad_added(decodebin, pad, queue):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        if not caps.get_structure(0).get_name().startswith("video/"):
+            return
+        sink_pad = queue.get_static_pad("sink")
+        if not sink_pad.is_linked() and pad.link(sink_pad) != Gst.PadLinkReturn.OK:
+            logger.error("Failed to link decodebin to queue")
+
+    @staticmethod
+    def on_element_added(bin, sub_bin, element, threads):
+        factory = element.get_factory()
+        if factory is None or "Decoder" not in factory.get_metadata("klass"):
+            return
+        for name in ("max-threads", "n-threads"):
+            if element.find_property(name) is not None:
+                element.set_property(name, threads)
+                logger.info("Decoding with %s using %s threads", element.get_name(), threads or "automatic")
+                return
+
+    @override
+    def create(self, resource_uri: str, options: dict):
+        self.configure_frames(options)
+        self.reconnect = to_bool(options.get("reconnect", True))
+        self.reconnect_delay = self._delay = float(options.get("reconnect-delay", 0.5))
+
+        rtspsrc = make_element("rtspsrc")
+        rtspsrc.set_property("location", resource_uri)
+        rtspsrc.set_property("latency", int(options.get("latency", 200)))
+        rtspsrc.set_property("drop-on-latency", to_bool(options.get("drop-on-latency", True)))
+        Gst.util_set_object_arg(rtspsrc, "protocols", options.get("protocols", "udp+tcp"))
+        decodebin = make_element("decodebin")
+        queue = make_element("queue", name="queue_decoded")
+        queue.set_property("max-size-buffers", int(options.get("leaky-queue-size", 1)))
+        queue.set_property("max-size-bytes", 0)
+        queue.set_property("max-size-time", 0)
+        Gst.util_set_object_arg(queue, "leaky", "downstream")
+        converter = make_converter(options)
+        elements = [queue, converter]
+        width = options.get("input-width") or options.get("width")
+        height = options.get("input-height") or options.get("height")
+        caps = f"video/x-raw,format={self.format}"
+        if width and height:
+            elements.append(make_element("videoscale"))
+            caps += f",width={width},height={height}"
+        capsfilter = make_element("capsfilter")
+        capsfilter.set_property("caps", Gst.Caps.from_string(caps))
+        elements.append(capsfilter)
+
+        rtspsrc.connect("pad-added", self.on_rtsp_pad_added, decodebin)
+        decodebin.connect("pad-added", self.on_decoded_pad_added, queue)
+        if options.get("decoder-threads") is not None:
+            decodebin.connect("deep-element-added", self.on_element_added, int(options["decoder-threads"]))
+        add_elements(self.pipeline, [rtspsrc, decodebin, *elements])
+        link_elements(elements)
+        self.add_appsinks(capsfilter, sync=False)
+        logger.info("Receiving %s with %s ms latency", resource_uri, rtspsrc.get_property("latency"))
+
+    @override
+    def on_sample(self, sink, branch):
+        self._delay = self.reconnect_delay
+        return super().on_sample(sink, branch)
+
+    @override
+    def on_eos(self, bus, msg):
+        if not self.restart("End-Of-Stream"):
+            super().on_eos(bus, msg)
+
+    @override
+    def on_error(self, bus, msg):
+        if not self.restart("Error"):
+            self.terminate()
+
+    def restart(self, reason: str) -> bool:
+        """
+        Restarts the stream after a delay, called from the bus thread.
+
+        Returns:
+            bool: False if reconnecting is disabled or the pipeline is terminating.
+        """
+        if not self.reconnect or self._stopping.is_set():
+            return False
+        logger.warning("%s on %s, reconnecting in %.1f s", reason, self.label, self._delay)
+        self.pipeline.set_state(Gst.State.NULL)
+        if self._stopping.wait(self._delay):
+            return False
+        self._delay = min(self._delay * 2, RtspSrcPipeline.MAX_RECONNECT_DELAY)
+        self.reconnects += 1
+        metrics.inc("reconnects_total", pipeline=self.label)
+        self.pipeline.set_state(Gst.State.PLAYING)
+        return True
+
+    @override
+    def start(self):
+        self._stopping.clear()
+        super().start()
+
+    @override
+    def terminate(self):
+        self._stopping.set()
+        super().terminate()
 
 
 class V4l2Pipeline(AppSinkPipeline):
     @override
     def create(self, resource_uri: str, options: dict):
+        self.configure_frames(options)
         device = resource_uri.replace("v4l2://", "")
         elements = []
         width = options.get("input-width") or options.get("width") or 1280
@@ -108,24 +440,24 @@ class V4l2Pipeline(AppSinkPipeline):
             elements.append(decoder)
         else:
             raise NotImplementedError("v4l2 pipeline currently supports MJPG and YUYV only")
-        converter = make_element("videoconvert")
+        converter = make_converter(options)
         capsfilter = make_element("capsfilter")
-        sink = make_element("appsink")
         source.set_property("device", device)
-        caps = Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1")
+        caps = Gst.Caps.from_string(
+            f"video/x-raw,format={self.format},width={width},height={height},framerate={framerate}/1"
+        )
         capsfilter.set_property("caps", caps)
-        sink.set_property("emit-signals", True)
-        sink.set_property("sync", False)
-        sink.connect("new-sample", self.on_rgb_sample, None)
-        elements += [converter, capsfilter, sink]
+        elements += [converter, capsfilter]
 
         add_elements(self.pipeline, elements)
         link_elements(elements)
+        self.add_appsinks(capsfilter, sync=False)
 
 
 class LibcameraPipeline(AppSinkPipeline):
     @override
     def create(self, resource_uri: str, options: dict):
+        self.configure_frames(options)
         device = resource_uri.replace("csi://", "")
         width = options.get("input-width") or options.get("width") or 1280
         height = options.get("input-height") or options.get("height") or 720
@@ -140,60 +472,58 @@ class LibcameraPipeline(AppSinkPipeline):
         )
         capsfilter_1.set_property("caps", caps_1)
 
-        videoconvert = make_element("videoconvert")
-
-        capsfilter_2 = make_element("capsfilter", name="capsfilter_2")
-        caps_2 = Gst.Caps.from_string(f"video/x-raw,format=RGB,width={width},height={height},framerate={framerate}/1")
-        capsfilter_2.set_property("caps", caps_2)
-
-        sink = make_element("appsink")
-        sink.set_property("emit-signals", True)
-        sink.set_property("sync", False)
-        sink.connect("new-sample", self.on_rgb_sample, None)
+        elements = [source, capsfilter_1]
+        if self.format != "NV12":
+            # The ISP already outputs NV12, only other formats need a conversion
+            videoconvert = make_converter(options)
+            capsfilter_2 = make_element("capsfilter", name="capsfilter_2")
+            caps_2 = Gst.Caps.from_string(
+                f"video/x-raw,format={self.format},width={width},height={height},framerate={framerate}/1"
+            )
+            capsfilter_2.set_property("caps", caps_2)
+            elements += [videoconvert, capsfilter_2]
 
-        elements = [source, capsfilter_1, videoconvert, capsfilter_2, sink]
         add_elements(self.pipeline, elements)
         link_elements(elements)
+        self.add_appsinks(elements[-1], sync=False)
 
 
-class PiCameraPipeline(Pipeline):
-    def __init__(self):
-        self.last_frame = None
-        self.frame_available = threading.Event()
-        self.picam = None
+class TestSrcPipeline(AppSinkPipeline):
+    """
+    A synthetic videotestsrc source for benchmarks and CI, e.g. test://smpte or test://ball.
 
-    def on_request(self, request):
-        with picamera2.MappedArray(request, "main") as m:
-            self.last_frame = m.array.copy()
-            self.frame_available.set()
+    Options:
+        live (bool): Produce frames at the framerate like a camera (default), or as fast as possible.
+        test-format (str): The format videotestsrc generates before conversion, I420 by default to
+            match what decoders produce. Set it to the `format` option to skip the conversion.
+    """
 
     @override
     def create(self, resource_uri: str, options: dict):
-        camera_number = resource_uri.replace("picam://", "")
-        format = "BGR888"  # Hardcoded for RGB array
+        self.configure_frames(options)
+        pattern = resource_uri.replace("test://", "") or "smpte"
         width = options.get("input-width") or options.get("width") or 1280
         height = options.get("input-height") or options.get("height") or 720
         framerate = options.get("framerate", 30)
-        hflip, vflip = options.get("hflip", 0), options.get("vflip", 0)
-        auto_focus = options.get("auto-focus", 0)
-        self.picam = picamera2.Picamera2(0 if camera_number == "" else int(camera_number))
-        transforma = libcamera.Transform(vflip=vflip, hflip=hflip)
-        config = self.picam.create_video_configuration(
-            main={"size": (int(width), int(height)), "format": format},
-            transform=transforma,
-        )
-        self.picam.configure(config)
-        if auto_focus:
-            self.picam.set_controls({"AfMode": libcamera.controls.AfModeEnum.Continuous, "FrameRate": int(framerate)})
-
-        self.picam.post_callback = self.on_request
+        test_format = options.get("test-format", "I420")
+        source = make_element("videotestsrc")
+        source.set_property("is-live", to_bool(options.get("live", True)))
+        Gst.util_set_object_arg(source, "pattern", pattern)
 
-    @override
-    def start(self):
-        logger.info("Starting %s", PiCameraPipeline.__name__)
-        self.picam.start()
+        capsfilter_1 = make_element("capsfilter", name="capsfilter_1")
+        caps_1 = Gst.Caps.from_string(
+            f"video/x-raw,format={test_format},width={width},height={height},framerate={framerate}/1"
+        )
+        capsfilter_1.set_property("caps", caps_1)
+        converter = make_converter(options)
+        capsfilter_2 = make_element("capsfilter", name="capsfilter_2")
+        caps_2 = Gst.Caps.from_string(
+            f"video/x-raw,format={self.format},width={width},height={height},framerate={framerate}/1"
+        )
+        capsfilter_2.set_property("caps", caps_2)
 
-    @override
-    def terminate(self):
-        logger.info("Stopping %s", PiCameraPipeline.__name__)
-        self.picam.stop()
+        elements = [source, capsfilter_1, converter, capsfilter_2]
+        add_elements(self.pipeline, elements)
+        link_elements(elements)
+        self.add_appsinks(capsfilter_2, sync=False)
+        logger.info("Generating %s test pattern", pattern)
@@ -0,0 +1,427 @@
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from ..metrics import metrics
+from .frame import FrameLease
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+_RING = np.dtype([("head", "<i8"), ("dropped", "<i8")])
+_SLOT = np.dtype([("seq", "<i8"), ("pts", "<i8"), ("timestamp", "<f8"), ("leases", "<i8")])
+_ALIGN = 64
+
+
+def _aligned(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing:
+    """
+    A ring of frame slots in shared memory, written by one process and read by another.
+
+    The writer never touches the newest frame or a slot leased by the reader, so leases are views of the
+    shared memory that stay valid until released. A short lock guards the slot bookkeeping, the frames are
+    copied outside of it. When every other slot is leased the writer drops the frame.
+
+    The reader polls the head without the lock and only takes the lock with a timeout, so a writer that
+    crashed while holding it can't block the reader. The owner of a stuck lock replaces `lock`, which the
+    reader picks up on its next attempt.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the uint8 frames.
+        slots (int): The number of frames in the ring, at least 3.
+        lock: A `multiprocessing.Lock` shared by the writer and reader.
+        name (str, optional): The name of an existing ring to attach to, a new one is created if not provided.
+    """
+
+    # Seconds between checks of the head while waiting for a frame
+    POLL_INTERVAL = 0.002
+    # Seconds a single attempt to take the lock may block
+    LOCK_TIMEOUT = 0.1
+
+    def __init__(self, shape: Tuple[int, ...], slots: int, lock, name: Optional[str] = None):
+        if slots < 3:
+            raise ValueError(f"A frame ring needs at least 3 slots, got {slots}")
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.lock = lock
+        self.frame_size = math.prod(self.shape)
+        header_size = _aligned(_RING.itemsize + slots * _SLOT.itemsize)
+        size = header_size + slots * _aligned(self.frame_size)
+        self.created = name is None
+        # Leases handed out by this process and not released yet, which keep the shared memory attached
+        self._held = 0
+        self._closing = False
+        self.shm = shared_memory.SharedMemory(name=name, create=self.created, size=size if self.created else 0)
+        self.name = self.shm.name
+        buffer = self.shm.buf
+        self._ring = np.ndarray((1,), dtype=_RING, buffer=buffer)
+        self._slots = np.ndarray((slots,), dtype=_SLOT, buffer=buffer, offset=_RING.itemsize)
+        self._frames = [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=buffer, offset=header_size + i * _aligned(self.frame_size))
+            for i in range(slots)
+        ]
+        if self.created:
+            self._ring["head"] = -1
+            self._ring["dropped"] = 0
+            self._slots["seq"] = -1
+            self._slots["leases"] = 0
+
+    @property
+    def head(self) -> int:
+        """The sequence number of the newest frame, -1 before the first one."""
+        return int(self._ring["head"][0])
+
+    @property
+    def dropped(self) -> int:
+        """The number of frames the writer dropped because no slot was free."""
+        return int(self._ring["dropped"][0])
+
+    def write(self, frame: np.ndarray, pts: Optional[int] = None, timestamp: Optional[float] = None) -> bool:
+        """
+        Copies a frame into a free slot and publishes it as the newest frame.
+
+        Args:
+            frame (np.ndarray): The frame, possibly strided, of the ring's shape.
+            pts (int, optional): The presentation timestamp in nanoseconds.
+            timestamp (float, optional): The wall-clock capture time, as `time.time()`.
+
+        Returns:
+            bool: False if the frame was dropped.
+        """
+        with self.lock:
+            head = self.head
+            free = [
+                i
+                for i in range(self.slots)
+                if self._slots["leases"][i] == 0 and (head < 0 or self._slots["seq"][i] != head)
+            ]
+            if not free:
+                self._ring["dropped"][0] += 1
+                return False
+            slot = min(free, key=lambda i: self._slots["seq"][i])
+            self._slots["seq"][slot] = -1
+        np.copyto(self._frames[slot], frame)
+        with self.lock:
+            seq = head + 1
+            self._slots["pts"][slot] = -1 if pts is None else pts
+            self._slots["timestamp"][slot] = time.time() if timestamp is None else timestamp
+            self._slots["seq"][slot] = seq
+            self._ring["head"][0] = seq
+        return True
+
+    def _acquire(self, deadline: Optional[float]):
+        """
+        Takes the current lock in short attempts, re-reading `lock` between them in case it was replaced.
+
+        Returns:
+            The lock taken, to release it even if `lock` is replaced meanwhile, or None past the deadline.
+        """
+        while True:
+            lock = self.lock
+            if lock.acquire(timeout=FrameRing.LOCK_TIMEOUT):
+                return lock
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def read(self, after: int, timeout: Optional[float] = None) -> Optional[FrameLease]:
+        """
+        Waits for a frame newer than `after` and leases the newest one.
+
+        Args:
+            after (int): The sequence number of the last frame read, -1 for any frame.
+            timeout (float, optional): The maximum time to wait in seconds.
+
+        Returns:
+            Optional[FrameLease]: A view of the frame in shared memory with its sequence number, or None on
+                timeout. The slot isn't reused until the lease is released.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.head <= after:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(FrameRing.POLL_INTERVAL)
+        lock = self._acquire(deadline)
+        if lock is None:
+            return None
+        try:
+            head = self.head
+            slot = next(i for i in range(self.slots) if self._slots["seq"][i] == head)
+            self._slots["leases"][slot] += 1
+            self._held += 1
+            pts = int(self._slots["pts"][slot])
+            timestamp = float(self._slots["timestamp"][slot])
+        finally:
+            lock.release()
+        lease = FrameLease(self._frames[slot], lambda: self._unlease(slot), None if pts < 0 else pts, timestamp)
+        lease.sequence = head
+        return lease
+
+    def _unlease(self, slot: int):
+        if self._slots is None:
+            return
+        lock = self._acquire(None)
+        try:
+            self._slots["leases"][slot] -= 1
+            self._held -= 1
+            detach = self._closing and self._held == 0
+        finally:
+            lock.release()
+        if detach:
+            self._detach()
+
+    def close(self):
+        """
+        Detaches from the shared memory, and frees it if this ring created it. While frames are still
+        leased the ring stays attached, and it is detached when the last one is released.
+        """
+        self._closing = True
+        if self._held:
+            logger.info("Closing frame ring %s once %s leased frames are released", self.name, self._held)
+            return
+        self._detach()
+
+    def _detach(self):
+        # Bounded, a lock left taken by a crashed writer mustn't keep the ring from closing
+        lock = self._acquire(time.monotonic() + 1)
+        if self._slots is None:
+            if lock is not None:
+                lock.release()
+            return
+        self._ring = self._slots = self._frames = None
+        if lock is not None:
+            lock.release()
+        try:
+            self.shm.close()
+        except BufferError:
+            logger.warning("Frame ring %s is still referenced, its memory is freed with the last reference", self.name)
+        if self.created:
+            self.shm.unlink()
+
+
+def _capture_worker(input: str, options: dict, shape: Tuple[int, ...], slots: int, name: str, lock, stop):
+    from . import VideoSource
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s: %(message)s")
+    ring = FrameRing(shape, slots, lock, name)
+    video_source = VideoSource(input, {**options, "zero-copy": True, "frame-pool": 0})
+    try:
+        while not stop.is_set():
+            lease = video_source.capture_ex(timeout=1000)
+            if lease is None:
+                if video_source.eos:
+                    logger.info("End of %s", input)
+                    break
+                continue
+            with lease as frame:
+                if frame.shape != ring.shape:
+                    raise ValueError(f"{input} produced {frame.shape} frames, expected {ring.shape}")
+                ring.write(frame, lease.pts, lease.timestamp)
+    finally:
+        video_source.on_terminate()
+        ring.close()
+
+
+class SharedVideoSource:
+    """
+    Captures from a `VideoSource` running in a worker process, so several sources and the inference don't
+    compete for one GIL. The worker publishes frames into a `FrameRing` in shared memory, and is restarted
+    when it crashes.
+
+    `capture`, `capture_ex`, `prepare` and iteration behave like `VideoSource` with the latest delivery
+    policy. With the `zero-copy` option the frames are `FrameLease`s over the shared memory, otherwise they
+    are copied out of it.
+
+    Options:
+        width (int): The frame width, required to size the ring.
+        height (int): The frame height, required to size the ring.
+        format (str): The pixel format, defaults to RGB.
+        slots (int): The number of frames in the ring, defaults to 4. Every unreleased lease holds one slot.
+        restart-delay (float): Seconds before restarting a crashed worker, doubled up to 30 s while it keeps
+            crashing, defaults to 1.
+
+    The other options are passed to the `VideoSource` in the worker.
+
+    Args:
+        input (str): The source URI.
+        options (dict): The source options.
+    """
+
+    MAX_RESTART_DELAY = 30.0
+
+    def __init__(self, input: str, options: dict) -> None:
+        from ..functions import frame_layout, to_bool
+
+        width, height = options.get("width"), options.get("height")
+        if not width or not height:
+            raise ValueError("SharedVideoSource needs the width and height options to size the frame ring")
+        self.input = input
+        self.options = {key: value for key, value in options.items() if key not in ("slots", "restart-delay")}
+        self.zero_copy = to_bool(options.get("zero-copy", False))
+        self.frame_shape, _, _ = frame_layout(options.get("format", "RGB"), int(width), int(height))
+        self.time_to_first_frame: Optional[float] = None
+        self.restart_delay = float(options.get("restart-delay", 1))
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self.ring = FrameRing(self.frame_shape, int(options.get("slots", 4)), self._context.Lock())
+        self._last = -1
+        self._delivered = 0
+        self._process = None
+        self._stop = self._context.Event()
+        self._supervisor = None
+        self._stopping = threading.Event()
+
+    def _spawn(self):
+        args = (
+            self.input,
+            self.options,
+            self.frame_shape,
+            self.ring.slots,
+            self.ring.name,
+            self.ring.lock,
+            self._stop,
+        )
+        self._process = self._context.Process(
+            target=_capture_worker, args=args, name=f"source-{self.input}", daemon=True
+        )
+        self._process.start()
+        logger.info("Started worker %s for %s", self._process.pid, self.input)
+
+    def _supervise(self):
+        delay = self.restart_delay
+        seen = self.ring.head
+        while not self._stopping.wait(0.5):
+            if self._process.is_alive():
+                # A worker that publishes frames again has recovered, whether or not they were captured yet
+                head = self.ring.head
+                if head > seen:
+                    seen = head
+                    delay = self.restart_delay
+                continue
+            if self._process.exitcode == 0:
+                logger.info("Worker for %s finished", self.input)
+                return
+            logger.error("Worker for %s exited with %s, restarting in %s s", self.input, self._process.exitcode, delay)
+            if self._stopping.wait(delay):
+                return
+            delay = min(delay * 2, SharedVideoSource.MAX_RESTART_DELAY)
+            # A worker killed while holding the lock leaves it taken for good, so the ring gets a fresh one.
+            # Readers only ever hold the lock briefly, so one that stays taken belongs to the dead worker
+            if self.ring.lock.acquire(timeout=1):
+                self.ring.lock.release()
+            else:
+                logger.warning("Worker for %s died holding the frame ring lock, replacing it", self.input)
+                self.ring.lock = self._context.Lock()
+            seen = self.ring.head
+            self.restarts += 1
+            metrics.inc("reconnects_total", pipeline=self.input)
+            self._spawn()
+
+    def start(self):
+        if self._process is None:
+            self._spawn()
+            self._supervisor = threading.Thread(target=self._supervise, name=f"supervise-{self.input}", daemon=True)
+            self._supervisor.start()
+
+    @property
+    def eos(self) -> bool:
+        """True once the worker finished, e.g. at the end of an offline file, and the newest frame was read."""
+        return self._process is not None and self._process.exitcode == 0 and self.ring.head <= self._last
+
+    def on_terminate(self):
+        self._stopping.set()
+        self._stop.set()
+        if self._process is not None:
+            self._process.join(2)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        self.ring.close()
+
+    def prepare(self, timeout: float = 5) -> Optional[float]:
+        """
+        Starts the worker and waits for its first frame, without taking it.
+
+        Args:
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            Optional[float]: The time to the first frame in seconds, or None on timeout.
+        """
+        start = time.perf_counter()
+        self.start()
+        while self.ring.head < 0:
+            if time.perf_counter() - start > timeout:
+                logger.warning("No frame from %s within %s s", self.input, timeout)
+                return None
+            time.sleep(0.01)
+        self.time_to_first_frame = time.perf_counter() - start
+        metrics.set("time_to_first_frame_seconds", self.time_to_first_frame, pipeline=self.input)
+        return self.time_to_first_frame
+
+    def capture_ex(self, timeout: float = 100) -> Optional[FrameLease]:
+        """
+        Waits for a frame newer than the last one and leases the newest.
+
+        Args:
+            timeout (float): The maximum time to wait in milliseconds.
+
+        Returns:
+            Optional[FrameLease]: A view of the frame in shared memory, or None on timeout. Release it after use.
+        """
+        self.start()
+        deadline = time.perf_counter() + timeout / 1000
+        lease = None
+        # Short waits, so the end of the stream is noticed
+        while lease is None and not self.eos:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            lease = self.ring.read(self._last, min(remaining, 0.1))
+        if lease is None:
+            if not self.eos:
+                logger.warning("Capture timeout (%s ms)", timeout)
+            return None
+        self._last = lease.sequence
+        self._delivered += 1
+        lease.dropped = lease.sequence + 1 - self._delivered
+        return lease
+
+    def capture(self, timeout: float = 100) -> Optional[Union[np.ndarray, FrameLease]]:
+        """
+        Waits for the next frame.
+
+        Args:
+            timeout (float): The maximum time to wait in milliseconds.
+
+        Returns:
+            Optional[Union[np.ndarray, FrameLease]]: The frame, or None on timeout. With the `zero-copy`
+                option the frame is a `FrameLease` that must be released after use.
+        """
+        lease = self.capture_ex(timeout)
+        if lease is None or self.zero_copy:
+            return lease
+        with lease as frame:
+            return frame.copy()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Union[np.ndarray, FrameLease]:
+        while not self._stopping.is_set():
+            frame = self.capture(timeout=1000)
+            if frame is not None:
+                return frame
+            if self.eos:
+                break
+        raise StopIteration
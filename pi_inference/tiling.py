@@ -0,0 +1,184 @@
+import logging
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+from . import functions as f
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+Tile = Tuple[int, int, int, int]
+
+
+def tile_grid(width: int, height: int, rows: int, cols: int, overlap: float = 0.2) -> List[Tile]:
+    """
+    Cuts a frame into a grid of equally sized overlapping tiles.
+
+    Args:
+        width (int): The frame width.
+        height (int): The frame height.
+        rows (int): The number of tile rows.
+        cols (int): The number of tile columns.
+        overlap (float): The overlap of neighbouring tiles as a fraction of the tile size, between 0 and 1.
+
+    Returns:
+        List[Tile]: The (x0, y0, x1, y1) of every tile, row by row.
+    """
+
+    def spans(size: int, count: int) -> List[Tuple[int, int]]:
+        tile = math.ceil(size / (count - (count - 1) * overlap))
+        starts = np.linspace(0, size - tile, count).round().astype(int) if count > 1 else np.zeros(1, dtype=int)
+        return [(int(start), int(start) + tile) for start in starts]
+
+    return [(x0, y0, x1, y1) for y0, y1 in spans(height, rows) for x0, x1 in spans(width, cols)]
+
+
+def box_overlap(xyxy: np.ndarray, others: np.ndarray, metric: str = "iou") -> np.ndarray:
+    """
+    Computes the pairwise overlap of two sets of boxes.
+
+    Args:
+        xyxy (np.ndarray): The (N, 4) boxes.
+        others (np.ndarray): The (M, 4) boxes.
+        metric (str): iou for intersection over union, ios for intersection over the smaller box, which
+            also matches a box cut at a tile border with the full box.
+
+    Returns:
+        np.ndarray: The (N, M) overlaps.
+    """
+    top_left = np.maximum(xyxy[:, None, :2], others[None, :, :2])
+    bottom_right = np.minimum(xyxy[:, None, 2:], others[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area = np.prod(xyxy[:, 2:] - xyxy[:, :2], axis=1)
+    other_area = np.prod(others[:, 2:] - others[:, :2], axis=1)
+    if metric == "ios":
+        denominator = np.minimum(area[:, None], other_area[None, :])
+    else:
+        denominator = area[:, None] + other_area[None, :] - intersection
+    return intersection / np.maximum(denominator, 1e-9)
+
+
+def nms(
+    xyxy: np.ndarray,
+    confidence: np.ndarray,
+    class_id: Optional[np.ndarray] = None,
+    threshold: float = 0.5,
+    metric: str = "iou",
+) -> np.ndarray:
+    """
+    Non-maximum suppression over one overlap matrix, keeping the most confident box of every group of
+    boxes of the same class that overlap by more than `threshold`.
+
+    Args:
+        xyxy (np.ndarray): The (N, 4) boxes.
+        confidence (np.ndarray): The (N,) confidences.
+        class_id (np.ndarray, optional): The (N,) class ids, boxes of different classes don't suppress
+            each other. Class-agnostic if not provided.
+        threshold (float): The overlap above which the less confident box is suppressed.
+        metric (str): The overlap metric, see `box_overlap`.
+
+    Returns:
+        np.ndarray: The indices of the kept boxes, most confident first.
+    """
+    order = np.argsort(-confidence, kind="stable")
+    overlap = box_overlap(xyxy[order], xyxy[order], metric) > threshold
+    if class_id is not None:
+        classes = class_id[order]
+        overlap &= classes[:, None] == classes[None, :]
+    # Only a more confident box can suppress, and only if it was kept itself
+    overlap = np.triu(overlap, k=1)
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1 :] &= ~overlap[i, i + 1 :]
+    return order[keep]
+
+
+class TiledDetector:
+    """
+    Detects small objects in high-resolution frames by running the detector on overlapping tiles in
+    parallel, mapping the boxes back to the frame and merging the duplicates from overlapping tiles with
+    NMS into one `sv.Detections`.
+
+    Every tile is inferred on its own net from a pool of `num_nets`, so the tiles of a frame run
+    concurrently. With `full_frame`, the whole frame is inferred too, to keep objects larger than a tile.
+
+    Args:
+        net_factory (Callable[[], Any]): Loads a net, e.g. `lambda: get_model("yolov8s", num_threads=1)`.
+        rows (int): The number of tile rows.
+        cols (int): The number of tile columns.
+        overlap (float): The overlap of neighbouring tiles as a fraction of the tile size.
+        num_nets (int): The number of nets loaded and run concurrently.
+        full_frame (bool): Also infer the whole frame.
+        nms_threshold (float): The overlap above which duplicates are merged.
+        nms_metric (str): iou, or ios to merge boxes cut at a tile border with the full box.
+        infer (Callable[[np.ndarray, Any], sv.Detections]): Runs the detector on a tile.
+    """
+
+    def __init__(
+        self,
+        net_factory: Callable[[], Any],
+        rows: int = 2,
+        cols: int = 2,
+        overlap: float = 0.2,
+        num_nets: int = 4,
+        full_frame: bool = True,
+        nms_threshold: float = 0.5,
+        nms_metric: str = "ios",
+        infer: Callable[[np.ndarray, Any], sv.Detections] = f.from_ncnn,
+    ):
+        self.rows = rows
+        self.cols = cols
+        self.overlap = overlap
+        self.full_frame = full_frame
+        self.nms_threshold = nms_threshold
+        self.nms_metric = nms_metric
+        self.infer = infer
+        logger.info("Loading %s nets for %sx%s tiles", num_nets, cols, rows)
+        self._nets = queue.Queue()
+        for _ in range(num_nets):
+            self._nets.put(net_factory())
+        self._executor = ThreadPoolExecutor(num_nets, thread_name_prefix=TiledDetector.__name__)
+        self._grid_key = None
+        self._grid: List[Tile] = []
+
+    def tiles(self, width: int, height: int) -> List[Tile]:
+        if self._grid_key != (width, height):
+            self._grid_key = (width, height)
+            self._grid = tile_grid(width, height, self.rows, self.cols, self.overlap)
+            logger.info("Tiling %sx%s frames into %s", width, height, self._grid)
+        return self._grid
+
+    def _detect(self, frame: np.ndarray, tile: Optional[Tile]) -> sv.Detections:
+        net = self._nets.get()
+        try:
+            if tile is None:
+                return self.infer(frame, net)
+            x0, y0, x1, y1 = tile
+            detections = self.infer(np.ascontiguousarray(frame[y0:y1, x0:x1]), net)
+        finally:
+            self._nets.put(net)
+        detections.xyxy = detections.xyxy + np.array([x0, y0, x0, y0], dtype=detections.xyxy.dtype)
+        return detections
+
+    def __call__(self, frame: np.ndarray) -> sv.Detections:
+        tiles: List[Optional[Tile]] = list(self.tiles(frame.shape[1], frame.shape[0]))
+        if self.full_frame:
+            tiles.append(None)
+        results = self._executor.map(lambda tile: self._detect(frame, tile), tiles)
+        results = [detections for detections in results if len(detections)]
+        if not results:
+            detections = sv.Detections.empty()
+            detections.data["class_name"] = np.array([], dtype=str)
+            return detections
+        detections = sv.Detections.merge(results)
+        keep = nms(detections.xyxy, detections.confidence, detections.class_id, self.nms_threshold, self.nms_metric)
+        return detections[keep]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,203 @@
+import logging
+import math
+import time
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+import supervision as sv
+
+from . import functions as f
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def match_boxes(iou: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Greedily matches rows to columns of an IoU matrix, highest IoU first.
+
+    Args:
+        iou (np.ndarray): The (rows, columns) IoU matrix.
+        threshold (float): The minimum IoU of a match.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The matched row and column indices.
+    """
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for row, col in zip(rows[order], cols[order]):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=int), np.array(matched_cols, dtype=int)
+
+
+class IouTracker:
+    """
+    A constant-velocity IoU tracker that carries boxes across frames without detections.
+
+    Tracks are matched to detections of the same class by IoU. Between detections `predict` moves every
+    track by its velocity in pixels per frame, estimated from the last two matched detections and the number
+    of frames between them.
+
+    Args:
+        iou_threshold (float): The minimum IoU between a predicted track and a detection to match.
+        max_misses (int): The number of detector calls a track may go unmatched before it is dropped.
+        smoothing (float): The weight of the newest velocity estimate, between 0 and 1.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 1, smoothing: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.smoothing = smoothing
+        self.next_id = 0
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 4), dtype=np.float32)
+        self.anchors = np.empty((0, 4), dtype=np.float32)
+        self.ids = np.empty(0, dtype=int)
+        self.class_id = np.empty(0, dtype=int)
+        self.confidence = np.empty(0, dtype=np.float32)
+        self.class_name = np.empty(0, dtype=str)
+        self.misses = np.empty(0, dtype=int)
+        # Frames since every track was last matched, the span its anchor moved over
+        self.frames_since_match = np.empty(0, dtype=int)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, detections: sv.Detections) -> sv.Detections:
+        """
+        Matches new detections to the tracks.
+
+        Args:
+            detections (sv.Detections): The detector output for the current frame.
+
+        Returns:
+            sv.Detections: The detections with `tracker_id` set.
+        """
+        self.frames_since_match += 1
+        boxes = detections.xyxy.astype(np.float32)
+        class_id = detections.class_id if detections.class_id is not None else np.zeros(len(detections), dtype=int)
+        confidence = (
+            detections.confidence if detections.confidence is not None else np.ones(len(detections), np.float32)
+        )
+        class_name = np.asarray(detections.data.get("class_name", np.full(len(detections), "")))
+
+        iou = sv.box_iou_batch(self.boxes, boxes) if len(self) and len(boxes) else np.empty((len(self), len(boxes)))
+        iou[self.class_id[:, None] != class_id[None, :]] = 0
+        rows, cols = match_boxes(iou, self.iou_threshold)
+
+        velocity = (boxes[cols] - self.anchors[rows]) / self.frames_since_match[rows, None]
+        self.velocity[rows] = self.smoothing * velocity + (1 - self.smoothing) * self.velocity[rows]
+        self.boxes[rows] = boxes[cols]
+        self.anchors[rows] = boxes[cols]
+        self.confidence[rows] = confidence[cols]
+        self.misses += 1
+        self.misses[rows] = 0
+        self.frames_since_match[rows] = 0
+
+        alive = self.misses <= self.max_misses
+        new = np.ones(len(boxes), dtype=bool)
+        new[cols] = False
+        new_ids = np.arange(self.next_id, self.next_id + new.sum())
+        self.next_id += len(new_ids)
+        self.boxes = np.concatenate([self.boxes[alive], boxes[new]])
+        self.anchors = np.concatenate([self.anchors[alive], boxes[new]])
+        self.velocity = np.concatenate([self.velocity[alive], np.zeros((len(new_ids), 4), np.float32)])
+        self.confidence = np.concatenate([self.confidence[alive], confidence[new]])
+        self.class_id = np.concatenate([self.class_id[alive], class_id[new]])
+        self.class_name = np.concatenate([self.class_name[alive], class_name[new]])
+        self.misses = np.concatenate([self.misses[alive], np.zeros(len(new_ids), dtype=int)])
+        self.frames_since_match = np.concatenate([self.frames_since_match[alive], np.zeros(len(new_ids), dtype=int)])
+        tracker_id = np.empty(len(boxes), dtype=int)
+        tracker_id[cols] = self.ids[rows]
+        tracker_id[new] = new_ids
+        self.ids = np.concatenate([self.ids[alive], new_ids])
+
+        detections.tracker_id = tracker_id
+        return detections
+
+    def predict(self) -> sv.Detections:
+        """
+        Advances the tracks by one frame.
+
+        Returns:
+            sv.Detections: The tracks matched by the last detector call, at their predicted position.
+        """
+        self.frames_since_match += 1
+        self.boxes += self.velocity
+        visible = self.misses == 0
+        if not visible.any():
+            detections = sv.Detections.empty()
+            detections.data["class_name"] = np.array([], dtype=str)
+            return detections
+        return sv.Detections(
+            xyxy=self.boxes[visible].copy(),
+            confidence=self.confidence[visible],
+            class_id=self.class_id[visible],
+            tracker_id=self.ids[visible],
+            data={"class_name": self.class_name[visible]},
+        )
+
+
+class SparseDetector:
+    """
+    Runs the detector only every N frames and carries boxes across the frames in between with an `IouTracker`.
+
+    The output is a continuous `sv.Detections` stream with stable tracker IDs. With `target_latency` set,
+    N adapts so the average per-frame cost, detector time divided by N, stays within the target.
+
+    Args:
+        net: The ncnn model zoo net.
+        interval (int): Run the detector every `interval` frames, the initial value when adaptive.
+        target_latency (float, optional): The target average per-frame cost in seconds.
+        max_interval (int): The upper bound of the adaptive interval.
+        infer (Callable[[np.ndarray, Any], sv.Detections]): Runs the detector on a frame.
+        tracker (IouTracker, optional): The tracker, a default `IouTracker` if not provided.
+    """
+
+    def __init__(
+        self,
+        net,
+        interval: int = 3,
+        target_latency: Optional[float] = None,
+        max_interval: int = 10,
+        infer: Callable[[np.ndarray, Any], sv.Detections] = f.from_ncnn,
+        tracker: Optional[IouTracker] = None,
+    ):
+        self.net = net
+        self.interval = max(1, interval)
+        self.target_latency = target_latency
+        self.max_interval = max_interval
+        self.infer = infer
+        self.tracker = tracker or IouTracker()
+        self.frames = 0
+        self.detector_calls = 0
+        self.detect_time = None
+        self._since_detection = None
+
+    def __call__(self, frame: np.ndarray) -> sv.Detections:
+        self.frames += 1
+        if self._since_detection is not None and self._since_detection < self.interval - 1:
+            self._since_detection += 1
+            return self.tracker.predict()
+
+        start = time.perf_counter()
+        detections = self.infer(frame, self.net)
+        elapsed = time.perf_counter() - start
+        self.detector_calls += 1
+        self._since_detection = 0
+        self.detect_time = elapsed if self.detect_time is None else 0.8 * self.detect_time + 0.2 * elapsed
+        if self.target_latency:
+            self.interval = min(self.max_interval, max(1, math.ceil(self.detect_time / self.target_latency)))
+        return self.tracker.update(detections)
+
+    @property
+    def detector_ratio(self) -> float:
+        """The fraction of frames that ran the detector."""
+        return self.detector_calls / self.frames if self.frames else 0.0
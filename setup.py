@@ -31,6 +31,9 @@ setuptools.setup(
     ],
     packages=find_packages(exclude=("tests",)),
     package_dir={"": "."},
+    entry_points={
+        "console_scripts": ["pi-inference-bench=pi_inference.bench:main"],
+    },
     extras_require={
         "dev": ["flake8", "black==24.8.0", "isort", "twine", "pytest", "wheel"],
     },
@@ -0,0 +1,43 @@
+import os
+import threading
+
+import pytest
+
+from pi_inference.affinity import CAPTURE, ENCODE, INFERENCE, CpuPlan, parse_cpus
+
+
+def test_parse_plan():
+    assert parse_cpus("0,2-3") == [0, 2, 3]
+    plan = CpuPlan.parse("capture=0; inference=1-2; encode=3")
+    assert plan.roles == {CAPTURE: [0], INFERENCE: [1, 2], ENCODE: [3]}
+    assert CpuPlan.auto([0, 1, 2, 3]).roles == plan.roles
+    assert CpuPlan.from_options({"cpu-plan": {"inference": "1-2"}}).threads(INFERENCE) == 2
+    with pytest.raises(ValueError):
+        CpuPlan.parse("decode=0")
+
+
+def test_thread_options_keep_explicit_values():
+    plan = CpuPlan.parse("capture=0;inference=1-2;encode=2-3")
+    assert plan.thread_options({"encoder-threads": 1}, ENCODE) == {"convert-threads": 2, "encoder-threads": 1}
+    assert plan.thread_options({}, CAPTURE) == {"convert-threads": 1, "decoder-threads": 1}
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_setaffinity"), reason="No thread affinity on this platform")
+def test_pin_applies_to_the_calling_thread():
+    cpus = sorted(os.sched_getaffinity(0))
+    plan = CpuPlan({INFERENCE: cpus[:1]})
+    seen = []
+
+    def work():
+        plan.pin(INFERENCE)
+        seen.append(sorted(os.sched_getaffinity(0)))
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    thread.join()
+    assert seen == [cpus[:1]]
+    assert sorted(os.sched_getaffinity(0)) == cpus
+
+    with plan.pinned(INFERENCE):
+        assert sorted(os.sched_getaffinity(0)) == cpus[:1]
+    assert sorted(os.sched_getaffinity(0)) == cpus
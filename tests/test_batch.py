@@ -0,0 +1,10 @@
+from pi_inference.batch import find_videos
+
+
+def test_find_videos(tmp_path):
+    for name in ("b.MP4", "a.mkv", "notes.txt", "sub/c.avi"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).touch()
+
+    assert find_videos(str(tmp_path)) == [str(tmp_path / "a.mkv"), str(tmp_path / "b.MP4")]
+    assert len(find_videos(str(tmp_path), recursive=True)) == 3
@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("gi")
+
+from pi_inference.bench import format_table, run_case
+
+
+def test_run_case_without_camera():
+    result = run_case("test://ball", "null://", 160, 120, "BGR", {"live": False}, duration=0.3, warmup=0.1)
+    assert result["frames"] > 0
+    assert result["fps"] > 0
+    assert result["latency_ms"]["p50"] <= result["latency_ms"]["max"]
+    assert result["peak_rss_mb"] > 0
+
+
+def test_format_table_reports_errors():
+    results = [{"source": "test://", "sink": "null://", "resolution": "64x64", "format": "RGB", "error": "boom"}]
+    assert "boom" in format_table(results)
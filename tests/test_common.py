@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("gi")
+
+from pi_inference.common import BusMonitor
+from pi_inference.metrics import Metrics
+
+
+class FakeBus:
+    def __init__(self):
+        self.watches = 1
+        self.polled = threading.Event()
+
+    def add_signal_watch(self):
+        self.watches += 1
+
+    def remove_signal_watch(self):
+        self.watches -= 1
+
+    def timed_pop_filtered(self, timeout: int, types):
+        self.polled.set()
+        time.sleep(0.01)
+        return None
+
+
+class FakePipeline:
+    def __init__(self):
+        self.bus = FakeBus()
+
+
+def test_bus_monitor_restores_signal_watch():
+    pipeline = FakePipeline()
+    monitor = BusMonitor(pipeline, "test", metrics=Metrics())
+    monitor.start()
+    assert pipeline.bus.polled.wait(1)
+    assert pipeline.bus.watches == 0
+
+    monitor.stop()
+    assert not monitor._thread.is_alive()
+    assert pipeline.bus.watches == 1
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("gi")
+
+from pi_inference.sink import encoder as encoder_module
+from pi_inference.sink.encoder import ENCODER_PROFILES, encoder_properties, make_encoder
+
+
+@pytest.mark.parametrize(
+    "encoder, profile, expected",
+    [
+        (
+            "x264enc",
+            "low-latency",
+            {
+                "speed-preset": "ultrafast",
+                "tune": "zerolatency",
+                "pass": "cbr",
+                "bitrate": "2000",
+                "key-int-max": "30",
+                "bframes": "0",
+                "rc-lookahead": "0",
+                "threads": "2",
+                "sliced-threads": "true",
+            },
+        ),
+        (
+            "x264enc",
+            "archival",
+            {
+                "speed-preset": "medium",
+                "tune": None,
+                "pass": "qual",
+                "bitrate": "8000",
+                "key-int-max": "300",
+                "bframes": "3",
+                "rc-lookahead": "40",
+                "threads": "0",
+                "sliced-threads": None,
+            },
+        ),
+        (
+            "openh264enc",
+            "balanced",
+            {
+                "rate-control": "buffer",
+                "bitrate": "4000000",
+                "gop-size": "60",
+                "complexity": "low",
+                "multi-thread": "0",
+            },
+        ),
+        (
+            "openh264enc",
+            "archival",
+            {
+                "rate-control": "quality",
+                "bitrate": "8000000",
+                "gop-size": "300",
+                "complexity": "medium",
+                "multi-thread": "0",
+            },
+        ),
+        (
+            "v4l2h264enc",
+            "low-latency",
+            {"extra-controls": "controls,video_bitrate=2000000,h264_i_frame_period=30"},
+        ),
+        ("jpegenc", "low-latency", {"quality": "70"}),
+        ("jpegenc", "balanced", {"quality": "85"}),
+    ],
+)
+def test_encoder_properties(encoder, profile, expected):
+    assert encoder_properties(encoder, ENCODER_PROFILES[profile], framerate=30) == expected
+
+
+@pytest.mark.parametrize("profile", list(ENCODER_PROFILES))
+def test_every_profile_maps_onto_every_encoder(profile):
+    for encoder in ENCODER_PROFILES[profile]["encoders"]:
+        properties = encoder_properties(encoder, ENCODER_PROFILES[profile], framerate=25)
+        assert properties and all(value is None or isinstance(value, str) for value in properties.values())
+
+
+class FakeElement:
+    def __init__(self, name: str):
+        self.name = name
+        self.properties = {}
+
+
+@pytest.fixture
+def fake_gst(monkeypatch):
+    """Every element is installed, but v4l2h264enc fails to create, like a hardware encoder without its device."""
+    made = []
+
+    def make(name, element_name):
+        made.append(name)
+        return None if name == "v4l2h264enc" else FakeElement(name)
+
+    gst = SimpleNamespace(
+        ElementFactory=SimpleNamespace(find=lambda name: object(), make=make),
+        util_set_object_arg=lambda element, key, value: element.properties.__setitem__(key, value),
+    )
+    monkeypatch.setattr(encoder_module, "Gst", gst)
+    monkeypatch.setattr(encoder_module.f, "make_element", lambda name, element_name=None: FakeElement(name))
+    return made
+
+
+def test_make_encoder_falls_back_to_next_candidate(fake_gst):
+    elements, codec = make_encoder({"encoder-profile": "low-latency", "bitrate": 1000}, framerate=30)
+    assert fake_gst == ["v4l2h264enc", "x264enc"]
+    assert codec == "H264"
+    assert [element.name for element in elements] == ["x264enc", "h264parse"]
+    assert elements[0].properties["bitrate"] == "1000"
+    assert "tune" in elements[0].properties and "sliced-threads" in elements[0].properties
+
+
+def test_make_encoder_rejects_unknown_profile(fake_gst):
+    with pytest.raises(ValueError, match="not supported"):
+        make_encoder({"encoder-profile": "fastest"}, framerate=30)
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pi_inference.source.frame import FrameLease, FramePool, FrameQueue, Letterbox
+
+
+def test_frame_pool_recycles():
+    pool = FramePool(2, (4, 4, 3))
+    src = np.full((4, 4, 3), 7, dtype=np.uint8)
+    lease = pool.lease_copy(src)
+    assert pool.available() == 1
+    assert np.array_equal(lease.array, src)
+    lease.release()
+    lease.release()
+    assert pool.available() == 2
+    assert pool.misses == 0
+
+
+def test_frame_pool_exhausted_and_reshape():
+    pool = FramePool(1)
+    first = pool.lease_copy(np.zeros((2, 2, 3), dtype=np.uint8))
+    second = pool.lease_copy(np.zeros((2, 2, 3), dtype=np.uint8))
+    assert pool.misses == 1
+    pool.lease_copy(np.zeros((3, 3, 3), dtype=np.uint8))
+    first.release()
+    second.release()
+    assert pool.available() == 0
+
+
+def test_letterbox_maps_boxes_back():
+    letterbox = Letterbox((1280, 720), 640)
+    assert letterbox.scale == 0.5
+    assert (letterbox.pad_x, letterbox.pad_y) == (0, 140)
+    boxes = np.array([[0, 140, 640, 500], [10, 150, 20, 160]], dtype=np.float32)
+    expected = np.array([[0, 0, 1280, 720], [20, 20, 40, 40]], dtype=np.float32)
+    assert np.allclose(letterbox.to_source(boxes), expected)
+    # Boxes reaching into the padding are clipped to the frame
+    assert np.allclose(letterbox.to_source(np.array([[-5, 100, 700, 560]], dtype=np.float32)), [[0, 0, 1280, 720]])
+
+
+def test_frame_queue_latest_releases_overwritten_lease():
+    released = []
+    frames = FrameQueue()
+    frames.put(FrameLease(np.zeros(1), lambda: released.append(1)))
+    frames.put(FrameLease(np.ones(1), lambda: released.append(2)))
+    assert released == [1]
+    lease = frames.take(0.1)
+    assert (lease.sequence, lease.dropped) == (1, 1)
+    with lease as frame:
+        assert frame[0] == 1
+    assert released == [1, 2]
+    assert frames.take(0.01) is None
+
+
+def test_frame_queue_finish_keeps_queued_frames():
+    frames = FrameQueue(FrameQueue.BLOCK, maxsize=2)
+    frames.put(FrameLease(np.zeros(1), pts=0))
+    frames.put(FrameLease(np.ones(1), pts=1))
+    frames.finish()
+    assert not frames.put(FrameLease(np.ones(1), pts=2))
+    assert not frames.finished
+    assert [frames.take(0.1).pts, frames.take(0.1).pts] == [0, 1]
+    assert frames.finished
+    start = time.perf_counter()
+    assert frames.take(1) is None
+    assert time.perf_counter() - start < 0.5
+
+
+def test_frame_queue_drop_oldest():
+    frames = FrameQueue(FrameQueue.DROP_OLDEST, maxsize=2)
+    for i in range(4):
+        frames.put(FrameLease(np.full(1, i), pts=i))
+    assert [frames.take(0).pts for _ in range(2)] == [2, 3]
+    assert frames.dropped == 2
+
+
+def test_frame_queue_block():
+    frames = FrameQueue(FrameQueue.BLOCK, maxsize=1)
+    frames.put(FrameLease(np.zeros(1)))
+    producer = threading.Thread(target=frames.put, args=(FrameLease(np.ones(1)),))
+    producer.start()
+    producer.join(0.05)
+    assert producer.is_alive()
+    assert frames.take(0.1).array[0] == 0
+    producer.join(1)
+    assert frames.take(0.1).array[0] == 1
+    assert frames.dropped == 0
+
+    frames.put(FrameLease(np.zeros(1)))
+    producer = threading.Thread(target=frames.put, args=(FrameLease(np.ones(1)),))
+    producer.start()
+    frames.close()
+    producer.join(1)
+    assert not producer.is_alive()
+    assert frames.take(0.01) is None
+
+
+def test_frame_queue_wait_keeps_frame():
+    queue = FrameQueue()
+    assert queue.wait(timeout=0.01) is None
+    threading.Timer(0.05, queue.put, (FrameLease(np.zeros((2, 3, 3), dtype=np.uint8)),)).start()
+    assert queue.wait(timeout=1) == (2, 3, 3)
+    assert len(queue) == 1
+    assert queue.take(timeout=0).sequence == 0
+
+
+def test_frame_queue_invalid_policy():
+    with pytest.raises(ValueError):
+        FrameQueue("newest")
+
+
+def test_frame_queue_take_async():
+    async def consume(frames):
+        return [int(lease.array[0]) async for lease in _iterate(frames)]
+
+    async def _iterate(frames):
+        while True:
+            lease = await frames.take_async()
+            if lease is None:
+                return
+            yield lease
+
+    def produce(frames):
+        for i in range(3):
+            time.sleep(0.01)
+            frames.put(FrameLease(np.full(1, i)))
+        frames.close()
+
+    frames = FrameQueue(FrameQueue.BLOCK, maxsize=4)
+    threading.Thread(target=produce, args=(frames,)).start()
+    assert asyncio.run(consume(frames)) == [0, 1, 2]
+
+
+def test_frames_without_pts_are_not_paired():
+    pytest.importorskip("gi")
+    from pi_inference.source.pipeline import UriSrcPipeline
+
+    pipeline = UriSrcPipeline()
+    pipeline.frames.open()
+    inference = np.zeros((4, 4, 3), dtype=np.uint8)
+    pipeline.pair(None, UriSrcPipeline.INFERENCE, inference)
+    pipeline.pair(None, UriSrcPipeline.MAIN, FrameLease(np.zeros((8, 8, 3), dtype=np.uint8)))
+    unpaired = pipeline.frames.take(0.1)
+    assert unpaired.inference is None
+
+    pipeline.pair(5, UriSrcPipeline.INFERENCE, inference)
+    pipeline.pair(5, UriSrcPipeline.MAIN, FrameLease(np.zeros((8, 8, 3), dtype=np.uint8)))
+    assert pipeline.frames.take(0.1).inference is inference
+    assert pipeline._pending == {UriSrcPipeline.MAIN: {}, UriSrcPipeline.INFERENCE: {}}
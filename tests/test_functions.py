@@ -1,3 +1,6 @@
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 
 import pi_inference.functions as functions
@@ -18,6 +21,16 @@ def test_make_element():
         functions.make_element("non_existent_element")
 
 
+def test_frame_layout():
+    assert functions.frame_layout("RGB", 1280, 720) == ((720, 1280, 3), (3840, 3, 1), 3840 * 720)
+    assert functions.frame_layout("BGRx", 641, 480) == ((480, 641, 4), (2564, 4, 1), 2564 * 480)
+    assert functions.frame_layout("BGR", 641, 480)[1] == (1924, 3, 1)
+    assert functions.frame_layout("GRAY8", 642, 480) == ((480, 642), (644, 1), 644 * 480)
+    assert functions.frame_layout("NV12", 640, 480) == ((720, 640), (640, 1), 640 * 720)
+    with pytest.raises(ValueError):
+        functions.frame_layout("I420", 640, 480)
+
+
 def test_extract_rtsp():
     ip, port, base = functions.extract_rtsp("rtsp://0.0.0.0:8554/base")
     assert ip == "0.0.0.0"
@@ -31,3 +44,46 @@ def test_extract_rtsp():
 
     with pytest.raises(ValueError):
         functions.extract_rtsp("http://@:8555/camera")
+
+
+class FakeNcnnNet:
+    class_names = ["person", "bicycle", "car"]
+
+    def __init__(self, objects):
+        self.objects = [
+            SimpleNamespace(rect=SimpleNamespace(x=x, y=y, w=w, h=h), prob=prob, label=label)
+            for x, y, w, h, prob, label in objects
+        ]
+
+    def __call__(self, frame):
+        return self.objects
+
+
+def test_from_ncnn():
+    net = FakeNcnnNet([(10, 20, 30, 40, 0.3, 0), (0, 0, 5, 5, 0.9, 2), (1, 1, 2, 2, 0.6, 1)])
+    detections = functions.from_ncnn(None, net)
+    assert detections.xyxy.tolist() == [[10, 20, 40, 60], [0, 0, 5, 5], [1, 1, 3, 3]]
+    assert detections.class_id.tolist() == [0, 2, 1]
+    assert detections["class_name"].tolist() == ["person", "car", "bicycle"]
+
+    detections = functions.from_ncnn(None, net, class_confidence={0: 0.5}, classes=[0, 1])
+    assert detections["class_name"].tolist() == ["bicycle"]
+
+    detections = functions.from_ncnn(None, FakeNcnnNet([]))
+    assert len(detections) == 0
+    assert len(detections["class_name"]) == 0
+
+
+def test_draw_text_uses_overlay_cache():
+    cache = functions.OverlayCache(maxsize=2)
+    for text in ["a", "b", "a", "c", "b"]:
+        cache.get(text, 0, 0.5, 1, 5)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    frame = np.full((100, 200, 3), 200, dtype=np.uint8)
+    assert functions.draw_text(frame, "FPS: 30.0") is frame
+    assert frame[50, 52].tolist() == [106, 106, 106]
+    assert frame.max() == 255
+    gray = np.zeros((100, 200), dtype=np.uint8)
+    functions.draw_text(gray, "edge", anchor_x=195, anchor_y=3)
+    assert gray.max() > 0
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+SCRIPT = """
+import sys
+import pi_inference
+from pi_inference import VideoOutput, VideoSource
+from pi_inference.source import FrameLease
+print(",".join(name for name in ("gi", "cv2", "supervision", "picamera2") if name in sys.modules))
+"""
+
+
+def test_import_is_lazy():
+    output = subprocess.run([sys.executable, "-c", SCRIPT], check=True, capture_output=True, text=True).stdout
+    assert output.strip() == ""
@@ -0,0 +1,104 @@
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+import supervision as sv
+
+from pi_inference.sink.metadata import MetadataOutput, encode_jsonl, read_binary
+
+
+def make_detections(count: int) -> sv.Detections:
+    return sv.Detections(
+        xyxy=np.tile(np.array([[10, 20, 30, 40]], dtype=np.float32), (count, 1)),
+        confidence=np.full(count, 0.75),
+        class_id=np.arange(count),
+        tracker_id=np.arange(count) + 100,
+        data={"class_name": np.array(["person"] * count)},
+    )
+
+
+def test_metadata_jsonl_file(tmp_path):
+    path = tmp_path / "detections.jsonl"
+    output = MetadataOutput(f"file://{path}", {"metadata-batch-size": "4"})
+    for i in range(10):
+        output.write(make_detections(i % 3), pts=i * 1000)
+    output.write(None, pts=None)
+    output.on_terminate()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["pts"] for record in records] == [i * 1000 for i in range(10)] + [None]
+    assert records[2]["boxes"] == [[10.0, 20.0, 30.0, 40.0]] * 2
+    assert records[2]["scores"] == [0.75, 0.75]
+    assert records[2]["tracker_ids"] == [100, 101]
+    assert records[2]["names"] == ["person", "person"]
+    assert records[-1]["boxes"] == []
+
+
+def test_metadata_jsonl_without_scores_is_valid_json():
+    line = encode_jsonl(1, 0.0, sv.Detections(xyxy=np.array([[0, 0, 1, 1]], dtype=np.float32)))
+    record = json.loads(line, parse_constant=lambda constant: pytest.fail(f"Invalid JSON constant {constant}"))
+    assert record["scores"] == [None]
+    assert record["classes"] == [-1]
+
+
+def test_metadata_tcp_needs_port():
+    with pytest.raises(ValueError, match="no port"):
+        MetadataOutput("tcp://127.0.0.1", {})
+
+
+def test_metadata_binary_unix_socket(tmp_path):
+    path = tmp_path / "detections.sock"
+    output = MetadataOutput(f"unix://{path}", {"metadata-format": "binary", "metadata-flush-interval": "0.01"})
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(str(path))
+    output.write(None, pts=0)
+    time.sleep(0.1)
+    for i in range(1, 6):
+        output.write(make_detections(i), pts=i)
+    output.on_terminate()
+
+    with client, client.makefile("rb") as stream:
+        records = list(read_binary(stream))
+    assert [record["pts"] for record in records] == [0, 1, 2, 3, 4, 5]
+    detections = records[-1]["detections"]
+    assert detections["class_id"].tolist() == [0, 1, 2, 3, 4]
+    assert detections["tracker_id"].tolist() == [100, 101, 102, 103, 104]
+    assert np.allclose(detections["score"], 0.75)
+
+
+def test_metadata_queue_is_bounded(tmp_path):
+    path = tmp_path / "detections.jsonl"
+    output = MetadataOutput(f"file://{path}", {"metadata-queue-size": "2", "metadata-batch-size": "100"})
+    # Holding the lock keeps the writer from taking records
+    with output._condition:
+        for _ in range(5):
+            output.write(None)
+    assert output.dropped == 3
+    output.on_terminate()
+
+
+def test_metadata_terminate_leaves_busy_writer_open(tmp_path):
+    output = MetadataOutput(f"file://{tmp_path / 'detections.jsonl'}", {"metadata-batch-size": "1"})
+    writer = output._writer
+    written = threading.Event()
+    resume = threading.Event()
+
+    def write(data: bytes):
+        written.set()
+        resume.wait(5)
+        writer.file.write(data)
+
+    writer.write = write
+    output.write(None, pts=0)
+    assert written.wait(1)
+    output.on_terminate(timeout=0.05)
+    # The writer is still in the middle of a write, closing the file under it would lose the record
+    assert not writer.file.closed
+
+    resume.set()
+    output._thread.join(1)
+    assert writer.file.closed
+    assert json.loads((tmp_path / "detections.jsonl").read_text())["pts"] == 0
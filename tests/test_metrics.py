@@ -0,0 +1,37 @@
+from pi_inference.metrics import Histogram, Metrics
+
+
+def test_histogram_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+
+
+def test_metrics_disabled_records_nothing():
+    metrics = Metrics()
+    metrics.inc("gst_messages_total", type="qos")
+    metrics.record_stage("infer", 0.1)
+    with metrics.timer("annotate"):
+        pass
+    assert metrics.render() == "\n"
+
+
+def test_metrics_render():
+    metrics = Metrics(enabled=True, buckets=(0.1,))
+    stages = []
+    metrics.add_hook(lambda stage, seconds, labels: stages.append(stage))
+    metrics.inc("gst_messages_total", type="warning", element='say "hi"')
+    metrics.set("queue_level_buffers", 3, queue="queue_main")
+    metrics.record_stage("infer", 0.05)
+    with metrics.timer("annotate"):
+        pass
+
+    text = metrics.render()
+    assert stages == ["infer", "annotate"]
+    assert "# TYPE pi_inference_gst_messages_total counter" in text
+    assert 'pi_inference_gst_messages_total{element="say \\"hi\\"",type="warning"} 1' in text
+    assert 'pi_inference_queue_level_buffers{queue="queue_main"} 3' in text
+    assert 'pi_inference_stage_seconds_bucket{stage="infer",le="0.1"} 1' in text
+    assert 'pi_inference_stage_seconds_count{stage="annotate"} 1' in text
@@ -0,0 +1,55 @@
+import numpy as np
+import supervision as sv
+
+from pi_inference.motion import MotionGate, thumbnail
+
+
+def test_thumbnail():
+    frame = np.zeros((480, 640, 4), dtype=np.uint8)
+    frame[..., :3] = 30
+    frame[..., 3] = 255
+    small = thumbnail(frame, width=64)
+    assert small.shape == (48, 64)
+    assert np.all(small == 30)
+    assert thumbnail(np.zeros((720, 640), dtype=np.uint8)).shape == (72, 64)
+
+
+def test_thumbnail_nv12_uses_luma():
+    # A 640x480 NV12 frame: 480 luma rows, then 240 rows of interleaved UV
+    frame = np.full((720, 640), 40, dtype=np.uint8)
+    frame[480:] = 128
+    small = thumbnail(frame, width=64, format="NV12")
+    assert small.shape == (48, 64)
+    assert np.all(small == 40)
+
+    # Changing only the chroma plane isn't motion
+    gate = MotionGate(None, format="NV12", infer=lambda frame, net: sv.Detections.empty())
+    gate.update(frame)
+    recolored = frame.copy()
+    recolored[480:] = 200
+    assert gate.update(recolored) == 0
+
+
+def test_motion_gate_skips_static_frames():
+    calls = []
+
+    def infer(frame, net):
+        calls.append(frame)
+        return sv.Detections.empty()
+
+    gate = MotionGate(None, infer=infer, refresh_interval=60)
+    static = np.full((240, 320, 3), 50, dtype=np.uint8)
+    first = gate(static)
+    for _ in range(4):
+        assert gate(static) is first
+    assert len(calls) == 1
+
+    moved = static.copy()
+    moved[:120, :160] = 200
+    gate(moved)
+    assert len(calls) == 2
+    assert gate.skip_ratio == 4 / 6
+
+    gate.refresh_interval = 0
+    gate(moved)
+    assert len(calls) == 3
@@ -0,0 +1,30 @@
+import numpy as np
+import supervision as sv
+
+from pi_inference.sink.overlay import Overlay, to_annotations
+
+
+def test_to_annotations_labels():
+    detections = sv.Detections(
+        xyxy=np.array([[0, 0, 10, 10], [5, 5, 20, 20]], dtype=np.float32),
+        confidence=np.array([0.9, 0.5]),
+        class_id=np.array([0, 2]),
+        data={"class_name": np.array(["person", "car"])},
+    )
+    xyxy, class_id, labels = to_annotations(detections)
+    assert xyxy.shape == (2, 4)
+    assert class_id.tolist() == [0, 2]
+    assert labels == ["person 0.90", "car 0.50"]
+
+    _, class_id, labels = to_annotations(np.array([1, 2, 3, 4]))
+    assert class_id.tolist() == [0]
+    assert labels == [""]
+
+
+def test_overlay_drops_annotations_of_skipped_buffers():
+    overlay = Overlay({"overlay": "true"})
+    for pts in (0, 10, 20):
+        overlay.add(pts, np.zeros((0, 4)))
+    # The buffer with PTS 10 reaches the overlay first, so the one with PTS 0 was dropped upstream
+    overlay.on_draw(None, None, 10, 10)
+    assert list(overlay._pending) == [20]
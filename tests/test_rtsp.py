@@ -0,0 +1,93 @@
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pi_inference import VideoSource
+
+gi = pytest.importorskip("gi")
+try:
+    gi.require_version("GstRtspServer", "1.0")
+    from gi.repository import GLib, GstRtspServer
+except (ValueError, ImportError):
+    pytest.skip("GstRtspServer is not installed", allow_module_level=True)
+
+
+class RtspServer:
+    """
+    A local RTSP camera stand-in streaming a black videotestsrc that can be switched to white.
+    """
+
+    def __init__(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.source = None
+        self.context = GLib.MainContext.new()
+        self.loop = GLib.MainLoop.new(self.context, False)
+        self.server = GstRtspServer.RTSPServer()
+        self.server.set_address("127.0.0.1")
+        self.server.set_service(str(self.port))
+        factory = GstRtspServer.RTSPMediaFactory()
+        factory.set_shared(True)
+        factory.set_launch(
+            "( videotestsrc name=source is-live=true pattern=black "
+            "! video/x-raw,width=320,height=240,framerate=30/1 ! jpegenc ! rtpjpegpay name=pay0 pt=26 )"
+        )
+        factory.connect("media-configure", self.on_media_configure)
+        self.server.get_mount_points().add_factory("/test", factory)
+        self.server.attach(self.context)
+        threading.Thread(target=self.loop.run, daemon=True).start()
+
+    @property
+    def uri(self) -> str:
+        return f"rtsp://127.0.0.1:{self.port}/test"
+
+    def on_media_configure(self, factory, media):
+        self.source = media.get_element().get_by_name("source")
+
+    def set_pattern(self, pattern: str):
+        self.source.set_property("pattern", pattern)
+
+    def stop(self):
+        self.loop.quit()
+
+
+@pytest.fixture
+def rtsp_server():
+    server = RtspServer()
+    yield server
+    server.stop()
+
+
+def wait_for(video_source, predicate, timeout: float = 5):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        lease = video_source.capture_ex(timeout=100)
+        if lease is not None:
+            try:
+                if predicate(lease.array):
+                    return time.perf_counter()
+            finally:
+                lease.release()
+    return None
+
+
+def test_rtsp_end_to_end_latency(rtsp_server):
+    video_source = VideoSource(rtsp_server.uri, {"latency": 50, "protocols": "tcp"})
+    try:
+        assert video_source.prepare(timeout=10) is not None
+        assert wait_for(video_source, lambda frame: np.mean(frame) < 64) is not None
+
+        switched = time.perf_counter()
+        rtsp_server.set_pattern("white")
+        arrived = wait_for(video_source, lambda frame: np.mean(frame) > 192)
+
+        assert arrived is not None
+        latency = arrived - switched
+        print(f"End-to-end latency {latency * 1000:.0f} ms")
+        assert latency < 0.5
+    finally:
+        video_source.on_terminate()
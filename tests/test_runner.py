@@ -0,0 +1,105 @@
+import time
+
+import numpy as np
+
+from pi_inference.runner import InferencePipeline
+from pi_inference.source.frame import FrameLease
+
+
+class FakeSource:
+    def __init__(self):
+        self.count = 0
+
+    def capture(self, timeout: float = 100):
+        time.sleep(0.005)
+        self.count += 1
+        return np.full((2, 2, 3), self.count % 256, dtype=np.uint8)
+
+
+class FakeOutput:
+    def __init__(self):
+        self.rendered = []
+
+    def render(self, frame: np.ndarray):
+        time.sleep(0.01)
+        self.rendered.append(int(frame[0, 0, 0]))
+
+
+def test_inference_pipeline_keeps_order_and_overlaps_stages():
+    video_output = FakeOutput()
+    results = []
+
+    def infer(frame):
+        time.sleep(0.01)
+        return int(frame[0, 0, 0])
+
+    pipeline = InferencePipeline(
+        FakeSource(),
+        infer=infer,
+        video_output=video_output,
+        on_result=lambda frame, result: results.append(result),
+    )
+    pipeline.start()
+    time.sleep(0.5)
+    pipeline.stop()
+
+    assert video_output.rendered == sorted(video_output.rendered)
+    assert results == video_output.rendered
+    # Serial execution would need at least 25 ms per frame
+    assert len(results) > 0.5 / 0.025
+    assert pipeline.stats["render"].fps > 0
+
+
+def test_prepare_warms_up_with_source_shape():
+    class PreparedSource(FakeSource):
+        frame_shape = (4, 6, 3)
+
+        def prepare(self, timeout: float = 5):
+            return 0.25
+
+    shapes = []
+    pipeline = InferencePipeline(PreparedSource(), infer=lambda frame: shapes.append(frame.shape))
+    report = pipeline.prepare(warmup_runs=2)
+
+    assert shapes == [(4, 6, 3), (4, 6, 3)]
+    assert report["time_to_first_frame"] == 0.25
+    assert report["first_inference"] is not None
+
+
+def test_run_finishes_frames_at_end_of_stream():
+    class FiniteSource(FakeSource):
+        eos = False
+
+        def capture(self, timeout: float = 100):
+            if self.count == 20:
+                self.eos = True
+                return None
+            return super().capture(timeout)
+
+    video_output = FakeOutput()
+    pipeline = InferencePipeline(FiniteSource(), infer=lambda frame: None, video_output=video_output)
+    pipeline.run(log_interval=0.05)
+
+    assert video_output.rendered == list(range(1, 21))
+
+
+def test_stop_releases_every_lease():
+    leases = []
+
+    class LeasingSource:
+        def capture(self, timeout: float = 100):
+            time.sleep(0.001)
+            lease = FrameLease(np.zeros((2, 2, 3), dtype=np.uint8))
+            leases.append(lease)
+            return lease
+
+    class SlowOutput:
+        def render(self, frame: np.ndarray):
+            time.sleep(0.05)
+
+    # The render stage is the bottleneck, so every queue is full and the stages block in put when stopped
+    pipeline = InferencePipeline(LeasingSource(), infer=lambda frame: None, video_output=SlowOutput())
+    pipeline.start()
+    time.sleep(0.3)
+    pipeline.stop()
+    assert leases and all(lease.released for lease in leases)
@@ -0,0 +1,88 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+import supervision as sv
+
+from pi_inference.scheduler import MultiStreamScheduler
+from pi_inference.source.frame import FrameLease
+
+
+class FakeSource:
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.released = []
+
+    def lease(self, timestamp: float) -> FrameLease:
+        lease = FrameLease(np.zeros((2, 2, 3), dtype=np.uint8), timestamp=timestamp)
+        lease._on_release = lambda: self.released.append(lease)
+        return lease
+
+    def capture_ex(self, timeout: float = 100):
+        time.sleep(0.01)
+        if self.frames == 0:
+            return None
+        self.frames -= 1
+        return self.lease(time.time())
+
+
+def make_scheduler(sources, **kwargs) -> MultiStreamScheduler:
+    counter = itertools.count()
+    return MultiStreamScheduler(
+        sources,
+        net_factory=lambda: next(counter),
+        on_result=kwargs.pop("on_result", lambda name, lease, detections: None),
+        infer=kwargs.pop("infer", lambda frame, net: sv.Detections.empty()),
+        **kwargs,
+    )
+
+
+def test_dispatches_earliest_deadline_first_and_drops_late_frames():
+    sources = {name: FakeSource(0) for name in ("relaxed", "urgent", "late", "default")}
+    scheduler = make_scheduler(sources, num_nets=3, latency_budget={"relaxed": 1.0, "urgent": 0.2, "late": 0.5})
+    now = time.time()
+    for name, age in (("relaxed", 0), ("urgent", 0), ("late", 1), ("default", 0.1)):
+        scheduler._pending[name] = sources[name].lease(now - age)
+
+    with scheduler._cond:
+        batch = scheduler._next_batch()
+
+    # The late frame is dropped and released, the rest fill the idle nets by deadline
+    assert [name for name, _ in batch] == ["urgent", "default", "relaxed"]
+    assert scheduler.budget("default") == MultiStreamScheduler.DEFAULT_LATENCY_BUDGET
+    assert len(sources["late"].released) == 1
+    assert scheduler.dropped == {"relaxed": 0, "urgent": 0, "late": 1, "default": 0}
+    scheduler.stop()
+
+
+def test_returns_nets_and_reports_streams():
+    sources = {"door": FakeSource(20), "yard": FakeSource(20)}
+    results = []
+    lock = threading.Lock()
+
+    def on_result(name, lease, detections):
+        with lock:
+            results.append(name)
+
+    def infer(frame, net):
+        time.sleep(0.005)
+        return sv.Detections.empty()
+
+    scheduler = make_scheduler(sources, num_nets=2, on_result=on_result, infer=infer, latency_budget=1.0)
+    scheduler.start()
+    time.sleep(0.5)
+    scheduler.stop()
+
+    assert set(results) == {"door", "yard"}
+    assert scheduler._nets.qsize() == 2
+    assert scheduler._idle == 2
+    # Every frame was either inferred or dropped, and released either way
+    for name, source in sources.items():
+        assert len(source.released) == 20
+        assert results.count(name) + scheduler.dropped[name] == 20
+    report = scheduler.report()
+    assert set(report) == {"door", "yard"}
+    assert set(report["door"]) == {"fps", "latency", "dropped"}
+    assert report["door"]["fps"] > 0
+    assert report["door"]["dropped"] == scheduler.dropped["door"]
@@ -0,0 +1,110 @@
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from pi_inference.source import shared
+from pi_inference.source.shared import FrameRing, SharedVideoSource
+
+
+def write_frames(shape, slots, name, lock, count):
+    ring = FrameRing(shape, slots, lock, name)
+    for i in range(count):
+        ring.write(np.full(shape, i, dtype=np.uint8), pts=i)
+    ring.close()
+
+
+def crashing_worker(input, options, shape, slots, name, lock, stop):
+    # Writes 3 frames per run and crashes, until the 9th frame ends the stream
+    ring = FrameRing(shape, slots, lock, name)
+    try:
+        for _ in range(3):
+            ring.write(np.full(shape, ring.head + 1, dtype=np.uint8), pts=ring.head + 1)
+            time.sleep(0.05)
+        finished = ring.head >= 8
+    finally:
+        ring.close()
+    sys.exit(0 if finished else 1)
+
+
+def test_frame_ring_keeps_leased_frames():
+    ring = FrameRing((2, 3, 3), 3, multiprocessing.Lock())
+    try:
+        assert ring.read(-1, timeout=0.01) is None
+        ring.write(np.full((2, 3, 3), 1, dtype=np.uint8), pts=10)
+        first = ring.read(-1, timeout=0.1)
+        assert (first.sequence, first.pts, int(first.array[0, 0, 0])) == (0, 10, 1)
+
+        # The leased slot is never overwritten
+        for value in range(2, 6):
+            assert ring.write(np.full((2, 3, 3), value, dtype=np.uint8))
+        assert int(first.array[0, 0, 0]) == 1
+        second = ring.read(first.sequence, timeout=0.1)
+        assert (second.sequence, int(second.array[0, 0, 0])) == (4, 5)
+        # With two slots leased, the newest frame can't be overwritten either, so the next one is dropped
+        assert ring.write(np.zeros((2, 3, 3), dtype=np.uint8))
+        assert not ring.write(np.zeros((2, 3, 3), dtype=np.uint8))
+        assert ring.dropped == 1
+
+        first.release()
+        second.release()
+        assert ring.write(np.zeros((2, 3, 3), dtype=np.uint8))
+        assert ring.head == 6
+    finally:
+        ring.close()
+
+
+def test_frame_ring_lease_outlives_close():
+    ring = FrameRing((2, 3, 3), 3, multiprocessing.Lock())
+    ring.write(np.full((2, 3, 3), 7, dtype=np.uint8))
+    lease = ring.read(-1, timeout=0.1)
+    ring.close()
+    # The ring stays attached while the frame is leased
+    assert int(lease.array[0, 0, 0]) == 7
+    lease.release()
+    assert lease.released
+    assert ring._slots is None
+    # Releasing twice, or after the ring detached, does nothing
+    lease.release()
+    ring._unlease(0)
+
+
+def test_frame_ring_across_processes():
+    context = multiprocessing.get_context("spawn")
+    lock = context.Lock()
+    ring = FrameRing((4, 4, 3), 4, lock)
+    try:
+        writer = context.Process(target=write_frames, args=((4, 4, 3), 4, ring.name, lock, 5))
+        writer.start()
+        writer.join(10)
+        assert writer.exitcode == 0
+        lease = ring.read(-1, timeout=1)
+        assert (lease.sequence, lease.pts) == (4, 4)
+        assert np.all(lease.array == 4)
+        lease.release()
+    finally:
+        ring.close()
+
+
+def test_shared_video_source_restarts_crashed_worker(monkeypatch):
+    # SharedVideoSource sizes the ring with functions.frame_layout, which imports GStreamer
+    pytest.importorskip("gi")
+    monkeypatch.setattr(shared, "_capture_worker", crashing_worker)
+    source = SharedVideoSource("test://smpte", {"width": 4, "height": 2, "restart-delay": 0.1})
+    try:
+        assert source.prepare(timeout=10) is not None
+        lease = source.capture_ex(timeout=1000)
+        assert lease.pts == lease.sequence
+        lease.release()
+        # Captures like a VideoSource: copied frames, in order, until the end of the stream
+        frames = list(source)
+        assert all(isinstance(frame, np.ndarray) and frame.shape == (2, 4, 3) for frame in frames)
+        values = [int(frame[0, 0, 0]) for frame in frames]
+        assert values == sorted(values) and values[-1] == 8
+        assert source.restarts == 2
+        assert source.eos
+        assert source.capture(timeout=10) is None
+    finally:
+        source.on_terminate()
@@ -0,0 +1,210 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("gi")
+
+from pi_inference import functions as f
+from pi_inference.gst import Gst
+from pi_inference.sink import pipeline as pipeline_module
+from pi_inference.sink.factory import PipelineFactory
+from pi_inference.sink.pipeline import (
+    AppSrcPipeline,
+    FileSinkPipeline,
+    NullSinkPipeline,
+    RtspSinkPipeline,
+    TeeSinkPipeline,
+)
+
+OPTIONS = {"width": 8, "height": 4}
+
+
+class FakeBuffer:
+    def __init__(self, size: int):
+        self.data = bytearray(size)
+        self.mapped = False
+
+    def map(self, flags):
+        self.mapped = True
+        return True, SimpleNamespace(data=self.data)
+
+    def unmap(self, map_info):
+        self.mapped = False
+
+
+class FakeBufferPool:
+    """A GstBufferPool whose buffers map to bytearrays, writable from Python whatever the PyGObject version."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.acquired = []
+
+    def acquire_buffer(self, params):
+        buffer = FakeBuffer(self.size)
+        self.acquired.append(buffer)
+        return Gst.FlowReturn.OK, buffer
+
+
+class FakeAppSrc:
+    def __init__(self):
+        self.pushed = []
+
+    def get_current_running_time(self) -> int:
+        return 0
+
+    def emit(self, signal: str, buffer):
+        self.pushed.append(buffer)
+        return Gst.FlowReturn.OK
+
+
+def make_pipeline(**options) -> AppSrcPipeline:
+    pipeline = NullSinkPipeline()
+    pipeline.configure_caps({"width": 8, "height": 4, "buffer-pool": 0, **options})
+    pipeline.buffer_pool = FakeBufferPool(pipeline.frame_size)
+    pipeline.appsrc = FakeAppSrc()
+    return pipeline
+
+
+def test_acquire_frame_is_backed_by_pooled_buffer():
+    pipeline = make_pipeline()
+    frame = pipeline.acquire_frame()
+
+    [buffer] = pipeline.buffer_pool.acquired
+    assert frame.shape == (4, 8, 3) and buffer.mapped
+    frame[:] = 7
+    assert bytes(buffer.data) == bytes([7]) * pipeline.frame_size
+    assert list(pipeline._leased) == [frame.ctypes.data]
+
+
+def test_on_frame_pushes_leased_buffer_without_copying():
+    pipeline = make_pipeline()
+    frame = pipeline.acquire_frame()
+    pipeline.on_frame(frame)
+
+    [buffer] = pipeline.buffer_pool.acquired
+    assert pipeline.appsrc.pushed == [buffer]
+    assert not buffer.mapped
+    assert pipeline._leased == {}
+
+
+def test_release_frame_returns_buffer_without_pushing():
+    pipeline = make_pipeline()
+    frame = pipeline.acquire_frame()
+    pipeline.release_frame(frame)
+
+    [buffer] = pipeline.buffer_pool.acquired
+    assert pipeline.appsrc.pushed == []
+    assert not buffer.mapped
+    assert pipeline._leased == {}
+
+
+def test_unleased_frames_are_copied_into_pooled_buffers():
+    pipeline = make_pipeline()
+    pipeline.on_frame(np.full((4, 8, 3), 3, dtype=np.uint8))
+
+    [buffer] = pipeline.buffer_pool.acquired
+    assert pipeline.appsrc.pushed == [buffer]
+    assert bytes(buffer.data) == bytes([3]) * pipeline.frame_size
+
+
+def test_frame_counter_timestamps():
+    pipeline = make_pipeline(framerate=25, timestamp=AppSrcPipeline.FRAME_COUNTER)
+    for _ in range(3):
+        pipeline.on_frame(np.zeros((4, 8, 3), dtype=np.uint8))
+
+    assert pipeline.frame_duration == Gst.SECOND // 25
+    assert [buffer.pts for buffer in pipeline.appsrc.pushed] == [n * pipeline.frame_duration for n in range(3)]
+    assert all(buffer.duration == pipeline.frame_duration for buffer in pipeline.appsrc.pushed)
+
+
+def test_unknown_timestamp_mode():
+    with pytest.raises(ValueError, match="not supported"):
+        make_pipeline(timestamp="wall-clock")
+
+
+def test_acquire_frame_maps_gst_buffer():
+    pipeline = NullSinkPipeline()
+    pipeline.configure_caps({"width": 8, "height": 4, "buffer-pool": 2})
+    frame = pipeline.acquire_frame()
+    if pipeline.buffer_pool is None:
+        pytest.skip("Gst buffers are not writable from Python")
+
+    frame[:] = 9
+    buffer = pipeline.make_buffer(frame)
+    assert buffer.extract_dup(0, pipeline.frame_size) == bytes([9]) * pipeline.frame_size
+    assert pipeline._leased == {}
+
+
+class JpegSinkPipeline(NullSinkPipeline):
+    CODECS = ("JPEG",)
+    codecs = []
+
+    @classmethod
+    def make_branch(cls, resource_uri, options, codec):
+        cls.codecs.append(codec)
+        return super().make_branch(resource_uri, options, codec)
+
+
+@pytest.fixture
+def fake_encoder(monkeypatch):
+    """Replaces the encoder with identity, recording the codecs the branches asked for."""
+    requested = []
+
+    def make_encoder(options, framerate, codecs):
+        requested.append(codecs)
+        return [f.make_element("identity")], codecs[0]
+
+    monkeypatch.setattr(pipeline_module, "make_encoder", make_encoder)
+    return requested
+
+
+@pytest.fixture
+def rtsp_servers(monkeypatch):
+    launched = []
+    monkeypatch.setattr(f, "launch_rtsp_server", lambda **kwargs: launched.append(kwargs))
+    return launched
+
+
+def test_factory_makes_tee_for_several_outputs():
+    pipeline = PipelineFactory.make(["null://", "null://"], OPTIONS)
+    assert isinstance(pipeline, TeeSinkPipeline)
+    assert pipeline.branches == [("null://", NullSinkPipeline), ("null://", NullSinkPipeline)]
+    assert type(PipelineFactory.make(["null://"], OPTIONS)) is NullSinkPipeline
+
+
+def test_encoded_branches_share_common_codec(tmp_path, fake_encoder):
+    JpegSinkPipeline.codecs = []
+    pipeline = TeeSinkPipeline(
+        [(f"file://{tmp_path}/out.mkv", FileSinkPipeline), ("null://", JpegSinkPipeline), ("null://", NullSinkPipeline)]
+    )
+    pipeline.create(pipeline.branches, OPTIONS)
+
+    # One encoder for the codec every encoded branch takes, the raw branch gets none
+    assert fake_encoder == [("JPEG",)]
+    assert JpegSinkPipeline.codecs == ["JPEG"]
+
+
+def test_rtsp_branches_stream_to_distinct_udp_ports(fake_encoder, rtsp_servers):
+    outputs = ["rtsp://127.0.0.1:8554/front", "rtsp://127.0.0.1:8555/back"]
+    pipeline = PipelineFactory.make(outputs, OPTIONS)
+
+    deadline = time.monotonic() + 1
+    while len(rtsp_servers) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    servers = sorted(rtsp_servers, key=lambda kwargs: kwargs["rtsp_port"])
+    assert [kwargs["rtsp_port"] for kwargs in servers] == ["8554", "8555"]
+    udp_ports = [kwargs["udp_port"] for kwargs in servers]
+    assert len(set(udp_ports)) == 2
+    assert {pipeline.pipeline.get_by_name(f"udpsink_{index}").get_property("port") for index in range(2)} == set(
+        udp_ports
+    )
+
+
+def test_rtsp_outputs_need_distinct_ports():
+    outputs = ["rtsp://127.0.0.1:8554/front", "rtsp://127.0.0.1:8554/back"]
+    with pytest.raises(ValueError, match="distinct ports"):
+        TeeSinkPipeline([(uri, RtspSinkPipeline) for uri in outputs])
+    with pytest.raises(ValueError, match="distinct ports"):
+        PipelineFactory.make(outputs, OPTIONS)
@@ -0,0 +1,43 @@
+import numpy as np
+import supervision as sv
+
+from pi_inference.tiling import TiledDetector, nms, tile_grid
+
+
+def test_tile_grid_covers_frame_with_overlap():
+    tiles = tile_grid(1920, 1080, rows=2, cols=3, overlap=0.2)
+    assert len(tiles) == 6
+    assert tiles[0][:2] == (0, 0) and tiles[-1][2:] == (1920, 1080)
+    widths = {x1 - x0 for x0, _, x1, _ in tiles}
+    assert len(widths) == 1
+    # Neighbouring tiles overlap by about 20% of the tile width
+    assert abs((tiles[0][2] - tiles[1][0]) / widths.pop() - 0.2) < 0.01
+
+
+def test_nms_keeps_most_confident_per_class():
+    xyxy = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30], [0, 0, 10, 10]], dtype=float)
+    keep = nms(xyxy, np.array([0.9, 0.8, 0.7, 0.95]), np.array([0, 0, 0, 1]))
+    assert keep.tolist() == [3, 0, 2]
+    assert nms(xyxy, np.array([0.9, 0.8, 0.7, 0.95])).tolist() == [3, 2]
+
+
+def test_tiled_detector_maps_and_merges_boxes():
+    def infer(frame, net):
+        # Detects the bright square, wherever it is in the tile
+        ys, xs = np.nonzero(frame[..., 0])
+        return sv.Detections(
+            xyxy=np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]], dtype=float),
+            confidence=np.array([0.9]),
+            class_id=np.array([0]),
+            data={"class_name": np.array(["person"])},
+        )
+
+    frame = np.zeros((100, 300, 3), dtype=np.uint8)
+    frame[40:60, 120:140] = 255
+    detector = TiledDetector(lambda: None, rows=1, cols=2, overlap=0.5, num_nets=2, infer=infer)
+    detections = detector(frame)
+    detector.close()
+
+    # Both tiles and the full frame see the square, merged into one detection in frame coordinates
+    assert detections.xyxy.tolist() == [[120, 40, 140, 60]]
+    assert detections.data["class_name"].tolist() == ["person"]
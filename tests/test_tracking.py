@@ -0,0 +1,54 @@
+import numpy as np
+import supervision as sv
+
+from pi_inference.tracking import IouTracker, SparseDetector, match_boxes
+
+
+def moving_detections(frame: int) -> sv.Detections:
+    x = 10 + 4 * frame
+    return sv.Detections(
+        xyxy=np.array([[x, 10, x + 60, 70], [100, 100, 160, 160]], dtype=float),
+        confidence=np.array([0.9, 0.8]),
+        class_id=np.array([0, 1]),
+        data={"class_name": np.array(["person", "car"])},
+    )
+
+
+def test_match_boxes():
+    iou = np.array([[0.9, 0.5], [0.8, 0.1]])
+    rows, cols = match_boxes(iou, 0.3)
+    assert rows.tolist() == [0] and cols.tolist() == [0]
+    rows, cols = match_boxes(np.array([[0.9, 0.5], [0.8, 0.4]]), 0.3)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == [(0, 0), (1, 1)]
+
+
+def test_iou_tracker_keeps_ids_and_drops_lost_tracks():
+    tracker = IouTracker(max_misses=1)
+    assert tracker.update(moving_detections(0)).tracker_id.tolist() == [0, 1]
+    assert tracker.update(moving_detections(1)).tracker_id.tolist() == [0, 1]
+    tracker.update(sv.Detections.empty())
+    assert len(tracker) == 2
+    assert len(tracker.predict()) == 0
+    tracker.update(sv.Detections.empty())
+    assert len(tracker) == 0
+
+
+def test_sparse_detector_interpolates_between_detections():
+    detector = SparseDetector(None, interval=3, infer=lambda frame, net: moving_detections(frame))
+    outputs = [detector(frame) for frame in range(9)]
+    assert detector.detector_calls == 3
+    assert all(detections.tracker_id.tolist() == [0, 1] for detections in outputs)
+    # The velocity estimated between frames 0 and 3 carries the box along in frames 4 and 5
+    assert outputs[4].xyxy[0, 0] > outputs[3].xyxy[0, 0]
+    assert outputs[5].xyxy[1, 0] == 100
+
+
+def test_iou_tracker_velocity_spans_missed_frames():
+    tracker = IouTracker(max_misses=2, smoothing=1)
+    tracker.update(moving_detections(0))
+    # The person is missed for a detector call and a predicted frame, then found 3 frames after its anchor
+    tracker.update(sv.Detections.empty())
+    tracker.predict()
+    tracker.update(moving_detections(3))
+    assert tracker.velocity.tolist() == [[4, 0, 4, 0], [0, 0, 0, 0]]
+    assert tracker.predict().xyxy[0].tolist() == [26, 10, 86, 70]